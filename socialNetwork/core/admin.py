@@ -2,6 +2,9 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from import_export.admin import ImportExportModelAdmin
 from simple_history.admin import SimpleHistoryAdmin
+from .admin_mixins import (
+    BoundedInlineMixin, HistoryDeltaAdminMixin, PerformanceAdminMixin, count_subquery, related_summary,
+)
 from .models import (
     City, Role, User, Community, Post, Comment, Chat, Message,
     Media, Like, Friendship, UserCommunity, ChatParticipant
@@ -41,13 +44,14 @@ class FriendshipInitiatedInline(admin.TabularInline):
 
 
 @admin.register(User)
-class UserAdmin(ImportExportModelAdmin, SimpleHistoryAdmin, BaseUserAdmin):
+class UserAdmin(PerformanceAdminMixin, ImportExportModelAdmin, HistoryDeltaAdminMixin, SimpleHistoryAdmin, BaseUserAdmin):
     resource_class = UserResource
     list_display = ('id', 'email', 'get_full_name_display', 'username', 'city', 'is_online_display', 'is_verified', 'role', 'is_staff', 'created_at')
     list_display_links = ('id', 'email')
     list_filter = ('is_staff', 'is_active', 'is_verified', 'is_online', 'gender', 'role', 'city')
     search_fields = ('email', 'first_name', 'last_name', 'username', 'phone')
     raw_id_fields = ('city', 'role', 'created_by', 'updated_by')
+    list_select_related = ('city', 'role')
     readonly_fields = ('last_login', 'created_at', 'updated_at', 'last_seen')
     date_hierarchy = 'created_at'
     inlines = [UserCommunityInline, FriendshipInitiatedInline]
@@ -85,18 +89,20 @@ class UserAdmin(ImportExportModelAdmin, SimpleHistoryAdmin, BaseUserAdmin):
 
     @admin.display(description='Онлайн', boolean=True)
     def is_online_display(self, obj):
-        return obj.is_online
+        return obj.is_online_now
 
 
-class UserCommunityMemberInline(admin.TabularInline):
+class UserCommunityMemberInline(BoundedInlineMixin, admin.TabularInline):
     model = UserCommunity
     extra = 0
     fk_name = 'community'
     raw_id_fields = ('user', 'created_by')
     readonly_fields = ('joined_at',)
+    # usercommunity_joined_idx
+    ordering = ('-joined_at',)
 
 
-class PostInline(admin.TabularInline):
+class PostInline(BoundedInlineMixin, admin.TabularInline):
     model = Post
     extra = 0
     fk_name = 'community'
@@ -106,23 +112,32 @@ class PostInline(admin.TabularInline):
 
 
 @admin.register(Community)
-class CommunityAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
+class CommunityAdmin(PerformanceAdminMixin, ImportExportModelAdmin, HistoryDeltaAdminMixin, SimpleHistoryAdmin):
     resource_class = CommunityResource
     list_display = ('id', 'name', 'type', 'owner', 'members_count_display', 'is_verified', 'created_at')
     list_display_links = ('id', 'name')
     list_filter = ('type', 'is_verified', 'created_at')
     search_fields = ('name', 'description', 'owner__email', 'owner__first_name', 'owner__last_name')
     raw_id_fields = ('owner', 'created_by', 'updated_by')
-    readonly_fields = ('created_at', 'updated_at', 'members_count')
+    list_select_related = ('owner',)
+    readonly_fields = ('created_at', 'updated_at', 'members_count', 'members_summary', 'posts_summary')
     date_hierarchy = 'created_at'
     inlines = [UserCommunityMemberInline, PostInline]
 
-    @admin.display(description='Участников')
+    @admin.display(description='Участники')
+    def members_summary(self, obj):
+        return related_summary(obj, UserCommunity, 'community', obj.members_count)
+
+    @admin.display(description='Посты')
+    def posts_summary(self, obj):
+        return related_summary(obj, Post, 'community')
+
+    @admin.display(description='Участников', ordering='members_count')
     def members_count_display(self, obj):
         return obj.members_count
 
 
-class CommentInline(admin.TabularInline):
+class CommentInline(BoundedInlineMixin, admin.TabularInline):
     model = Comment
     extra = 0
     fk_name = 'post'
@@ -131,7 +146,7 @@ class CommentInline(admin.TabularInline):
     fields = ('author', 'content', 'parent')
 
 
-class MediaInline(admin.TabularInline):
+class MediaInline(BoundedInlineMixin, admin.TabularInline):
     model = Media
     extra = 0
     fk_name = 'post'
@@ -140,100 +155,128 @@ class MediaInline(admin.TabularInline):
     fields = ('owner', 'type', 'file', 'thumbnail', 'original_name')
 
 
-class LikeInline(admin.TabularInline):
+class LikeInline(BoundedInlineMixin, admin.TabularInline):
     model = Like
     extra = 0
     fk_name = 'post'
     raw_id_fields = ('user',)
     readonly_fields = ('created_at',)
+    # Без поля comment: его выпадающий список содержал бы все комментарии
+    fields = ('user', 'created_at')
 
 
 @admin.register(Post)
-class PostAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
+class PostAdmin(PerformanceAdminMixin, ImportExportModelAdmin, HistoryDeltaAdminMixin, SimpleHistoryAdmin):
     resource_class = PostResource
     list_display = ('id', 'author', 'community', 'content_preview', 'views_count', 'likes_count_display', 'is_published', 'created_at')
     list_display_links = ('id', 'content_preview')
     list_filter = ('is_published', 'created_at', 'updated_at')
     search_fields = ('content', 'author__email', 'author__first_name', 'author__last_name', 'community__name')
     raw_id_fields = ('author', 'community', 'created_by', 'updated_by')
-    readonly_fields = ('created_at', 'updated_at', 'views_count')
-    date_hierarchy = 'created_at'
+    list_select_related = ('author', 'community')
+    readonly_fields = ('created_at', 'updated_at', 'views_count', 'comments_summary', 'media_summary', 'likes_summary')
     inlines = [CommentInline, MediaInline, LikeInline]
 
+    @admin.display(description='Комментарии')
+    def comments_summary(self, obj):
+        return related_summary(obj, Comment, 'post')
+
+    @admin.display(description='Медиа')
+    def media_summary(self, obj):
+        return related_summary(obj, Media, 'post')
+
+    @admin.display(description='Лайки')
+    def likes_summary(self, obj):
+        return related_summary(obj, Like, 'post', obj.likes_count)
+
     @admin.display(description='Содержание')
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
 
-    @admin.display(description='Лайков')
+    @admin.display(description='Лайков', ordering='likes_count')
     def likes_count_display(self, obj):
-        return obj.likes.count()
+        return obj.likes_count
 
 
 @admin.register(Comment)
-class CommentAdmin(ImportExportModelAdmin):
+class CommentAdmin(PerformanceAdminMixin, ImportExportModelAdmin):
     resource_class = CommentResource
     list_display = ('id', 'author', 'post', 'content_preview', 'parent', 'likes_count_display', 'created_at')
     list_display_links = ('id', 'content_preview')
     list_filter = ('created_at', 'updated_at')
     search_fields = ('content', 'author__email', 'author__first_name', 'author__last_name')
     raw_id_fields = ('post', 'author', 'parent', 'created_by', 'updated_by')
+    list_select_related = ('author', 'post__author', 'parent__author')
     readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'created_at'
 
     @admin.display(description='Содержание')
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
 
-    @admin.display(description='Лайков')
+    @admin.display(description='Лайков', ordering='likes_count')
     def likes_count_display(self, obj):
-        return obj.likes.count()
+        return obj.likes_count
 
 
-class ChatParticipantInline(admin.TabularInline):
+class ChatParticipantInline(BoundedInlineMixin, admin.TabularInline):
     model = ChatParticipant
     extra = 0
     raw_id_fields = ('user',)
     readonly_fields = ('joined_at',)
 
 
-class MessageInline(admin.TabularInline):
+class MessageInline(BoundedInlineMixin, admin.TabularInline):
     model = Message
     extra = 0
     fk_name = 'chat'
     raw_id_fields = ('sender', 'reply_to', 'created_by')
     readonly_fields = ('created_at', 'updated_at')
     fields = ('sender', 'content', 'status', 'reply_to')
+    # message_chat_created_idx
+    ordering = ('-created_at',)
 
 
 @admin.register(Chat)
-class ChatAdmin(admin.ModelAdmin):
+class ChatAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'name_or_id', 'type', 'participants_count_display', 'created_at', 'updated_at')
     list_display_links = ('id', 'name_or_id')
     list_filter = ('type', 'created_at', 'updated_at')
     search_fields = ('name',)
     raw_id_fields = ('created_by',)
-    readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at', 'updated_at', 'participants_summary', 'messages_summary')
     inlines = [ChatParticipantInline, MessageInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            participants_total=count_subquery(ChatParticipant, 'chat')
+        )
+
     @admin.display(description='Название')
     def name_or_id(self, obj):
         return obj.name if obj.name else f"Чат #{obj.id}"
 
-    @admin.display(description='Участников')
+    @admin.display(description='Участников', ordering='participants_total')
     def participants_count_display(self, obj):
-        return obj.participants.count()
+        return obj.participants_total
+
+    @admin.display(description='Участники')
+    def participants_summary(self, obj):
+        return related_summary(obj, ChatParticipant, 'chat', getattr(obj, 'participants_total', None))
+
+    @admin.display(description='Сообщения')
+    def messages_summary(self, obj):
+        return related_summary(obj, Message, 'chat')
 
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'sender', 'chat', 'content_preview', 'status', 'reply_to', 'created_at')
     list_display_links = ('id', 'content_preview')
     list_filter = ('status', 'created_at', 'updated_at')
     search_fields = ('content', 'sender__email', 'sender__first_name', 'sender__last_name')
     raw_id_fields = ('chat', 'sender', 'reply_to', 'created_by')
+    list_select_related = ('sender', 'chat', 'reply_to__sender', 'reply_to__chat')
     readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'created_at'
 
     @admin.display(description='Содержание')
     def content_preview(self, obj):
@@ -241,14 +284,14 @@ class MessageAdmin(admin.ModelAdmin):
 
 
 @admin.register(Media)
-class MediaAdmin(admin.ModelAdmin):
+class MediaAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'owner', 'type', 'original_name', 'size_display', 'post', 'message', 'created_at')
     list_display_links = ('id', 'original_name')
     list_filter = ('type', 'created_at')
     search_fields = ('original_name', 'file', 'owner__email', 'owner__first_name', 'owner__last_name')
     raw_id_fields = ('owner', 'post', 'message', 'created_by')
+    list_select_related = ('owner', 'post__author', 'message__sender', 'message__chat')
     readonly_fields = ('created_at',)
-    date_hierarchy = 'created_at'
 
     @admin.display(description='Размер')
     def size_display(self, obj):
@@ -262,33 +305,33 @@ class MediaAdmin(admin.ModelAdmin):
 
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'post', 'comment', 'target_display', 'created_at')
     list_display_links = ('id', 'target_display')
     list_filter = ('created_at',)
     search_fields = ('user__email', 'user__first_name', 'user__last_name')
     raw_id_fields = ('user', 'post', 'comment')
+    list_select_related = ('user', 'post__author', 'comment__author')
     readonly_fields = ('created_at',)
-    date_hierarchy = 'created_at'
 
     @admin.display(description='Цель лайка')
     def target_display(self, obj):
-        if obj.post:
-            return f"Пост #{obj.post.id}"
-        elif obj.comment:
-            return f"Комментарий #{obj.comment.id}"
+        if obj.post_id:
+            return f"Пост #{obj.post_id}"
+        elif obj.comment_id:
+            return f"Комментарий #{obj.comment_id}"
         return '-'
 
 
 @admin.register(Friendship)
-class FriendshipAdmin(admin.ModelAdmin):
+class FriendshipAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'friend', 'status', 'status_colored', 'created_at', 'updated_at')
     list_display_links = ('id', 'user')
     list_filter = ('status', 'created_at', 'updated_at')
     search_fields = ('user__email', 'user__first_name', 'user__last_name', 'friend__email', 'friend__first_name', 'friend__last_name')
     raw_id_fields = ('user', 'friend', 'created_by')
+    list_select_related = ('user', 'friend')
     readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'created_at'
 
     @admin.display(description='Статус')
     def status_colored(self, obj):
@@ -304,22 +347,22 @@ class FriendshipAdmin(admin.ModelAdmin):
 
 
 @admin.register(UserCommunity)
-class UserCommunityAdmin(admin.ModelAdmin):
+class UserCommunityAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'community', 'role', 'joined_at')
     list_display_links = ('id', 'user')
     list_filter = ('role', 'joined_at')
     search_fields = ('user__email', 'user__first_name', 'user__last_name', 'community__name')
     raw_id_fields = ('user', 'community', 'created_by')
+    list_select_related = ('user', 'community')
     readonly_fields = ('joined_at',)
-    date_hierarchy = 'joined_at'
 
 
 @admin.register(ChatParticipant)
-class ChatParticipantAdmin(admin.ModelAdmin):
+class ChatParticipantAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'chat', 'user', 'role', 'joined_at', 'last_read_at')
     list_display_links = ('id', 'user')
     list_filter = ('role', 'joined_at')
     search_fields = ('user__email', 'user__first_name', 'user__last_name', 'chat__name')
     raw_id_fields = ('chat', 'user')
+    list_select_related = ('chat', 'user')
     readonly_fields = ('joined_at',)
-    date_hierarchy = 'joined_at'
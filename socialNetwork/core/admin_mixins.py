@@ -0,0 +1,343 @@
+"""
+Админка для больших таблиц.
+
+PerformanceAdminMixin:
+
+* считает число строк без фильтров по статистике СУБД (EstimatedCountPaginator)
+  вместо COUNT(*) по всей таблице;
+* не выполняет второй COUNT(*) для «всего N» при фильтрации
+  (show_full_result_count = False);
+* ищет по триграммным индексам (IndexedSearchMixin, core/search.py).
+
+Счётчики в колонках берутся из денормализованных полей или аннотируются
+подзапросом в get_queryset (count_subquery): Django убирает неиспользуемые
+аннотации из COUNT пагинатора, а для страницы подзапрос выполняется только
+для показанных строк. date_hierarchy на таких таблицах не используется —
+построение уровней (годы, месяцы) требует прохода по всей таблице; фильтр
+по дате в list_filter дешевле.
+
+BoundedInlineMixin ограничивает инлайн последними max_rows записями, а
+related_summary выводит на странице объекта общее число связанных записей
+со ссылкой на их полный список, где есть пагинация и поиск. Так страница
+поста с миллионом комментариев загружается за время одного окна.
+
+HistoryDeltaAdminMixin показывает историю изменений объекта страницами по
+history_page_size записей (курсор — history_id последней показанной) и
+выводит изменения из сохранённого history_delta (core/history.py), не
+сравнивая соседние снимки. Значения показываются через
+HistoryDeltaContextHelper: подписи choices и str() связанных объектов
+вместо ключей и id; поля, которых уже нет в модели, пропускаются.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models
+from django.contrib.admin.utils import display_for_field, lookup_spawns_duplicates
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Coalesce
+from django.http import QueryDict
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.formats import number_format
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.text import smart_split, unescape_string_literal
+from simple_history.models import ModelChange
+from simple_history.template_utils import HistoricalRecordContextHelper
+
+from . import search
+
+
+def get_estimate_threshold():
+    return getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100_000)
+
+
+def count_subquery(model, field):
+    """Число строк model, у которых field ссылается на текущую строку."""
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(total=Count('*')).values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def estimate_row_count(model, using):
+    """Примерное число строк таблицы по статистике СУБД или None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # reltuples обновляют VACUUM и ANALYZE; -1 — ещё ни разу
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                # sqlite_stat1 заполняет ANALYZE: первое число — строк в таблице
+                try:
+                    cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                    row = cursor.fetchone()
+                except DatabaseError:
+                    row = None
+                if row:
+                    return int(row[0].split()[0])
+                # Без статистики — наибольший rowid: один проход по B-дереву
+                cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+                row = cursor.fetchone()
+                return row[0] if row else None
+    except DatabaseError:
+        return None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Для списка без фильтров и поиска берёт оценку числа строк; если
+    таблица меньше ADMIN_ESTIMATED_COUNT_THRESHOLD строк или оценки нет,
+    считает точно.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimate_row_count(query.model, self.object_list.db)
+            if estimate is not None and estimate >= get_estimate_threshold():
+                return estimate
+        return super().count
+
+
+class IndexedSearchMixin:
+    """
+    Поиск по search_fields через search.matching_ids: поля основной модели и
+    поля модели по прямому внешнему ключу (author__email) группируются, и
+    каждая группа становится одним условием pk__in / author__in. Поля с
+    префиксами (^, =, @) и более длинные пути ищутся как в Django. Каждое
+    слово запроса должно найтись хотя бы в одном поле.
+    """
+
+    def _search_groups(self, search_fields):
+        groups, fallback = {}, []
+        opts = self.model._meta
+        for name in search_fields:
+            parts = name.split(LOOKUP_SEP)
+            if name[0] in '^=@' or len(parts) > 2:
+                fallback.append(name)
+                continue
+            if len(parts) == 1:
+                groups.setdefault('', (self.model, []))[1].append(name)
+                continue
+            relation = opts.get_field(parts[0])
+            if not (relation.many_to_one or relation.one_to_one) or not relation.concrete:
+                fallback.append(name)
+                continue
+            groups.setdefault(parts[0], (relation.related_model, []))[1].append(parts[1])
+        return groups, fallback
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        if not search_fields or not search_term:
+            return super().get_search_results(request, queryset, search_term)
+
+        groups, fallback = self._search_groups(search_fields)
+        using = queryset.db
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            condition = Q()
+            for path, (model, fields) in groups.items():
+                ids = search.matching_ids(model, fields, bit, using)
+                condition |= Q(pk__in=ids) if not path else Q(**{f'{path}__in': ids})
+            for name in fallback:
+                condition |= Q(**{self._fallback_lookup(name): bit})
+            queryset = queryset.filter(condition)
+
+        may_have_duplicates = any(lookup_spawns_duplicates(self.opts, name) for name in fallback)
+        return queryset, may_have_duplicates
+
+    def _fallback_lookup(self, field_name):
+        if field_name.startswith('^'):
+            return f'{field_name[1:]}__istartswith'
+        if field_name.startswith('='):
+            return f'{field_name[1:]}__iexact'
+        if field_name.startswith('@'):
+            return f'{field_name[1:]}__search'
+        return f'{field_name}__icontains'
+
+
+class PerformanceAdminMixin(IndexedSearchMixin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class HistoryDeltaAdminMixin:
+    """Для SimpleHistoryAdmin; ставится перед ним в списке базовых классов."""
+    object_history_template = 'core/admin/object_history.html'
+    history_page_size = 50
+    history_cursor_param = 'before'
+
+    def get_history_queryset(self, request, history_manager, pk_name, object_id):
+        queryset = super().get_history_queryset(request, history_manager, pk_name, object_id)
+        queryset = queryset.order_by('-history_id')
+        try:
+            before = int(request.GET.get(self.history_cursor_param, ''))
+        except ValueError:
+            before = None
+        if before is not None:
+            queryset = queryset.filter(history_id__lt=before)
+        # Без среза: history_view вызывает у выборки latest(), если объект удалён.
+        # Лишняя запись показывает, есть ли следующая страница
+        page = list(queryset.values_list('history_id', flat=True)[:self.history_page_size + 1])
+        return queryset.filter(history_id__in=page)
+
+    def get_historical_record_context_helper(self, request, historical_record):
+        return HistoryDeltaContextHelper(
+            self.model, historical_record, empty_value_display=self.get_empty_value_display()
+        )
+
+    def _delta_field(self, name):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Поле удалено из модели после записи истории
+            return None
+
+    def _delta_related_objects(self, historical_records):
+        """{(модель, pk): объект} для внешних ключей из history_delta страницы."""
+        wanted = {}
+        for record in historical_records:
+            for name, values in (record.history_delta or {}).items():
+                field = self._delta_field(name)
+                if field is None or not field.many_to_one:
+                    continue
+                for value in values:
+                    if value is not None:
+                        wanted.setdefault(field.related_model, set()).add(value)
+        related = {}
+        for model, values in wanted.items():
+            ids = []
+            for value in values:
+                try:
+                    ids.append(model._meta.pk.to_python(value))
+                except ValidationError:
+                    continue
+            for pk, obj in model._base_manager.in_bulk(ids).items():
+                related[model, pk] = obj
+        return related
+
+    def set_history_delta_changes(self, request, historical_records, foreign_keys_are_objs=True):
+        related = self._delta_related_objects(historical_records)
+        for record in historical_records:
+            helper = self.get_historical_record_context_helper(request, record)
+            helper.related_objects = related
+            changes = [
+                helper.format_delta_change(ModelChange(name, old, new))
+                for name, (old, new) in (record.history_delta or {}).items()
+                if self._delta_field(name) is not None
+            ]
+            record.history_delta_changes = [
+                {'field': change.field, 'old': change.old, 'new': change.new} for change in changes
+            ]
+
+    @staticmethod
+    def _attach_history_object(record):
+        # history_object каждый раз собирается заново и без связанных
+        # объектов; __str__ объекта (автор поста) дал бы запрос на строку.
+        # Связи уже выбраны в get_history_queryset через select_related
+        obj = record.history_object
+        for field in record.tracked_fields:
+            history_field = record._meta.get_field(field.name)
+            if field.is_relation and history_field.is_cached(record):
+                field.set_cached_value(obj, history_field.get_cached_value(record))
+        record.history_object = obj
+
+    def render_history_view(self, request, template, context, **kwargs):
+        records = list(context['historical_records'])
+        context['historical_records'] = records[:self.history_page_size]
+        for record in context['historical_records']:
+            self._attach_history_object(record)
+        if len(records) > self.history_page_size:
+            query = QueryDict(mutable=True)
+            query[self.history_cursor_param] = records[self.history_page_size - 1].history_id
+            context['history_next_url'] = f'?{query.urlencode()}'
+        context['history_is_first_page'] = self.history_cursor_param not in request.GET
+        return super().render_history_view(request, template, context, **kwargs)
+
+
+class HistoryDeltaContextHelper(HistoricalRecordContextHelper):
+    """
+    Значения в history_delta хранятся строками value_to_string; для показа
+    они разбираются обратно полем модели: подписи choices, str() связанных
+    объектов (related_objects, выбираются одним запросом на страницу) и
+    даты в локальном формате, как в списке объектов админки.
+    """
+
+    def __init__(self, model, historical_record, *, empty_value_display='-', **kwargs):
+        super().__init__(model, historical_record, **kwargs)
+        self.empty_value_display = empty_value_display
+        self.related_objects = {}
+
+    def prepare_delta_change_value(self, change, value):
+        field = self.model._meta.get_field(change.field)
+        if value is None:
+            return self.empty_value_display
+        try:
+            if field.many_to_one:
+                model = field.related_model
+                return self.related_objects.get((model, model._meta.pk.to_python(value)), value)
+            if isinstance(field, models.FileField):
+                return value
+            return display_for_field(field.to_python(value), field, self.empty_value_display)
+        except ValidationError:
+            # Значение обрезано до HISTORY_DELTA_MAX_CHARS или формат поля сменился
+            return value
+
+
+class BoundedInlineFormSet(BaseInlineFormSet):
+    max_rows = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset()
+            if self.max_rows is not None:
+                self._queryset = queryset[:self.max_rows]
+        return self._queryset
+
+
+class BoundedInlineMixin:
+    """
+    Инлайн с последними max_rows записями в порядке ordering. Порядок
+    должен читаться по индексу с внешним ключом, иначе СУБД отсортирует
+    все связанные записи.
+    """
+    formset = BoundedInlineFormSet
+    max_rows = 20
+    ordering = ('-pk',)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.max_rows = self.max_rows
+        return formset
+
+
+def related_summary(obj, model, fk_name, total=None, shown=BoundedInlineMixin.max_rows):
+    """
+    «N записей, показаны последние M» со ссылкой на список, отфильтрованный
+    по obj. total — денормализованный счётчик, если есть; иначе COUNT(*).
+    """
+    if obj is None or obj.pk is None:
+        return '-'
+    if total is None:
+        total = model._default_manager.filter(**{fk_name: obj}).count()
+    opts = model._meta
+    url = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+    return format_html(
+        '{}: {}{} <a href="{}?{}__id__exact={}">Открыть список</a>',
+        opts.verbose_name_plural,
+        number_format(total, force_grouping=True),
+        f', показаны последние {shown}' if total > shown else '',
+        url,
+        fk_name,
+        obj.pk,
+    )
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import PostViewSet, CommunityViewSet
+from .api_views import PostViewSet, CommentViewSet, CommunityViewSet, UploadViewSet
 
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='post')
+router.register(r'comments', CommentViewSet, basename='comment')
 router.register(r'communities', CommunityViewSet, basename='community')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,16 +1,54 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Count, Q
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Post, Community, User, Comment, Like, UserCommunity
-from .serializers import PostSerializer, CommunitySerializer, CommentSerializer
+from .models import Post, Community, User, Comment, UserCommunity, Media, UploadSession
+from .serializers import PostSerializer, CommunitySerializer, CommentSerializer, CommentThreadSerializer, MediaSerializer, UploadSessionSerializer
 from .filters import PostFilter, CommunityFilter, CommentFilter
+from .memberships import MEMBERS_ORDERING
+from .pagination import KeysetPagination
+from . import comments, feed, likes, memberships, uploads
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class LikeActionMixin:
+    """
+    /like/: PUT ставит лайк, DELETE снимает его; оба запроса идемпотентны.
+    POST переключает лайк и оставлен для совместимости.
+    """
+
+    @action(methods=['POST', 'PUT', 'DELETE'], detail=True, permission_classes=[IsAuthenticated])
+    def like(self, request, pk=None):
+        target = self.get_object()
+        user = request.user
+
+        if request.method == 'PUT':
+            created, count = likes.like(user, target)
+            liked = True
+        elif request.method == 'DELETE':
+            _, count = likes.unlike(user, target)
+            liked = created = False
+        else:
+            liked, count = likes.toggle(user, target)
+            created = liked
+
+        return Response(
+            {
+                'message': 'Лайк добавлен' if liked else 'Лайк удален',
+                'liked': liked,
+                'likes_count': count,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+
+class PostViewSet(LikeActionMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -30,7 +68,10 @@ class PostViewSet(viewsets.ModelViewSet):
         if community_id:
             queryset = queryset.filter(community_id=community_id)
 
-        return queryset.select_related('author', 'community').prefetch_related('likes', 'comments')
+        if self.action == 'like':
+            # Для лайка нужен только id поста
+            return queryset.only('id')
+        return feed.with_counts(queryset.select_related('author', 'community').prefetch_related('media_files'))
 
     def perform_create(self, serializer):
         serializer.save(
@@ -66,33 +107,48 @@ class PostViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(posts, many=True)
         return Response(serializer.data)
 
-    @action(methods=['POST'], detail=True)
-    def like(self, request, pk=None):
+    @action(methods=['GET'], detail=True)
+    def thread(self, request, pk=None):
+        """
+        Ветка комментариев с вложенными ответами:
+        ?root=<id комментария>&after=<курсор>&limit=100&depth=5
+        """
         post = self.get_object()
-        user = request.user
 
-        if not user.is_authenticated:
+        root = None
+        root_id = request.query_params.get('root')
+        if root_id:
+            root = Comment.objects.filter(pk=root_id, post=post).first() if root_id.isdigit() else None
+            if root is None:
+                return Response(
+                    {'error': 'Комментарий не найден'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+        try:
+            limit = min(int(request.query_params.get('limit', comments.get_page_size())), 500)
+            depth = min(int(request.query_params.get('depth', comments.get_display_depth())), comments.MAX_DEPTH)
+        except ValueError:
             return Response(
-                {'error': 'Необходимо авторизоваться'},
-                status=status.HTTP_401_UNAUTHORIZED
+                {'error': 'limit и depth должны быть числами'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        like_obj, created = Like.objects.get_or_create(
-            user=user,
-            post=post
+        window = comments.load_thread(
+            post, root=root, after=request.query_params.get('after'),
+            limit=max(limit, 1), max_depth=max(depth, 0)
         )
+        data = CommentThreadSerializer(window.nodes, many=True, context=self.get_serializer_context()).data
 
-        if created:
-            return Response(
-                {'message': 'Лайк добавлен', 'likes_count': post.likes.count()},
-                status=status.HTTP_201_CREATED
-            )
-        else:
-            like_obj.delete()
-            return Response(
-                {'message': 'Лайк удален', 'likes_count': post.likes.count()},
-                status=status.HTTP_200_OK
-            )
+        # Дерево собирается за один проход: родитель в окне всегда раньше потомков
+        items, roots = {}, []
+        for comment, item in zip(window.nodes, data):
+            item['replies'] = []
+            items[comment.pk] = item
+            parent = items.get(comment.parent_id)
+            (parent['replies'] if parent else roots).append(item)
+
+        return Response({'next_cursor': window.next_cursor, 'results': roots})
 
     @action(methods=['POST'], detail=True)
     def increment_views(self, request, pk=None):
@@ -159,6 +215,19 @@ class PostViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class CommentViewSet(LikeActionMixin, viewsets.ReadOnlyModelViewSet):
+    """Комментарии только для чтения; изменять можно лишь лайки (/like/)."""
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = CommentFilter
+    ordering_fields = ['created_at', 'likes_count']
+    ordering = ['-created_at']
+
+    def get_queryset(self):
+        return Comment.objects.filter(post__is_published=True).select_related('author')
+
+
 class CommunityViewSet(viewsets.ModelViewSet):
     queryset = Community.objects.all()
     serializer_class = CommunitySerializer
@@ -192,9 +261,7 @@ class CommunityViewSet(viewsets.ModelViewSet):
 
     @action(methods=['GET'], detail=False)
     def popular(self, request):
-        communities = Community.objects.annotate(
-            total_members=Count('members')
-        ).order_by('-total_members')[:10]
+        communities = Community.objects.select_related('owner').order_by('-members_count')[:10]
 
         serializer = self.get_serializer(communities, many=True)
         return Response(serializer.data)
@@ -233,18 +300,11 @@ class CommunityViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        membership, created = UserCommunity.objects.get_or_create(
-            user=user,
-            community=community,
-            defaults={'created_by': user}
-        )
+        created, members_count = memberships.join(user, community)
 
         if created:
-            community.members_count += 1
-            community.save(update_fields=['members_count'])
-
             return Response(
-                {'message': 'Вы вступили в сообщество', 'members_count': community.members_count},
+                {'message': 'Вы вступили в сообщество', 'members_count': members_count},
                 status=status.HTTP_201_CREATED
             )
         else:
@@ -270,18 +330,14 @@ class CommunityViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        try:
-            membership = UserCommunity.objects.get(user=user, community=community)
-            membership.delete()
-
-            community.members_count = max(0, community.members_count - 1)
-            community.save(update_fields=['members_count'])
+        left, members_count = memberships.leave(user, community)
 
+        if left:
             return Response(
-                {'message': 'Вы покинули сообщество', 'members_count': community.members_count},
+                {'message': 'Вы покинули сообщество', 'members_count': members_count},
                 status=status.HTTP_200_OK
             )
-        except UserCommunity.DoesNotExist:
+        else:
             return Response(
                 {'error': 'Вы не являетесь участником этого сообщества'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -289,17 +345,91 @@ class CommunityViewSet(viewsets.ModelViewSet):
 
     @action(methods=['GET'], detail=True)
     def members(self, request, pk=None):
+        """
+        Участники по (приоритет роли, дата вступления), страницы по курсору:
+        ?role=admin,moderator&page_size=50&cursor=...
+        """
         community = self.get_object()
         memberships = UserCommunity.objects.filter(community=community).select_related('user')
 
+        roles = [role for role in request.query_params.get('role', '').split(',') if role]
+        if roles:
+            if not set(roles) <= set(UserCommunity.ROLE_PRIORITIES):
+                return Response(
+                    {'error': 'Недопустимая роль'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # Фильтр по role_priority идёт по тому же индексу, что и сортировка
+            memberships = memberships.filter(
+                role_priority__in=[UserCommunity.ROLE_PRIORITIES[role] for role in roles]
+            )
+
+        paginator = KeysetPagination(ordering=MEMBERS_ORDERING)
+        page = paginator.paginate_queryset(memberships, request)
+
         members_data = [{
             'user_id': m.user.id,
             'full_name': m.user.get_full_name(),
             'role': m.role,
             'joined_at': m.joined_at
-        } for m in memberships]
+        } for m in page]
+
+        return paginator.get_paginated_response(members_data)
+
+    def _bulk_member_ids(self, request, community):
+        if not memberships.can_manage_members(request.user, community):
+            return None, Response(
+                {'error': 'Управлять участниками могут только администраторы сообщества'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list) or not all(isinstance(user_id, int) for user_id in user_ids):
+            return None, Response(
+                {'error': 'Поле user_ids должно быть списком ID пользователей'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(user_ids) > settings.COMMUNITY_BULK_MEMBERS_LIMIT:
+            return None, Response(
+                {'error': f'За один запрос можно изменить не более {settings.COMMUNITY_BULK_MEMBERS_LIMIT} участников'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return user_ids, None
+
+    @action(methods=['POST'], detail=True, url_path='members/add')
+    def add_members(self, request, pk=None):
+        community = self.get_object()
+        user_ids, error = self._bulk_member_ids(request, community)
+        if error:
+            return error
+
+        role = request.data.get('role', 'member')
+        if role not in dict(UserCommunity.ROLE_CHOICES):
+            return Response(
+                {'error': 'Недопустимая роль'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        added = memberships.add_members(community, user_ids, role=role, created_by=request.user)
+        community.refresh_from_db(fields=['members_count'])
+        return Response(
+            {'added': added, 'members_count': community.members_count},
+            status=status.HTTP_200_OK
+        )
+
+    @action(methods=['POST'], detail=True, url_path='members/remove')
+    def remove_members(self, request, pk=None):
+        community = self.get_object()
+        user_ids, error = self._bulk_member_ids(request, community)
+        if error:
+            return error
 
-        return Response(members_data)
+        removed = memberships.remove_members(community, user_ids)
+        community.refresh_from_db(fields=['members_count'])
+        return Response(
+            {'removed': removed, 'members_count': community.members_count},
+            status=status.HTTP_200_OK
+        )
 
     @action(methods=['GET'], detail=True)
     def posts(self, request, pk=None):
@@ -323,9 +453,98 @@ class CommunityViewSet(viewsets.ModelViewSet):
             Q(type='open') &
             ~Q(owner__is_active=False) &
             Q(created_at__gte=month_ago)
-        ).annotate(
-            total_members=Count('members')
-        ).order_by('-total_members')[:15]
+        ).select_related('owner').order_by('-members_count')[:15]
 
         serializer = self.get_serializer(communities, many=True)
         return Response(serializer.data)
+
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        # Брошенные загрузки не должны навсегда занимать лимит
+        uploads.expire_sessions(owner=request.user)
+        with transaction.atomic():
+            # Блокировка строки пользователя: параллельные запросы проверяют
+            # лимит по очереди, а не все до создания первой сессии
+            User.objects.select_for_update().filter(pk=request.user.pk).exists()
+            active = UploadSession.objects.filter(owner=request.user, status='active').count()
+            if active >= settings.UPLOAD_MAX_ACTIVE_SESSIONS:
+                return Response(
+                    {'error': 'Слишком много незавершенных загрузок'},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
+            return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+    def destroy(self, request, pk=None):
+        session = self.get_object()
+        if session.status == 'active':
+            uploads.discard(session)
+            session.status = 'aborted'
+            session.save(update_fields=['status', 'updated_at'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=['PUT'], detail=True)
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        if session.status != 'active':
+            return Response(
+                {'error': 'Загрузка уже завершена'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            start, end = uploads.parse_content_range(request.headers.get('Content-Range'), session.total_size)
+            received = uploads.append_chunk(
+                session, request.stream, start, end,
+                expected_sha256=request.headers.get('X-Chunk-SHA256')
+            )
+        except uploads.UploadError as e:
+            return Response(
+                {'error': str(e), 'received_size': session.received_size},
+                status=e.status_code
+            )
+
+        return Response({'received_size': received}, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=True)
+    def finalize(self, request, pk=None):
+        with transaction.atomic():
+            # Повторный или параллельный finalize ждёт первый и получает тот же файл
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if session.status == 'completed' and session.media_id:
+                return Response(MediaSerializer(session.media).data, status=status.HTTP_200_OK)
+            if session.status != 'active':
+                return Response(
+                    {'error': 'Загрузка уже завершена'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if session.received_size != session.total_size:
+                return Response(
+                    {'error': 'Файл загружен не полностью', 'received_size': session.received_size},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            with uploads.open_completed_file(session) as f:
+                media = Media.objects.create(
+                    owner=request.user,
+                    type=session.type,
+                    file=f,
+                    original_name=session.original_name,
+                    size=session.total_size,
+                    created_by=request.user
+                )
+            session.media = media
+            session.status = 'completed'
+            session.save(update_fields=['media', 'status', 'updated_at'])
+        uploads.discard(session)
+
+        return Response(MediaSerializer(media).data, status=status.HTTP_201_CREATED)
@@ -1,3 +1,5 @@
+import atexit
+
 from django.apps import AppConfig
 
 
@@ -5,3 +7,11 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Социальная сеть'
+
+    def ready(self):
+        from . import checks, history, presence, signals  # noqa: F401
+
+        # Не теряем буферизованную историю и отметки присутствия при
+        # штатной остановке процесса
+        atexit.register(history.flush)
+        atexit.register(presence.flush)
@@ -0,0 +1,88 @@
+"""
+Сохранение вложений постов и сообщений.
+
+Файлы записываются в хранилище параллельно в пуле потоков ещё до начала
+транзакции, а строки Media создаются одним bulk_create внутри той же
+транзакции, что и пост или сообщение. Если транзакция не удалась, уже
+записанные файлы удаляются.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .models import Media
+from .storage import release
+
+
+def get_max_workers():
+    return getattr(settings, 'ATTACHMENT_UPLOAD_WORKERS', 4)
+
+
+class StoredUploads:
+    def __init__(self, owner, uploads, media_type='image'):
+        self.owner = owner
+        self.uploads = list(uploads)
+        self.media_type = media_type
+        self.field = Media._meta.get_field('file')
+        self.names = []
+
+    def _write(self, upload):
+        name = self.field.generate_filename(None, upload.name)
+        return self.field.storage.save(name, upload, max_length=self.field.max_length)
+
+    def write(self):
+        if not self.uploads:
+            return
+        workers = min(len(self.uploads), get_max_workers())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._write, upload) for upload in self.uploads]
+            for future in futures:
+                # Имена собираем даже при ошибке, чтобы потом удалить записанное
+                try:
+                    self.names.append(future.result())
+                except Exception:
+                    self.names.append(None)
+        if None in self.names:
+            self.discard()
+            raise OSError('Не удалось сохранить вложение')
+
+    def attach(self, post=None, message=None):
+        """Создаёт строки Media для записанных файлов одним запросом."""
+        return Media.objects.bulk_create([
+            Media(
+                owner=self.owner,
+                type=self.media_type,
+                file=name,
+                original_name=upload.name,
+                size=upload.size,
+                post=post,
+                message=message,
+                created_by=self.owner,
+            )
+            for upload, name in zip(self.uploads, self.names)
+        ])
+
+    def discard(self):
+        for name in self.names:
+            if name:
+                release(self.field.storage, name)
+        self.names = []
+
+
+@contextmanager
+def stored_uploads(owner, uploads, media_type='image'):
+    """
+    Записывает файлы в хранилище и удаляет их, если блок завершился ошибкой:
+
+        with stored_uploads(user, images) as stored, transaction.atomic():
+            post = Post.objects.create(...)
+            stored.attach(post=post)
+    """
+    stored = StoredUploads(owner, uploads, media_type)
+    stored.write()
+    try:
+        yield stored
+    except BaseException:
+        stored.discard()
+        raise
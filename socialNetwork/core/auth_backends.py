@@ -0,0 +1,69 @@
+"""
+Загрузка request.user без обращения к БД.
+
+CachedModelBackend.get_user берёт из кэша «снимок» пользователя — только
+поля, нужные на каждой странице (имя, аватар, флаги доступа и хэш пароля
+для проверки сессии), — и собирает из него объект User, у которого
+остальные поля отложены (deferred) и подгружаются при первом обращении.
+Снимок сбрасывается при сохранении или удалении пользователя (в том
+числе при смене пароля и входе — update_last_login вызывает save) и
+вместе с остальными объектами пользователей в core/model_cache.py.
+
+Бэкенд включается только с общим для процессов кэшем (CACHE_SHARED в
+settings.py): иначе снимок со старым хэшем пароля или флагами доступа
+оставался бы в кэше других воркеров до MODEL_CACHE_TIMEOUT.
+
+Страницы, которым нужен полный профиль текущего пользователя, загружают
+его отдельно (см. views.edit_profile).
+"""
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import model_cache
+from .cache import MISSING, record
+from .models import User
+
+SNAPSHOT_FIELDS = (
+    'id', 'password', 'email', 'first_name', 'last_name', 'avatar',
+    'is_active', 'is_staff', 'is_superuser',
+)
+STATS_NAME = 'auth_user'
+
+
+def _snapshot_key(user_id):
+    return model_cache.object_key(User, f'session:{user_id}')
+
+
+def invalidate_snapshot(user_id):
+    transaction.on_commit(lambda: cache.delete(_snapshot_key(user_id)))
+
+
+def load_user(user_id):
+    started = time.perf_counter()
+    key = _snapshot_key(user_id)
+    snapshot = cache.get(key, MISSING)
+    if snapshot is MISSING:
+        # Как и остальной кэш объектов, снимок читается с основной БД
+        snapshot = (
+            User._default_manager.using(DEFAULT_DB_ALIAS)
+            .filter(pk=user_id).values(*SNAPSHOT_FIELDS).first()
+        )
+        cache.set(key, snapshot, model_cache.get_timeout())
+        record(STATS_NAME, misses=1, seconds=time.perf_counter() - started)
+    else:
+        record(STATS_NAME, hits=1, seconds=time.perf_counter() - started)
+
+    if snapshot is None:
+        return None
+    # from_db ждёт значения в порядке полей модели
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in snapshot]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [snapshot[name] for name in field_names])
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,104 @@
+"""
+Кэш-бэкенды с учётом попаданий.
+
+CountingLocMemCache — локальный кэш процесса, ограниченный по числу
+записей (MAX_ENTRIES): при переполнении вытесняются давно не читавшиеся
+записи (LRU). CountingFileBasedCache и CountingRedisCache — общие для всех
+процессов кэши в файлах и в Redis (или совместимом сервере, например
+Valkey); бэкенд выбирается переменной окружения CACHE_BACKEND.
+
+Попадания, промахи и время чтения считаются отдельно для каждого кэша
+(STATS_NAME в CACHES, по умолчанию LOCATION) и доступны через get_stats(),
+например в отчёте /debug/profiling/.
+
+is_shared() сообщает, видят ли кэш другие процессы: сбросы из команд и
+воркеров медиа доходят до веб-воркеров только через общий кэш.
+"""
+import threading
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+_lock = threading.Lock()
+# {location: {'hits': int, 'misses': int, 'seconds': float}}
+_stats = {}
+
+MISSING = object()
+
+
+def record(location, hits=0, misses=0, seconds=0.0):
+    with _lock:
+        counters = _stats.setdefault(location, {'hits': 0, 'misses': 0, 'seconds': 0.0})
+        counters['hits'] += hits
+        counters['misses'] += misses
+        counters['seconds'] += seconds
+
+
+def get_stats():
+    with _lock:
+        stats = {}
+        for location, counters in _stats.items():
+            total = counters['hits'] + counters['misses']
+            stats[location] = {
+                'hits': counters['hits'],
+                'misses': counters['misses'],
+                'hit_rate': round(counters['hits'] / total, 4) if total else None,
+                'avg_ms': round(counters['seconds'] / total * 1000, 3) if total else None,
+            }
+        return stats
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """Общий ли кэш для всех процессов: locmem виден только своему процессу."""
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+class CountingCacheMixin:
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.location = params.get('STATS_NAME') or name
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        value = super().get(key, MISSING, version)
+        elapsed = time.perf_counter() - started
+        if value is MISSING:
+            record(self.location, misses=1, seconds=elapsed)
+            return default
+        record(self.location, hits=1, seconds=elapsed)
+        return value
+
+
+# У LocMemCache и FileBasedCache get_many() вызывает get(), поэтому
+# достаточно считать в get()
+
+class CountingLocMemCache(CountingCacheMixin, LocMemCache):
+    pass
+
+
+class CountingFileBasedCache(CountingCacheMixin, FileBasedCache):
+    pass
+
+
+class CountingRedisCache(CountingCacheMixin, RedisCache):
+    """Требует пакет redis."""
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        started = time.perf_counter()
+        found = super().get_many(keys, version)
+        record(
+            self.location,
+            hits=len(found),
+            misses=len(keys) - len(found),
+            seconds=time.perf_counter() - started,
+        )
+        return found
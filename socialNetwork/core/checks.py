@@ -0,0 +1,23 @@
+"""
+Проверки конфигурации (manage.py check --deploy).
+
+Присутствие пользователей (core/presence.py) хранит отметки «в сети» в
+кэше: в locmem у каждого воркера gunicorn они свои, и is_online_now
+зависит от того, какой воркер обработал запрос.
+"""
+from django.core.checks import Error, Tags, register
+
+from .cache import is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_presence_cache(app_configs, **kwargs):
+    if is_shared():
+        return []
+    return [
+        Error(
+            'Присутствие пользователей требует общий для процессов кэш.',
+            hint='Задайте CACHE_BACKEND=file или CACHE_BACKEND=redis.',
+            id='core.E001',
+        )
+    ]
@@ -0,0 +1,121 @@
+"""
+Ветки комментариев на материализованных путях.
+
+У каждого комментария хранится path — склеенные id всех предков и его
+самого, каждый в виде base36 фиксированной ширины. Сортировка по path даёт
+обход дерева в глубину (ответы сразу после родителя, соседи по порядку
+создания), а все потомки комментария лежат в диапазоне
+[path, path + '~'). Поэтому ветка или её окно читается одним проходом по
+индексу (post, path) и собирается в дерево за O(n).
+"""
+from django.conf import settings
+from django.db.models import BooleanField, Case, Exists, OuterRef, Value, When
+
+from .models import Comment
+
+SEGMENT_WIDTH = 8
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Символ больше любой цифры base36: верхняя граница диапазона потомков
+PATH_END = '~'
+# Ограничено длиной поля path: 255 // SEGMENT_WIDTH уровней
+MAX_DEPTH = Comment._meta.get_field('path').max_length // SEGMENT_WIDTH - 1
+
+
+def get_page_size():
+    return getattr(settings, 'COMMENTS_PAGE_SIZE', 100)
+
+
+def get_display_depth():
+    return getattr(settings, 'COMMENTS_DISPLAY_DEPTH', 5)
+
+
+def encode_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = ALPHABET[remainder] + digits
+    return digits.rjust(SEGMENT_WIDTH, '0')
+
+
+def path_ids(path):
+    return [int(path[i:i + SEGMENT_WIDTH], 36) for i in range(0, len(path), SEGMENT_WIDTH)]
+
+
+def assign_path(comment):
+    """Вычисляет path и depth только что вставленного комментария."""
+    parent = comment.parent
+    if parent is not None and parent.depth >= MAX_DEPTH:
+        # Слишком глубокий ответ прикрепляется к предку на предельной глубине
+        ancestor_id = path_ids(parent.path)[MAX_DEPTH - 1]
+        parent = Comment.objects.get(pk=ancestor_id)
+        comment.parent = parent
+
+    prefix = parent.path if parent is not None else ''
+    comment.path = prefix + encode_segment(comment.pk)
+    comment.depth = parent.depth + 1 if parent is not None else 0
+    Comment.objects.filter(pk=comment.pk).update(
+        path=comment.path, depth=comment.depth, parent=parent
+    )
+
+
+class ThreadWindow:
+    """
+    Окно ветки: nodes — комментарии в порядке обхода (у каждого есть
+    children, level и has_more_replies), roots — верхний уровень окна,
+    next_cursor — path последнего комментария, если ветка не закончилась.
+    """
+
+    def __init__(self, nodes, roots, next_cursor, root=None):
+        self.nodes = nodes
+        self.roots = roots
+        self.next_cursor = next_cursor
+        self.root = root
+
+
+def load_thread(post, root=None, after=None, limit=None, max_depth=None):
+    """
+    Загружает до limit комментариев поста (или поддерева root) после курсора
+    after, не глубже max_depth уровней. У комментариев на последнем уровне,
+    чьи ответы не показаны, has_more_replies = True.
+    """
+    limit = limit or get_page_size()
+    max_depth = get_display_depth() if max_depth is None else max_depth
+
+    queryset = Comment.objects.filter(post=post)
+    base_depth = 0
+    if root is not None:
+        queryset = queryset.filter(path__gte=root.path, path__lt=root.path + PATH_END)
+        base_depth = root.depth
+    if after:
+        queryset = queryset.filter(path__gt=after)
+
+    last_level = base_depth + max_depth
+    rows = list(
+        queryset.filter(depth__lte=last_level)
+        .select_related('author')
+        .annotate(has_more_replies=Case(
+            When(depth=last_level, then=Exists(Comment.objects.filter(parent=OuterRef('pk')))),
+            default=Value(False),
+            output_field=BooleanField(),
+        ))
+        .order_by('path')[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].path
+
+    by_id = {}
+    roots = []
+    for comment in rows:
+        comment.children = []
+        comment.level = comment.depth - base_depth
+        parent = by_id.get(comment.parent_id)
+        if parent is not None:
+            parent.children.append(comment)
+        else:
+            # Корень окна: верхний уровень или продолжение с прошлой страницы
+            roots.append(comment)
+        by_id[comment.pk] = comment
+
+    return ThreadWindow(rows, roots, next_cursor, root=root)
@@ -0,0 +1,30 @@
+"""
+Денормализованные счётчики (Post.likes_count, Comment.likes_count,
+Community.members_count).
+
+Счётчик меняется одним UPDATE ... SET field = field + delta, без чтения
+значения в Python, поэтому параллельные изменения не теряются. Если СУБД
+поддерживает RETURNING, новое значение возвращается тем же запросом.
+Подключение для записи выбирается роутером, как и для обычного save():
+так запись закрепляет запрос за основной БД (core/routers.py).
+"""
+from django.db import connections, router
+from django.db.models import F
+
+
+def adjust_counter(model, pk, field, delta):
+    """Меняет счётчик field у строки pk на delta и возвращает новое значение."""
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.can_return_columns_from_insert:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+        return model.objects.filter(pk=pk).values_list(field, flat=True).first()
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {column} = {column} + %s WHERE id = %s RETURNING {column}',
+            [delta, pk],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
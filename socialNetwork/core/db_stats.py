@@ -0,0 +1,44 @@
+"""
+Статистика подключений к БД в текущем процессе (воркере gunicorn).
+
+connects — сколько раз Django открывал подключение; при пуле это число
+выдач подключения из пула, а реальные подключения к серверу видны в
+статистике самого пула (psycopg_pool: pool_size, requests_waiting,
+connections_num и т. д.). Для реплик показывается последнее измеренное
+отставание в секундах (None — реплика недоступна). Отчёт доступен в
+/debug/profiling/.
+"""
+import os
+import threading
+
+from django.db import connections
+
+from . import routers
+
+_lock = threading.Lock()
+# {alias: int}
+_connects = {}
+
+
+def record_connect(alias):
+    with _lock:
+        _connects[alias] = _connects.get(alias, 0) + 1
+
+
+def get_stats():
+    with _lock:
+        connects = dict(_connects)
+
+    databases = {}
+    for alias in connections:
+        connection = connections[alias]
+        settings_dict = connection.settings_dict
+        pool = connection.pool if settings_dict['OPTIONS'].get('pool') else None
+        databases[alias] = {
+            'vendor': connection.vendor,
+            'conn_max_age': settings_dict['CONN_MAX_AGE'],
+            'health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+            'connects': connects.get(alias, 0),
+            'pool': pool.get_stats() if pool is not None else None,
+        }
+    return {'pid': os.getpid(), 'databases': databases, 'replica_lag': routers.get_lag_stats()}
@@ -0,0 +1,98 @@
+"""
+Подготовка карточек постов для ленты.
+
+Общая для всех зрителей часть карточки кэшируется тегом {% cache %} в кэше
+``fragments``. Ключ фрагмента строится из id поста, его updated_at,
+updated_at автора и «версии счётчиков», которая увеличивается при
+лайках и комментариях. Состояние «я лайкнул» для всей страницы
+определяется одним запросом (viewer_state) и тоже входит в ключ, так что
+у поста не больше двух вариантов фрагмента.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Like
+
+VERSION_KEY_PREFIX = 'post_card_version:'
+
+
+def get_fragment_timeout():
+    return getattr(settings, 'POST_CARD_CACHE_TIMEOUT', 600)
+
+
+def _version_key(post_id):
+    return f'{VERSION_KEY_PREFIX}{post_id}'
+
+
+def _new_version():
+    # Версия, вытесненная из кэша, не должна совпасть с прежней
+    return time.time_ns()
+
+
+def card_versions(post_ids):
+    """Возвращает {post_id: версия счётчиков} одним обращением к кэшу."""
+    keys = {_version_key(post_id): post_id for post_id in post_ids}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump_card_version(post_id):
+    try:
+        cache.incr(_version_key(post_id))
+    except ValueError:
+        cache.set(_version_key(post_id), _new_version(), timeout=None)
+
+
+def viewer_state(user, post_ids=(), comment_ids=()):
+    """
+    Что из переданных постов и комментариев лайкнул пользователь.
+    Возвращает {'posts': set(id), 'comments': set(id)}; один запрос на всё.
+    """
+    state = {'posts': set(), 'comments': set()}
+    post_ids, comment_ids = list(post_ids), list(comment_ids)
+    if user is None or not user.is_authenticated or not (post_ids or comment_ids):
+        return state
+
+    rows = Like.objects.filter(user=user).filter(
+        Q(post_id__in=post_ids) | Q(comment_id__in=comment_ids)
+    ).values_list('post_id', 'comment_id')
+    for post_id, comment_id in rows:
+        if post_id in post_ids:
+            state['posts'].add(post_id)
+        if comment_id in comment_ids:
+            state['comments'].add(comment_id)
+    return state
+
+
+def liked_post_ids(user, post_ids):
+    return viewer_state(user, post_ids=post_ids)['posts']
+
+
+def _count_subquery(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def with_counts(queryset):
+    """Добавляет к постам comments_total без загрузки самих комментариев."""
+    return queryset.annotate(comments_total=_count_subquery(Comment, 'post'))
+
+
+def prepare_post_cards(posts, user):
+    """Проставляет постам card_version и is_liked для шаблона карточки."""
+    posts = list(posts)
+    post_ids = [post.id for post in posts]
+    versions = card_versions(post_ids)
+    liked_ids = liked_post_ids(user, post_ids)
+    for post in posts:
+        post.card_version = versions[post.id]
+        post.is_liked = post.id in liked_ids
+    return posts
@@ -0,0 +1,220 @@
+"""
+Запись истории изменений (django-simple-history) пакетами.
+
+BufferedHistoricalRecords умеет две вещи:
+
+* ``untracked_fields`` — сохранение, затрагивающее только эти поля
+  (например, ``save(update_fields=['views_count'])``), не создаёт
+  историческую запись;
+* при ``HISTORY_BUFFERED = True`` исторические записи не сохраняются сразу,
+  а копятся в памяти и пишутся через ``bulk_create`` после коммита
+  транзакции — в конце запроса (HistoryFlushMiddleware) или при
+  завершении процесса.
+
+Кроме того, каждая историческая запись хранит в ``history_delta`` поля,
+изменившиеся относительно предыдущей записи того же объекта:
+``{поле: [было, стало]}`` строками, длинные значения обрезаны до
+HISTORY_DELTA_MAX_CHARS символов. Разница считается при записи — по
+предыдущей записи в буфере или по последней записи в БД (индекс
+(id объекта, history_id)), — поэтому страница истории в админке
+(admin_mixins.HistoryDeltaAdminMixin) не загружает соседние снимки.
+Поля из ``untracked_fields`` в разницу не попадают.
+
+Буферизованная ветка create_historical_record повторяет
+HistoricalRecords.create_historical_record из django-simple-history 3.7.0
+(версия закреплена в requirements.txt): у библиотеки нет отдельного
+метода для сохранения записи, который можно было бы подменить. При
+обновлении библиотеки копию нужно сверить с новой версией
+(тест HistoryUpstreamVersionTests).
+"""
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.utils import timezone
+from django.utils.text import Truncator
+from simple_history.models import HistoricalRecords
+from simple_history.signals import post_create_historical_record, pre_create_historical_record
+
+# Версия, с которой сверена копия create_historical_record
+UPSTREAM_VERSION = '3.7.0'
+
+_lock = threading.Lock()
+# Записи, чьи транзакции уже зафиксированы: [(using, history_instance, instance)]
+_buffer = []
+
+
+def buffering_enabled():
+    return getattr(settings, 'HISTORY_BUFFERED', False)
+
+
+def get_buffer_size():
+    return getattr(settings, 'HISTORY_BUFFER_SIZE', 500)
+
+
+def get_delta_max_chars():
+    return getattr(settings, 'HISTORY_DELTA_MAX_CHARS', 200)
+
+
+def _delta_value(field, record):
+    if getattr(record, field.attname) is None:
+        return None
+    return Truncator(field.value_to_string(record)).chars(get_delta_max_chars())
+
+
+def diff_records(fields, previous, record):
+    """{имя поля: [было, стало]} для полей fields, различающихся в двух записях."""
+    return {
+        field.name: [_delta_value(field, previous), _delta_value(field, record)]
+        for field in fields
+        if getattr(previous, field.attname) != getattr(record, field.attname)
+    }
+
+
+def delta_fields(history_model):
+    untracked = getattr(history_model, 'untracked_fields', frozenset())
+    return [field for field in history_model.tracked_fields if field.name not in untracked]
+
+
+def set_deltas(history_model, records, using=None):
+    """
+    Заполняет history_delta у ещё не сохранённых записей одной модели,
+    идущих в порядке создания. Предыдущая запись объекта берётся из этого
+    же списка, а для первой записи объекта — из БД.
+    """
+    fields = delta_fields(history_model)
+    pk_name = history_model.instance_type._meta.pk.attname
+    latest = {}
+    for record in records:
+        object_id = getattr(record, pk_name)
+        previous = latest.get(object_id)
+        if previous is None and record.history_type != '+':
+            previous = (
+                history_model._default_manager.using(using or DEFAULT_DB_ALIAS)
+                .filter(**{pk_name: object_id}).order_by('-history_id').first()
+            )
+        record.history_delta = diff_records(fields, previous, record) if previous is not None else {}
+        latest[object_id] = record
+
+
+class HistoryDeltaModel(models.Model):
+    """Базовый класс исторических моделей с history_delta."""
+    history_delta = models.JSONField(null=True, blank=True, editable=False, verbose_name='Изменения')
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.history_delta is None:
+            set_deltas(type(self), [self], using=kwargs.get('using'))
+        super().save(*args, **kwargs)
+
+
+def _enqueue(item):
+    with _lock:
+        _buffer.append(item)
+        overflow = len(_buffer) >= get_buffer_size()
+    if overflow:
+        flush()
+
+
+def flush():
+    """Сохраняет накопленные исторические записи одним bulk_create на модель."""
+    global _buffer
+    with _lock:
+        items, _buffer = _buffer, []
+
+    if not items:
+        return 0
+
+    groups = defaultdict(list)
+    for using, history_instance, instance in items:
+        groups[(type(history_instance), using)].append((history_instance, instance))
+
+    for (model, using), records in groups.items():
+        if issubclass(model, HistoryDeltaModel):
+            set_deltas(model, [record for record, _ in records], using=using)
+        model.objects.using(using or DEFAULT_DB_ALIAS).bulk_create([record for record, _ in records])
+        for history_instance, instance in records:
+            post_create_historical_record.send(
+                sender=model,
+                instance=instance,
+                history_instance=history_instance,
+                history_date=history_instance.history_date,
+                history_user=history_instance.history_user,
+                history_change_reason=history_instance.history_change_reason,
+                using=using,
+            )
+    return len(items)
+
+
+class BufferedHistoricalRecords(HistoricalRecords):
+    def __init__(self, *args, untracked_fields=None, bases=(HistoryDeltaModel,), **kwargs):
+        super().__init__(*args, bases=bases, **kwargs)
+        self.untracked_fields = frozenset(untracked_fields or ())
+
+    def get_meta_options(self, model):
+        meta_fields = super().get_meta_options(model)
+        # Последняя запись объекта и постраничный просмотр его истории
+        meta_fields['indexes'] = (
+            *meta_fields.get('indexes', ()),
+            models.Index(fields=(model._meta.pk.attname, 'history_id'), name=f'hist_{model._meta.model_name}_obj_idx'),
+        )
+        return meta_fields
+
+    def create_history_model(self, model, inherited):
+        history_model = super().create_history_model(model, inherited)
+        history_model.untracked_fields = self.untracked_fields
+        return history_model
+
+    def post_save(self, instance, created, using=None, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if not created and update_fields and self.untracked_fields.issuperset(update_fields):
+            return
+        super().post_save(instance, created, using=using, **kwargs)
+
+    def create_historical_record(self, instance, history_type, using=None):
+        if not buffering_enabled() or self.get_m2m_fields_from_model(instance.__class__):
+            return super().create_historical_record(instance, history_type, using=using)
+
+        # Копия метода из django-simple-history 3.7.0 до history_instance.save();
+        # сохранение и post_create_historical_record выполняет flush()
+
+        using = using if self.use_base_model_db else None
+        history_date = getattr(instance, '_history_date', timezone.now())
+        history_user = self.get_history_user(instance)
+        history_change_reason = self.get_change_reason_for_object(instance, history_type, using)
+        manager = getattr(instance, self.manager_name)
+
+        attrs = {}
+        for field in self.fields_included(instance):
+            attrs[field.attname] = getattr(instance, field.attname)
+
+        if getattr(manager.model, 'history_relation', None) is not None:
+            attrs['history_relation'] = instance
+
+        history_instance = manager.model(
+            history_date=history_date,
+            history_type=history_type,
+            history_user=history_user,
+            history_change_reason=history_change_reason,
+            **attrs,
+        )
+
+        pre_create_historical_record.send(
+            sender=manager.model,
+            instance=instance,
+            history_date=history_date,
+            history_user=history_user,
+            history_change_reason=history_change_reason,
+            history_instance=history_instance,
+            using=using,
+        )
+
+        # Если транзакция откатится, запись так и не попадёт в буфер
+        transaction.on_commit(
+            partial(_enqueue, (using, history_instance, instance)),
+            using=instance._state.db or DEFAULT_DB_ALIAS,
+        )
@@ -0,0 +1,423 @@
+"""
+Обслуживание таблиц истории изменений (HistoricalUser, HistoricalCommunity,
+HistoricalPost): удаление по сроку хранения, сжатие «пустых» записей и
+партиционирование по времени на PostgreSQL.
+
+Партиционированная таблица состоит из помесячных партиций {table}_pYYYYMM
+и партиции {table}_legacy от MINVALUE: в неё при конвертации попадает вся
+прежняя история, и в неё же переносятся последние записи объектов из
+удаляемых по сроку хранения партиций — с настоящими датами, а граница
+{table}_legacy сдвигается на конец удалённого месяца. Остальные устаревшие
+записи из {table}_legacy удаляются порциями, как в expired_records().
+
+Удаление всегда идёт небольшими порциями по первичному ключу, каждая порция
+в своей транзакции, чтобы не держать долгих блокировок на таблице.
+"""
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .history import delta_fields, diff_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = {
+    'core.User': 730,
+    'core.Community': 730,
+    'core.Post': 365,
+}
+
+
+def get_retention_policy():
+    """Возвращает {модель: срок хранения истории в днях}."""
+    policy = getattr(settings, 'HISTORY_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return {apps.get_model(label): days for label, days in policy.items()}
+
+
+def delete_in_chunks(queryset, chunk_size=5000, pause=0.0):
+    """Удаляет записи queryset порциями по chunk_size. Возвращает число удалённых."""
+    model = queryset.model
+    pk_name = model._meta.pk.name
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list(pk_name, flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            count, _ = model.objects.filter(**{f'{pk_name}__in': ids}).delete()
+        deleted += count
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def expired_records(model, days):
+    """
+    Исторические записи старше срока хранения. Последняя запись каждого
+    объекта сохраняется, чтобы у него оставалось известное состояние.
+    """
+    history_model = model.history.model
+    cutoff = timezone.now() - timedelta(days=days)
+    newer = history_model.objects.filter(id=OuterRef('id'), history_date__gt=OuterRef('history_date'))
+    return history_model.objects.filter(history_date__lt=cutoff).filter(Exists(newer))
+
+
+def _compared_fields(history_model):
+    ignored = set(getattr(history_model, 'untracked_fields', ()))
+    fields = []
+    for field in history_model.tracked_fields:
+        if field.name in ignored or getattr(field, 'auto_now', False):
+            continue
+        fields.append(field.attname)
+    return fields
+
+
+def _scan_redundant(model, since, chunk_size):
+    history_model = model.history.model
+    fields = _compared_fields(history_model)
+    queryset = history_model.objects.all()
+    if since is not None:
+        queryset = queryset.filter(history_date__gte=since)
+
+    rows = queryset.order_by('id', 'history_date', 'history_id').values_list(
+        'history_id', 'history_type', 'id', *fields
+    ).iterator(chunk_size=chunk_size)
+
+    redundant, followers = [], {}
+    previous_id = previous_values = previous_history_id = None
+    skipped = False
+    for history_id, history_type, object_id, *values in rows:
+        if history_type == '~' and object_id == previous_id and values == previous_values:
+            redundant.append(history_id)
+            skipped = True
+            continue
+        if skipped and object_id == previous_id:
+            # Ключ — последняя удаляемая запись перед history_id
+            followers[redundant[-1]] = (history_id, previous_history_id)
+        skipped = False
+        previous_id, previous_values, previous_history_id = object_id, values, history_id
+    return redundant, followers
+
+
+def redundant_record_ids(model, since=None, chunk_size=2000):
+    """
+    Находит записи «~», которые не отличаются от предыдущей записи того же
+    объекта ничем, кроме счётчиков (untracked_fields) и updated_at.
+    """
+    return _scan_redundant(model, since, chunk_size)[0]
+
+
+def _refresh_deltas(history_model, followers):
+    # history_delta записи считался от удалённой предыдущей; после сжатия
+    # предыдущей становится последняя оставшаяся запись объекта
+    fields = delta_fields(history_model)
+    records = history_model.objects.in_bulk([history_id for pair in followers for history_id in pair])
+    changed = []
+    for history_id, previous_id in followers:
+        record = records[history_id]
+        record.history_delta = diff_records(fields, records[previous_id], record)
+        changed.append(record)
+    history_model.objects.bulk_update(changed, ['history_delta'])
+
+
+def compact(model, since=None, chunk_size=5000, pause=0.0):
+    """
+    Удаляет избыточные записи и пересчитывает history_delta у записей,
+    следующих за удалёнными.
+    """
+    history_model = model.history.model
+    ids, followers = _scan_redundant(model, since, 2000)
+    deleted = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        with transaction.atomic():
+            count, _ = history_model.objects.filter(history_id__in=chunk).delete()
+            _refresh_deltas(history_model, [followers[i] for i in chunk if i in followers])
+        deleted += count
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+# Партиционирование (только PostgreSQL)
+
+PARTITION_BOUND_RE = re.compile(r'FROM \((.+?)\) TO \((.+?)\)')
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def legacy_partition(table):
+    return f'{table}_legacy'
+
+
+def _bound_check(table):
+    return f'{legacy_partition(table)}_bound'
+
+
+def legacy_boundary():
+    """Верхняя граница {table}_legacy при конвертации: начало следующего месяца."""
+    return _next_month(_month_start(timezone.now().date())).isoformat()
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass',
+        [table],
+    )
+    return cursor.fetchone() is not None
+
+
+def _add_bound_check(table, relation, boundary, name):
+    """
+    Добавляет CHECK history_date < boundary в две транзакции: NOT VALID,
+    затем VALIDATE CONSTRAINT — проверка строк идёт под SHARE UPDATE
+    EXCLUSIVE и не блокирует запись. По такому CHECK ATTACH PARTITION
+    не сканирует таблицу.
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {qn(relation)} DROP CONSTRAINT IF EXISTS {qn(name)}')
+        cursor.execute(
+            f'ALTER TABLE {qn(relation)} ADD CONSTRAINT {qn(name)} '
+            f"CHECK (history_date IS NOT NULL AND history_date < '{boundary}') NOT VALID"
+        )
+        cursor.execute(f'ALTER TABLE {qn(relation)} VALIDATE CONSTRAINT {qn(name)}')
+
+
+def prepare_conversion(table, boundary):
+    """
+    Подготовка к convert_to_partitioned вне транзакции: CHECK по границе
+    {table}_legacy и уникальный индекс (history_id, history_date) для
+    первичного ключа, построенный CONCURRENTLY. Тогда сама конвертация
+    только меняет каталог и не сканирует таблицу под ACCESS EXCLUSIVE.
+    """
+    qn = connection.ops.quote_name
+    _add_bound_check(table, table, boundary, _bound_check(table))
+    index = f'{legacy_partition(table)}_pk_idx'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid',
+            [index],
+        )
+        if cursor.fetchone():
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {qn(index)}')
+        cursor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {qn(index)} '
+            f'ON {qn(table)} (history_id, history_date)'
+        )
+
+
+def convert_to_partitioned(cursor, table, boundary):
+    """
+    Превращает таблицу истории в партиционированную по history_date.
+    Существующие данные становятся партицией {table}_legacy до boundary,
+    новые партиции создаются помесячно. Вызывается после
+    prepare_conversion() с той же границей.
+    """
+    qn = connection.ops.quote_name
+    legacy = legacy_partition(table)
+
+    cursor.execute(f'SELECT COALESCE(MAX(history_id), 0) + 1 FROM {qn(table)}')
+    next_id = cursor.fetchone()[0]
+
+    cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+    cursor.execute(f'ALTER TABLE {qn(legacy)} ALTER COLUMN history_id DROP IDENTITY IF EXISTS')
+    # Имена индексов общие для схемы: прежние имена получат индексы новой
+    # таблицы, на которые ссылаются миграции
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+        [legacy],
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(name)} TO {qn(legacy + "_pkey")}')
+    cursor.execute(
+        'SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i '
+        'JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE i.indrelid = %s::regclass AND NOT i.indisunique',
+        [legacy],
+    )
+    indexes = cursor.fetchall()
+    for index, (name, _) in enumerate(indexes):
+        cursor.execute(f'ALTER INDEX {qn(name)} RENAME TO {qn(f"{legacy}_idx{index}")}')
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [legacy],
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(
+        f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE (history_date)'
+    )
+    # CHECK по границе нужен только партиции
+    cursor.execute(f'ALTER TABLE {qn(table)} DROP CONSTRAINT {qn(_bound_check(table))}')
+    cursor.execute(f'CREATE SEQUENCE {qn(table + "_history_id_seq")} START WITH {int(next_id)}')
+    cursor.execute(
+        f'ALTER TABLE {qn(table)} ALTER COLUMN history_id '
+        f"SET DEFAULT nextval('{table}_history_id_seq')"
+    )
+    cursor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY (history_id, history_date)')
+    # LIKE не копирует внешние ключи. Индексы и ключи создаются до
+    # подключения старой таблицы: её совпадающие индексы и ключи будут
+    # подключены, а не построены и проверены заново.
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+    for name, definition in indexes:
+        method = definition.split(' USING ', 1)[1]
+        cursor.execute(f'CREATE INDEX {qn(name)} ON {qn(table)} USING {method}')
+    cursor.execute(
+        f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} '
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary}')"
+    )
+
+
+def _existing_tables(cursor, names):
+    cursor.execute('SELECT relname FROM pg_class WHERE relname = ANY(%s)', [list(names)])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def create_partitions(cursor, table, months_ahead=3):
+    """
+    Создаёт помесячные партиции на months_ahead месяцев вперёд.
+    Возвращает имена только действительно созданных партиций.
+    """
+    qn = connection.ops.quote_name
+    months = [_month_start(timezone.now().date())]
+    for _ in range(months_ahead):
+        months.append(_next_month(months[-1]))
+    existing = _existing_tables(cursor, [_partition_name(table, month) for month in months])
+
+    created = []
+    for month in months:
+        name = _partition_name(table, month)
+        if name in existing:
+            continue
+        try:
+            # Текущий месяц мог уже войти в партицию, созданную при конвертации
+            with transaction.atomic():
+                cursor.execute(
+                    f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+                )
+        except DatabaseError:
+            pass
+        else:
+            created.append(name)
+    return created
+
+
+def _parse_bound(value):
+    if value == 'MINVALUE':
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def _partitions(cursor, table):
+    """[(имя, нижняя граница, верхняя граница в SQL, верхняя граница)] по возрастанию."""
+    cursor.execute(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+        'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = %s::regclass',
+        [table],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = PARTITION_BOUND_RE.search(bound or '')
+        if not match:
+            continue
+        lower, upper = match.groups()
+        partitions.append((name, _parse_bound(lower), upper, _parse_bound(upper)))
+    # Партиция от MINVALUE — первой
+    return sorted(partitions, key=lambda partition: (partition[1] is not None, partition[1] or 0))
+
+
+def _carry_latest_records(cursor, table, partition, legacy, boundary):
+    """
+    Копирует в отключённую {table}_legacy последние записи объектов из
+    partition, у которых нет записей новее boundary. Даты записей не меняются.
+    """
+    qn = connection.ops.quote_name
+    cursor.execute(
+        'SELECT column_name FROM information_schema.columns '
+        'WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position',
+        [table],
+    )
+    columns = [qn(name) for (name,) in cursor.fetchall()]
+    column_list = ', '.join(columns)
+    selected = ', '.join(f'p.{column}' for column in columns)
+    cursor.execute(
+        f'INSERT INTO {qn(legacy)} ({column_list}) '
+        f'SELECT {column_list} FROM ('
+        f'SELECT DISTINCT ON (p.id) {selected} FROM {qn(partition)} p '
+        f'WHERE NOT EXISTS (SELECT 1 FROM {qn(table)} n '
+        f"WHERE n.id = p.id AND n.history_date >= '{boundary}') "
+        f'ORDER BY p.id, p.history_date DESC, p.history_id DESC'
+        f') latest'
+    )
+    return cursor.rowcount
+
+
+def drop_expired_partitions(table, days):
+    """
+    Удаляет помесячные партиции, целиком вышедшие за срок хранения, от
+    старых к новым. Партиции обрабатываются в своих транзакциях:
+
+    * вне транзакции {table}_legacy получает CHECK по новой границе
+      (проверка без блокировки записи);
+    * в транзакции партиция и {table}_legacy отключаются, последние записи
+      объектов переносятся в {table}_legacy, она подключается с границей
+      удалённого месяца (без сканирования — по CHECK), партиция удаляется.
+    """
+    qn = connection.ops.quote_name
+    cutoff = timezone.now() - timedelta(days=days)
+    legacy = legacy_partition(table)
+    check = _bound_check(table)
+    dropped = []
+
+    with connection.cursor() as cursor:
+        partitions = _partitions(cursor, table)
+    if not partitions or partitions[0][0] != legacy:
+        logger.warning('%s: нет партиции %s, устаревшие партиции не удаляются', table, legacy)
+        return dropped
+    _, _, _, legacy_upper = partitions[0]
+
+    for name, lower, upper_sql, upper in partitions[1:]:
+        if upper > cutoff:
+            break
+        if lower != legacy_upper:
+            # Между {table}_legacy и партицией пропуск: граница не сдвигается
+            logger.warning('%s: партиция %s не примыкает к %s', table, name, legacy)
+            break
+        _add_bound_check(table, legacy, upper_sql.strip("'"), f'{check}_next')
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+            cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(legacy)}')
+            cursor.execute(f'ALTER TABLE {qn(legacy)} DROP CONSTRAINT IF EXISTS {qn(check)}')
+            cursor.execute(f'ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(check + "_next")} TO {qn(check)}')
+            _carry_latest_records(cursor, table, name, legacy, upper_sql.strip("'"))
+            cursor.execute(
+                f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} '
+                f'FOR VALUES FROM (MINVALUE) TO ({upper_sql})'
+            )
+            cursor.execute(f'DROP TABLE {qn(name)}')
+        dropped.append(name)
+        legacy_upper = upper
+    return dropped
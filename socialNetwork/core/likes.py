@@ -0,0 +1,102 @@
+"""
+Лайки постов и комментариев без гонок.
+
+like() выполняет один INSERT ... ON CONFLICT DO NOTHING, unlike() — один
+DELETE, поэтому повторный запрос (двойной клик) ничего не меняет и не
+приводит к IntegrityError. Счётчик likes_count меняется в той же
+транзакции и только если строка действительно вставлена или удалена.
+UPDATE счётчика идёт последним оператором транзакции, так что строка
+популярного поста блокируется лишь на время коммита, а новое значение
+возвращается тем же запросом (RETURNING), без отдельного COUNT.
+
+Лайки, созданные или удалённые через ORM (админка, каскадное удаление),
+учитываются в счётчиках обработчиками сигналов в core/signals.py.
+"""
+from django.db import connections, router, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from . import feed, model_cache
+from .counters import adjust_counter
+from .models import Comment, Like, Post
+
+
+def _target_column(target):
+    if isinstance(target, Post):
+        return 'post_id'
+    if isinstance(target, Comment):
+        return 'comment_id'
+    raise TypeError(f'Лайк нельзя поставить объекту {type(target).__name__}')
+
+
+def adjust_likes_count(model, pk, delta):
+    if model is Post:
+        model_cache.invalidate(Post, pk)
+    return adjust_counter(model, pk, 'likes_count', delta)
+
+
+def _current_count(target):
+    return type(target).objects.filter(pk=target.pk).values_list('likes_count', flat=True).first()
+
+
+def _changed(target):
+    if isinstance(target, Post):
+        feed.bump_card_version(target.pk)
+
+
+def _write_connection():
+    # Через роутер, как у save(): запись закрепляет запрос за основной БД
+    return connections[router.db_for_write(Like)]
+
+
+def like(user, target):
+    """Ставит лайк. Возвращает (создан ли лайк, новое число лайков)."""
+    column = _target_column(target)
+    connection = _write_connection()
+    table = connection.ops.quote_name(Like._meta.db_table)
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    suffix = connection.ops.on_conflict_suffix_sql(
+        [Like._meta.get_field('user')], OnConflict.IGNORE, None, None
+    )
+
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{insert} {table} (user_id, {column}, created_at) VALUES (%s, %s, %s) {suffix}',
+                [user.pk, target.pk, timezone.now()],
+            )
+            created = cursor.rowcount == 1
+        count = adjust_likes_count(type(target), target.pk, 1) if created else _current_count(target)
+
+    if created:
+        transaction.on_commit(lambda: _changed(target), using=connection.alias)
+    return created, count
+
+
+def unlike(user, target):
+    """Снимает лайк. Возвращает (был ли лайк удалён, новое число лайков)."""
+    column = _target_column(target)
+    connection = _write_connection()
+    table = connection.ops.quote_name(Like._meta.db_table)
+
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE user_id = %s AND {column} = %s',
+                [user.pk, target.pk],
+            )
+            deleted = cursor.rowcount
+        count = adjust_likes_count(type(target), target.pk, -deleted) if deleted else _current_count(target)
+
+    if deleted:
+        transaction.on_commit(lambda: _changed(target), using=connection.alias)
+    return bool(deleted), count
+
+
+def toggle(user, target):
+    """Переключает лайк. Возвращает (стоит ли теперь лайк, новое число лайков)."""
+    created, count = like(user, target)
+    if created:
+        return True, count
+    _, count = unlike(user, target)
+    return False, count
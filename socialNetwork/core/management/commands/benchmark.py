@@ -0,0 +1,524 @@
+import copy
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import OperationalError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.db.models import Max
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.request import Request
+
+from core import comments
+from core.memberships import MEMBERS_ORDERING
+from core.models import Comment, Community, Media, Post, User, UserCommunity
+from core.storage import release
+from core.pagination import KeysetPagination, RowGreaterThan
+
+BENCH_EMAIL_DOMAIN = 'bench.invalid'
+BENCH_COMMUNITY_NAME = 'Benchmark community'
+BENCH_POST_CONTENT = 'Benchmark post'
+CONTENTION_TABLE = 'benchmark_contention'
+
+
+def contention_worker(settings_dict, role, rows, duration, results):
+    """Процесс замера sqlite: читает диапазоны или обновляет строки в транзакциях."""
+    alias = 'benchmark_contention'
+    connections.settings[alias] = settings_dict
+    db = connections[alias]
+    timings, errors = [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        row_id = random.randint(1, rows)
+        started = time.perf_counter()
+        try:
+            if role == 'reader':
+                with db.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT COUNT(*), SUM(value) FROM {CONTENTION_TABLE} WHERE id BETWEEN %s AND %s',
+                        [row_id, row_id + 100],
+                    )
+                    cursor.fetchone()
+            else:
+                # Как типичный view: прочитать, затем записать в одной транзакции
+                with transaction.atomic(using=alias), db.cursor() as cursor:
+                    cursor.execute(f'SELECT value FROM {CONTENTION_TABLE} WHERE id = %s', [row_id])
+                    value = cursor.fetchone()[0]
+                    cursor.execute(
+                        f'UPDATE {CONTENTION_TABLE} SET value = %s WHERE id = %s', [value + 1, row_id]
+                    )
+        except OperationalError:
+            errors += 1
+            continue
+        timings.append(time.perf_counter() - started)
+    db.close()
+    results.put((role, timings, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными и замеряет время запросов. '
+        'Запускайте на отдельной базе (DB_NAME=...), данные не удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=['members', 'comments', 'connections', 'sqlite', 'routes', 'uploads'], help='Что замерять')
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=1_000_000,
+            help=(
+                'Объём синтетических данных (по умолчанию 1 000 000); '
+                'для connections — число запросов в каждом режиме, '
+                'для sqlite — число строк в тестовой таблице, '
+                'для routes — число постов пользователя, '
+                'для uploads — размер загружаемого файла в MB'
+            )
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз повторять каждый запрос (по умолчанию 20)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10_000,
+            help='Размер пачки при заполнении (по умолчанию 10 000)'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Число параллельных потоков для connections (по умолчанию 8)'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=8,
+            help='Число процессов для sqlite, четверть из них пишет (по умолчанию 8)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5,
+            help='Длительность замера sqlite в каждом профиле, секунды (по умолчанию 5)'
+        )
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.batch_size = options['batch_size']
+        self.threads = options['threads']
+        self.processes = options['processes']
+        self.duration = options['duration']
+        getattr(self, f'bench_{options["target"]}')(options['size'])
+
+    def measure(self, label, func):
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.stdout.write(
+            f'  {label}: медиана {timings[len(timings) // 2] * 1000:.2f} мс, '
+            f'максимум {timings[-1] * 1000:.2f} мс'
+        )
+
+    def api_request(self, **params):
+        return Request(RequestFactory().get('/', params))
+
+    def seed_users(self, size):
+        existing = User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').count()
+        for start in range(existing, size, self.batch_size):
+            end = min(start + self.batch_size, size)
+            User.objects.bulk_create([
+                User(
+                    email=f'user{i}@{BENCH_EMAIL_DOMAIN}',
+                    username=f'bench_user{i}',
+                    first_name='Bench',
+                    last_name=str(i),
+                    password='!',
+                )
+                for i in range(start, end)
+            ])
+            self.stdout.write(f'  пользователей: {end}/{size}', ending='\r')
+        self.stdout.write('')
+        return User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').order_by('pk')
+
+    def bench_members(self, size):
+        self.stdout.write(f'Заполнение: сообщество на {size} участников')
+        users = self.seed_users(size)
+        owner = users.first()
+        community, _ = Community.objects.get_or_create(
+            name=BENCH_COMMUNITY_NAME,
+            defaults={'owner': owner, 'type': 'open'}
+        )
+
+        present = UserCommunity.objects.filter(community=community).count()
+        user_ids = users.values_list('pk', flat=True)[present:size]
+        batch = []
+        for index, user_id in enumerate(user_ids.iterator(chunk_size=self.batch_size), start=present):
+            # Примерно 0,1% администраторов и 1% модераторов
+            role = 'admin' if index % 1000 == 0 else 'moderator' if index % 100 == 0 else 'member'
+            batch.append(UserCommunity(user_id=user_id, community=community, role=role))
+            if len(batch) == self.batch_size:
+                with transaction.atomic():
+                    UserCommunity.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            UserCommunity.objects.bulk_create(batch)
+        total = UserCommunity.objects.filter(community=community).count()
+        Community.objects.filter(pk=community.pk).update(members_count=total)
+        self.stdout.write(f'  участников: {total}')
+        if total < 2:
+            raise CommandError('Слишком мало участников для замера')
+
+        memberships = UserCommunity.objects.filter(community=community).select_related('user')
+        paginator = KeysetPagination(ordering=MEMBERS_ORDERING)
+
+        # Курсор примерно на 90% списка
+        deep = memberships.order_by(*MEMBERS_ORDERING)[int(total * 0.9)]
+        deep_cursor = paginator.encode_cursor(deep)
+
+        self.stdout.write('Замеры (50 участников на страницу):')
+        self.measure('первая страница', lambda: paginator.paginate_queryset(memberships, self.api_request()))
+        self.measure(
+            'страница на 90% списка (курсор)',
+            lambda: paginator.paginate_queryset(memberships, self.api_request(cursor=deep_cursor))
+        )
+        self.measure(
+            'та же страница через OFFSET',
+            lambda: list(memberships.order_by(*MEMBERS_ORDERING)[int(total * 0.9):int(total * 0.9) + 50])
+        )
+        self.measure(
+            'только модераторы',
+            lambda: paginator.paginate_queryset(
+                memberships.filter(role_priority=UserCommunity.ROLE_PRIORITIES['moderator']), self.api_request()
+            )
+        )
+
+        self.stdout.write('План запроса для страницы по курсору:')
+        plan = (
+            memberships.filter(RowGreaterThan(MEMBERS_ORDERING, paginator.decode_cursor(deep_cursor)))
+            .order_by(*MEMBERS_ORDERING)[:51]
+            .explain()
+        )
+        self.stdout.write(plan)
+
+    def bench_comments(self, size):
+        self.stdout.write(f'Заполнение: пост с {size} комментариями')
+        authors = list(self.seed_users(min(size, 1000)))
+        post, _ = Post.objects.get_or_create(content=BENCH_POST_CONTENT, defaults={'author': authors[0]})
+
+        present = Comment.objects.filter(post=post).count()
+        if present < size:
+            # Случайное дерево: примерно треть комментариев — ответы верхнего уровня
+            next_pk = (Comment.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+            known = list(Comment.objects.filter(post=post).values_list('pk', 'path', 'depth'))
+            batch = []
+            for _ in range(size - present):
+                parent = random.choice(known) if known and random.random() > 0.3 else None
+                if parent and parent[2] >= comments.MAX_DEPTH:
+                    parent = None
+                path = (parent[1] if parent else '') + comments.encode_segment(next_pk)
+                depth = parent[2] + 1 if parent else 0
+                batch.append(Comment(
+                    pk=next_pk, post=post, author=random.choice(authors),
+                    parent_id=parent[0] if parent else None,
+                    content='Комментарий', path=path, depth=depth,
+                ))
+                known.append((next_pk, path, depth))
+                next_pk += 1
+                if len(batch) == self.batch_size:
+                    Comment.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                Comment.objects.bulk_create(batch)
+            # id заданы явно (path строится из id): последовательность
+            # PostgreSQL нужно сдвинуть, иначе следующий INSERT получит занятый id
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Comment]):
+                    cursor.execute(sql)
+        total = Comment.objects.filter(post=post).count()
+        self.stdout.write(f'  комментариев: {total}')
+
+        def load_by_parent_links():
+            # Прежний способ: корни и ответы каждого узла отдельными запросами
+            def walk(nodes):
+                for node in nodes:
+                    walk(node.replies.select_related('author').all())
+            walk(Comment.objects.filter(post=post, parent__isnull=True).select_related('author'))
+
+        old_queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal old_queries
+            old_queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            load_by_parent_links()
+
+        first = comments.load_thread(post)
+        deep_after = Comment.objects.filter(post=post).order_by('path').values_list('path', flat=True)[int(total * 0.9)]
+        busiest = (
+            Comment.objects.filter(post=post, parent__isnull=True)
+            .order_by('-pk').first()
+        )
+
+        self.stdout.write(f'Замеры (окно {comments.get_page_size()} комментариев, {comments.get_display_depth()} уровней):')
+        self.measure(
+            'первое окно ветки', lambda: comments.load_thread(post)
+        )
+        self.measure(
+            'окно на 90% ветки (курсор)', lambda: comments.load_thread(post, after=deep_after)
+        )
+        if busiest is not None:
+            self.measure(
+                'поддерево одного комментария', lambda: comments.load_thread(post, root=busiest)
+            )
+        self.measure(
+            'вся ветка по path',
+            lambda: comments.load_thread(post, limit=total, max_depth=comments.MAX_DEPTH)
+        )
+        self.repeat, repeat = 1, self.repeat
+        self.measure(f'вся ветка по ссылкам на родителя ({old_queries} запросов)', load_by_parent_links)
+        self.repeat = repeat
+        self.stdout.write(f'  в первом окне: {len(first.nodes)} комментариев, курсор: {first.next_cursor}')
+
+        self.stdout.write('План запроса для окна по курсору:')
+        plan = (
+            Comment.objects.filter(post=post, path__gt=deep_after, depth__lte=comments.get_display_depth())
+            .order_by('path')[:comments.get_page_size() + 1]
+            .explain()
+        )
+        self.stdout.write(plan)
+
+    def bench_connections(self, size):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Замер подключений имеет смысл только для PostgreSQL (DB_ENGINE)')
+
+        base = connections['default'].settings_dict
+        modes = [
+            ('новое подключение на запрос', 0, None),
+            ('постоянные подключения', None, None),
+        ]
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            self.stdout.write(self.style.WARNING('psycopg_pool не установлен, пул не замеряется'))
+        else:
+            modes.append(('пул psycopg', 0, {'min_size': self.threads, 'max_size': self.threads}))
+
+        per_thread = max(1, size // self.threads)
+        self.stdout.write(
+            f'Замеры ({self.threads} потоков по {per_thread} запросов, '
+            'каждый запрос — SELECT 1 с закрытием подключения как в конце HTTP-запроса):'
+        )
+        for index, (label, max_age, pool) in enumerate(modes):
+            settings_dict = copy.deepcopy(base)
+            settings_dict['CONN_MAX_AGE'] = max_age
+            settings_dict['OPTIONS'].pop('pool', None)
+            if pool:
+                settings_dict['OPTIONS']['pool'] = pool
+            alias = f'benchmark_{index}'
+            timings = []
+            lock = threading.Lock()
+
+            def worker():
+                wrapper = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+                local = []
+                try:
+                    for _ in range(per_thread):
+                        started = time.perf_counter()
+                        with wrapper.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                            cursor.fetchone()
+                        # То же, что делает обработчик request_finished
+                        wrapper.close_if_unusable_or_obsolete()
+                        local.append(time.perf_counter() - started)
+                finally:
+                    wrapper.close()
+                with lock:
+                    timings.extend(local)
+
+            workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+            started = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            if pool:
+                # Пул общий для всех подключений с одним alias
+                load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias).close_pool()
+
+            timings.sort()
+            self.stdout.write(
+                f'  {label}: {len(timings) / elapsed:.0f} запросов/с, '
+                f'медиана {timings[len(timings) // 2] * 1000:.2f} мс, '
+                f'максимум {timings[-1] * 1000:.2f} мс'
+            )
+
+    def bench_sqlite(self, size):
+        profiles = [
+            ('по умолчанию', {}),
+            ('SQLITE_TUNED', settings.SQLITE_TUNED_OPTIONS),
+        ]
+        writers = max(1, self.processes // 4)
+        roles = ['writer'] * writers + ['reader'] * (self.processes - writers)
+        context = multiprocessing.get_context('fork')
+
+        self.stdout.write(
+            f'Замеры ({len(roles) - writers} читателей и {writers} писателей, '
+            f'{self.duration:g} с, {size} строк):'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for index, (label, options) in enumerate(profiles):
+                path = os.path.join(directory, f'contention_{index}.sqlite3')
+                with sqlite3.connect(path) as db:
+                    db.execute(f'CREATE TABLE {CONTENTION_TABLE} (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+                    db.executemany(
+                        f'INSERT INTO {CONTENTION_TABLE} (id, value) VALUES (?, 0)',
+                        ((i,) for i in range(1, size + 1)),
+                    )
+                db.close()
+
+                settings_dict = copy.deepcopy(connections['default'].settings_dict)
+                settings_dict.update({
+                    'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': path,
+                    'OPTIONS': copy.deepcopy(options),
+                    'CONN_MAX_AGE': None,
+                })
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=contention_worker,
+                        args=(settings_dict, role, size, self.duration, results),
+                    )
+                    for role in roles
+                ]
+                for worker in workers:
+                    worker.start()
+                collected = [results.get() for _ in workers]
+                for worker in workers:
+                    worker.join()
+
+                self.stdout.write(f'  {label}:')
+                for role, name in (('reader', 'чтение'), ('writer', 'запись')):
+                    timings = sorted(t for r, items, _ in collected if r == role for t in items)
+                    errors = sum(e for r, _, e in collected if r == role)
+                    if not timings:
+                        self.stdout.write(f'    {name}: 0 операций, ошибок "database is locked": {errors}')
+                        continue
+                    self.stdout.write(
+                        f'    {name}: {len(timings) / self.duration:.0f} операций/с, '
+                        f'медиана {timings[len(timings) // 2] * 1000:.2f} мс, '
+                        f'p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} мс, '
+                        f'ошибок "database is locked": {errors}'
+                    )
+
+    def bench_routes(self, size):
+        user, _ = User.objects.get_or_create(
+            email=f'routes@{BENCH_EMAIL_DOMAIN}',
+            defaults={'username': 'bench_routes', 'first_name': 'Bench', 'last_name': 'Routes', 'password': '!'}
+        )
+        present = Post.objects.filter(author=user).count()
+        Post.objects.bulk_create([
+            Post(author=user, content=BENCH_POST_CONTENT, is_published=True)
+            for _ in range(present, size)
+        ])
+        urls = ['/', '/posts/', f'/users/{user.pk}/', '/communities/', '/api/posts/']
+        configurations = [
+            ('сессии в БД, ModelBackend', {
+                'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+                'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+            }),
+            ('текущие настройки', {}),
+        ]
+        for label, overrides in configurations:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **overrides):
+                client = Client()
+                client.force_login(user, backend=settings.AUTHENTICATION_BACKENDS[0])
+                self.stdout.write(f'{label}:')
+                for url in urls:
+                    client.get(url)  # прогрев кэшей
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url)
+                    self.measure(f'{url} ({len(queries)} запросов к БД)', lambda: client.get(url))
+
+    def bench_uploads(self, size):
+        if size > 100_000:
+            raise CommandError('Для uploads --size задаёт размер файла в MB, например --size 1024')
+        user, _ = User.objects.get_or_create(
+            email=f'uploads@{BENCH_EMAIL_DOMAIN}',
+            defaults={'username': 'bench_uploads', 'first_name': 'Bench', 'last_name': 'Uploads', 'password': '!'}
+        )
+        chunk_size = settings.UPLOAD_MAX_CHUNK_SIZE
+        total = size * 1024 * 1024
+        # Один случайный блок на все части: генерация данных не входит в замер
+        block = os.urandom(chunk_size)
+
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            UPLOAD_MAX_SIZE=max(settings.UPLOAD_MAX_SIZE, total),
+        ):
+            client = Client()
+            client.force_login(user, backend=settings.AUTHENTICATION_BACKENDS[0])
+            response = client.post(
+                '/api/uploads/',
+                {'type': 'video', 'original_name': 'benchmark.bin', 'total_size': total},
+                content_type='application/json',
+            )
+            if response.status_code != 201:
+                raise CommandError(f'Не удалось создать сессию загрузки: {response.content.decode()}')
+            upload_url = f'/api/uploads/{response.json()["id"]}/'
+
+            timings = []
+            started = time.perf_counter()
+            for start in range(0, total, chunk_size):
+                end = min(start + chunk_size, total) - 1
+                chunk_started = time.perf_counter()
+                response = client.put(
+                    f'{upload_url}chunk/', block[:end - start + 1],
+                    content_type='application/octet-stream',
+                    headers={'Content-Range': f'bytes {start}-{end}/{total}'},
+                )
+                if response.status_code != 200:
+                    raise CommandError(f'Часть {start}-{end} не принята: {response.content.decode()}')
+                timings.append(time.perf_counter() - chunk_started)
+            upload_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            response = client.post(f'{upload_url}finalize/')
+            finalize_seconds = time.perf_counter() - started
+            if response.status_code != 201:
+                raise CommandError(f'Не удалось завершить загрузку: {response.content.decode()}')
+
+        timings.sort()
+        self.stdout.write(
+            f'Загрузка {size} MB частями по {chunk_size // (1024 * 1024)} MB: {upload_seconds:.2f} с '
+            f'({size / upload_seconds:.0f} MB/с), часть: медиана {timings[len(timings) // 2] * 1000:.1f} мс, '
+            f'максимум {timings[-1] * 1000:.1f} мс'
+        )
+        self.stdout.write(
+            f'Завершение (копирование в хранилище с хешированием): {finalize_seconds:.2f} с '
+            f'({size / finalize_seconds:.0f} MB/с)'
+        )
+
+        # Гигабайтный файл не оставляем, в отличие от строк остальных замеров
+        media = Media.objects.get(pk=response.json()['id'])
+        file_name = media.file.name
+        media.delete()
+        release(media.file.storage, file_name)
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
+from core import model_cache
 from core.models import User
 
 
@@ -47,7 +48,9 @@ class Command(BaseCommand):
             if count > 10:
                 self.stdout.write(f'  ... и еще {count - 10} пользователей')
         else:
+            model_cache.warn_if_not_shared('cleanup_inactive_users')
             inactive_users.update(is_active=False)
+            model_cache.invalidate_namespace(User)
             self.stdout.write(
                 self.style.SUCCESS(
                     f'Деактивировано {count} пользователей'
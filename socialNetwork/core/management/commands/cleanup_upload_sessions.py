@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import uploads
+
+
+class Command(BaseCommand):
+    help = 'Прерывает брошенные загрузки частями и удаляет их временные файлы'
+
+    def handle(self, *args, **options):
+        expired = uploads.expire_sessions()
+        removed, freed = uploads.remove_orphan_files(min_age=settings.UPLOAD_SESSION_TTL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прервано сессий: {expired}; удалено временных файлов без сессии: '
+            f'{removed} ({freed / 1024 / 1024:.2f} MB)'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Media
+from core.storage import BLOB_PREFIX, content_addressed_storage, release
+
+
+class Command(BaseCommand):
+    help = 'Переносит существующие медиафайлы в хранилище blobs/ с устранением дубликатов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-originals',
+            action='store_true',
+            help='Не удалять исходные файлы после переноса'
+        )
+
+    def migrate_file(self, media, field_name, keep_originals):
+        field_file = getattr(media, field_name)
+        old_name = field_file.name
+        if not old_name or old_name.startswith(f'{BLOB_PREFIX}/'):
+            return False
+        if not field_file.storage.exists(old_name):
+            self.stdout.write(self.style.WARNING(f'  Файл не найден: {old_name}'))
+            return False
+
+        with field_file.storage.open(old_name, 'rb') as source:
+            new_name = content_addressed_storage.save(old_name, source)
+        Media.objects.filter(pk=media.pk).update(**{field_name: new_name})
+        if not keep_originals:
+            release(field_file.storage, old_name)
+        return True
+
+    def handle(self, *args, **options):
+        moved = 0
+        for media in Media.objects.order_by('pk').iterator(chunk_size=500):
+            for field_name in ('file', 'thumbnail'):
+                if self.migrate_file(media, field_name, options['keep_originals']):
+                    moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Перенесено файлов: {moved}'))
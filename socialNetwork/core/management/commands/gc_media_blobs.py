@@ -0,0 +1,52 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.storage import BLOB_PREFIX, content_addressed_storage, referenced_names
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы хранилища blobs/, на которые не ссылается ни один медиафайл'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=60,
+            help='Не трогать файлы моложе N минут (загрузки в процессе), по умолчанию 60'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать количество файлов без удаления'
+        )
+
+    def handle(self, *args, **options):
+        root = content_addressed_storage.path(BLOB_PREFIX)
+        if not os.path.isdir(root):
+            self.stdout.write('Хранилище blobs/ пусто')
+            return
+
+        referenced = referenced_names()
+        cutoff = time.time() - options['grace_minutes'] * 60
+        removed = 0
+        freed = 0
+
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, content_addressed_storage.location).replace(os.sep, '/')
+                if name in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                size = os.path.getsize(path)
+                if not options['dry_run']:
+                    os.remove(path)
+                removed += 1
+                freed += size
+
+        message = f'файлов {removed}, {freed / 1024 / 1024:.2f} MB'
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Режим проверки: будет удалено {message}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Удалено {message}'))
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from core import likes
+from core.models import Like, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка лайков: много потоков одновременно ставят и снимают '
+        'лайки одного поста, после чего счётчик сверяется с таблицей лайков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('post_id', type=int, help='ID «горячего» поста')
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=50,
+            help='Сколько пользователей участвует (по умолчанию 50)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Количество потоков (по умолчанию 16)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Общее количество запросов (по умолчанию 2000)'
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.filter(pk=options['post_id']).first()
+        if post is None:
+            raise CommandError(f'Пост #{options["post_id"]} не найден')
+
+        users = list(User.objects.order_by('pk')[:options['users']])
+        if not users:
+            raise CommandError('В базе нет пользователей')
+
+        # Каждый пользователь кликает несколько раз подряд, как при двойном клике
+        operations = [
+            (random.choice(users), random.choice((likes.like, likes.unlike, likes.toggle)))
+            for _ in range(options['requests'])
+        ]
+
+        def run(operation):
+            user, func = operation
+            started = time.perf_counter()
+            try:
+                func(user, post)
+                error = None
+            except OperationalError as exc:
+                error = str(exc)
+            finally:
+                connection.close()
+            return time.perf_counter() - started, error
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(run, operations))
+        elapsed = time.perf_counter() - started
+
+        durations = sorted(duration for duration, _ in results)
+        errors = [error for _, error in results if error]
+        p95 = durations[int(len(durations) * 0.95) - 1] if len(durations) >= 20 else durations[-1]
+
+        self.stdout.write(f'Запросов: {len(results)} за {elapsed:.2f} с ({len(results) / elapsed:.0f} в секунду)')
+        self.stdout.write(
+            f'Задержка: медиана {statistics.median(durations) * 1000:.1f} мс, '
+            f'p95 {p95 * 1000:.1f} мс, максимум {durations[-1] * 1000:.1f} мс'
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Ошибок БД: {len(errors)} (например: {errors[0]})'))
+
+        post.refresh_from_db(fields=['likes_count'])
+        actual = Like.objects.filter(post=post).count()
+        if post.likes_count != actual:
+            raise CommandError(f'Счётчик разошёлся с таблицей: likes_count={post.likes_count}, лайков={actual}')
+        self.stdout.write(self.style.SUCCESS(f'Счётчик совпадает с таблицей лайков: {actual}'))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import history_maintenance
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие и избыточные записи истории изменений порциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Размер порции удаления (по умолчанию 5000)'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Пауза между порциями в секундах'
+        )
+        parser.add_argument(
+            '--compact-days',
+            type=int,
+            default=None,
+            help='Сжимать только записи за последние N дней (по умолчанию все)'
+        )
+        parser.add_argument(
+            '--no-compact',
+            action='store_true',
+            help='Не удалять записи, отличающиеся только счетчиками'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать количество записей без удаления'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        pause = options['pause']
+        since = None
+        if options['compact_days'] is not None:
+            since = timezone.now() - timedelta(days=options['compact_days'])
+
+        for model, days in history_maintenance.get_retention_policy().items():
+            label = model.history.model._meta.verbose_name_plural
+            expired = history_maintenance.expired_records(model, days)
+
+            if options['dry_run']:
+                redundant = 0
+                if not options['no_compact']:
+                    redundant = len(history_maintenance.redundant_record_ids(model, since=since))
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'{label}: устаревших {expired.count()}, избыточных {redundant}'
+                    )
+                )
+                continue
+
+            deleted = history_maintenance.delete_in_chunks(expired, chunk_size=chunk_size, pause=pause)
+            compacted = 0
+            if not options['no_compact']:
+                compacted = history_maintenance.compact(model, since=since, chunk_size=chunk_size, pause=pause)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{label}: удалено устаревших {deleted}, сжато {compacted}'
+                )
+            )
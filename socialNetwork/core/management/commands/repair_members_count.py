@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core import model_cache
+from core.models import Community, UserCommunity
+
+
+class Command(BaseCommand):
+    help = 'Сверяет Community.members_count с таблицей участников и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        actual = Coalesce(
+            Subquery(
+                UserCommunity.objects.filter(community=OuterRef('pk')).order_by()
+                .values('community').annotate(total=Count('*')).values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+        drifted = (
+            Community.objects.annotate(actual_count=actual)
+            .exclude(members_count=F('actual_count'))
+            .values_list('pk', 'name', 'members_count', 'actual_count')
+        )
+
+        if not options['dry_run']:
+            model_cache.warn_if_not_shared('repair_members_count')
+
+        fixed = 0
+        for pk, name, stored, counted in drifted.iterator(chunk_size=1000):
+            self.stdout.write(f'  {name} (#{pk}): {stored} -> {counted}')
+            if not options['dry_run']:
+                # Пересчёт в самом UPDATE учитывает вступления после чтения
+                Community.objects.filter(pk=pk).update(members_count=actual)
+                model_cache.invalidate(Community, pk)
+            fixed += 1
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Сообществ с расхождением: {fixed}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено сообществ: {fixed}'))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import history_maintenance
+
+
+class Command(BaseCommand):
+    help = 'Создает будущие и удаляет устаревшие партиции таблиц истории (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='На сколько месяцев вперед создавать партиции (по умолчанию 3)'
+        )
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Преобразовать непартиционированные таблицы истории'
+        )
+        parser.add_argument(
+            '--keep-expired',
+            action='store_true',
+            help='Не удалять партиции и записи старше срока хранения'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Размер порции удаления устаревших записей из партиции _legacy (по умолчанию 5000)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Партиционирование поддерживается только на PostgreSQL')
+
+        for model, days in history_maintenance.get_retention_policy().items():
+            table = model.history.model._meta.db_table
+
+            with connection.cursor() as cursor:
+                partitioned = history_maintenance.is_partitioned(cursor, table)
+            if not partitioned:
+                if not options['convert']:
+                    self.stdout.write(
+                        self.style.WARNING(f'{table}: таблица не партиционирована, используйте --convert')
+                    )
+                    continue
+                # CHECK и индекс строятся без блокировки записи, вне транзакции
+                boundary = history_maintenance.legacy_boundary()
+                history_maintenance.prepare_conversion(table, boundary)
+                with transaction.atomic(), connection.cursor() as cursor:
+                    history_maintenance.convert_to_partitioned(cursor, table, boundary)
+                self.stdout.write(f'{table}: таблица преобразована')
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                created = history_maintenance.create_partitions(cursor, table, options['months_ahead'])
+            dropped, deleted = [], 0
+            if not options['keep_expired']:
+                dropped = history_maintenance.drop_expired_partitions(table, days)
+                # Оставшиеся устаревшие записи лежат в партиции _legacy
+                deleted = history_maintenance.delete_in_chunks(
+                    history_maintenance.expired_records(model, days), chunk_size=options['chunk_size']
+                )
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{table}: создано партиций {len(created)}, удалено партиций {len(dropped)}, '
+                    f'удалено записей {deleted}'
+                )
+            )
@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import model_cache
+from core.media_processing import process_media
+from core.models import Media
+
+
+def init_worker():
+    django.setup()
+    # Соединения, унаследованные от родительского процесса, использовать нельзя
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает загруженные медиафайлы: MIME-тип, EXIF, миниатюры и варианты размеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Количество процессов-воркеров (по умолчанию 2)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Сколько файлов забирать из очереди за раз (по умолчанию 50)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Пауза между опросами пустой очереди в секундах'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать текущую очередь и завершиться'
+        )
+
+    def claim_batch(self, batch_size):
+        """
+        Забирает файлы в обработку. Файлы в статусе «processing» дольше
+        MEDIA_PROCESSING_TIMEOUT остались от упавшего или убитого воркера:
+        они забираются снова, а после MEDIA_PROCESSING_MAX_ATTEMPTS попыток
+        помечаются как «failed», чтобы один файл не ронял воркеры бесконечно.
+        """
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=settings.MEDIA_PROCESSING_TIMEOUT)
+        with transaction.atomic():
+            stale = Media.objects.select_for_update(skip_locked=True).filter(
+                status='processing', claimed_at__lt=stale_before
+            )
+            stale.filter(attempts__gte=settings.MEDIA_PROCESSING_MAX_ATTEMPTS).update(status='failed')
+            ids = list(stale.order_by('claimed_at').values_list('id', flat=True)[:batch_size])
+            if len(ids) < batch_size:
+                ids += list(
+                    Media.objects.select_for_update(skip_locked=True)
+                    .filter(status='pending')
+                    .order_by('created_at')
+                    .values_list('id', flat=True)[:batch_size - len(ids)]
+                )
+            Media.objects.filter(id__in=ids).update(status='processing', claimed_at=now, attempts=F('attempts') + 1)
+        return ids
+
+    def handle(self, *args, **options):
+        # Обработанный файл сбрасывает кэш поста (core/signals.py)
+        model_cache.warn_if_not_shared('run_media_workers')
+
+        # Перед созданием процессов закрываем соединения, чтобы дочерние
+        # процессы не использовали общий сокет БД
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+            while True:
+                ids = self.claim_batch(options['batch_size'])
+                if not ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                statuses = list(executor.map(process_media, ids))
+                failed = statuses.count('failed')
+                self.stdout.write(
+                    self.style.SUCCESS(f'Обработано файлов: {len(ids) - failed}, с ошибками: {failed}')
+                )
@@ -0,0 +1,148 @@
+"""
+Фоновая обработка загруженных медиафайлов (manage.py run_media_workers).
+
+Для каждого Media в статусе «pending» воркер определяет MIME-тип по
+содержимому, а для изображений дополнительно удаляет EXIF, создаёт
+миниатюру и уменьшенные варианты в WebP и JPEG. Шаблоны и API отдают
+наименьший подходящий вариант вместо оригинала.
+"""
+import logging
+import mimetypes
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import release
+
+logger = logging.getLogger(__name__)
+
+# Сигнатуры не-графических форматов: (смещение, байты, MIME)
+SIGNATURES = [
+    (0, b'%PDF', 'application/pdf'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'\x1a\x45\xdf\xa3', 'video/webm'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'PK\x03\x04', 'application/zip'),
+]
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def get_variant_widths():
+    return getattr(settings, 'MEDIA_VARIANT_WIDTHS', (320, 640, 1280))
+
+
+def get_thumbnail_size():
+    return getattr(settings, 'MEDIA_THUMBNAIL_SIZE', (200, 200))
+
+
+def sniff_mime_type(header, filename=None):
+    """Определяет MIME-тип по первым байтам файла, затем по расширению."""
+    try:
+        image = Image.open(BytesIO(header))
+        if image.format:
+            return Image.MIME.get(image.format)
+    except (UnidentifiedImageError, OSError):
+        pass
+    for offset, signature, mime_type in SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return mime_type
+    if filename:
+        return mimetypes.guess_type(filename)[0]
+    return None
+
+
+def _encode(image, fmt):
+    pil_format, options = VARIANT_FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _strip_metadata(image):
+    """Поворачивает изображение по EXIF и возвращает копию без метаданных."""
+    image = ImageOps.exif_transpose(image)
+    clean = Image.new(image.mode, image.size)
+    if image.mode in ('P', 'PA'):
+        # Новое изображение создаётся с пустой палитрой: без неё индексы
+        # цветов превратились бы в чёрный
+        clean.putpalette(image.palette.tobytes(), image.palette.mode)
+    clean.paste(image)
+    if 'transparency' in image.info:
+        clean.info['transparency'] = image.info['transparency']
+    return clean
+
+
+def process_image(media, image):
+    storage = media.file.storage
+    base, ext = os.path.splitext(os.path.basename(media.file.name))
+    image.load()
+    source_format = image.format
+    clean = _strip_metadata(image)
+
+    # Оригинал перезаписывается без EXIF (в т.ч. без геометок)
+    if source_format in ('JPEG', 'PNG', 'WEBP'):
+        buffer = BytesIO()
+        clean.save(buffer, source_format, **({'quality': 95} if source_format == 'JPEG' else {}))
+        old_name = media.file.name
+        media.file.save(f'{base}{ext}', ContentFile(buffer.getvalue()), save=False)
+        # Тот же blob может использоваться другими строками Media, а при
+        # совпавшем содержимом — и этой же строкой
+        if media.file.name != old_name:
+            release(storage, old_name, exclude_pk=media.pk)
+        media.size = len(buffer.getvalue())
+
+    media.width, media.height = clean.size
+
+    thumbnail = ImageOps.fit(clean, get_thumbnail_size())
+    media.thumbnail.save(f'{base}_thumb.jpg', ContentFile(_encode(thumbnail, 'jpeg')), save=False)
+
+    variants = {}
+    variants_dir = f'variants/{media.created_at:%Y/%m/%d}'
+    for width in get_variant_widths():
+        if width >= clean.width:
+            break
+        height = round(clean.height * width / clean.width)
+        resized = clean.resize((width, height), Image.LANCZOS)
+        variants[str(width)] = {
+            fmt: storage.save(f'{variants_dir}/{base}_{width}.{fmt}', ContentFile(_encode(resized, fmt)))
+            for fmt in VARIANT_FORMATS
+        }
+    media.variants = variants
+
+
+def process_media(media_id):
+    """Обрабатывает один Media. Выполняется в процессе-воркере."""
+    from .models import Media
+
+    media = Media.objects.filter(pk=media_id).first()
+    if media is None:
+        return None
+
+    try:
+        with media.file.open('rb') as f:
+            header = f.read(2048)
+        media.mime_type = sniff_mime_type(header, media.original_name or media.file.name)
+
+        if media.mime_type and media.mime_type.startswith('image/'):
+            with media.file.open('rb') as f:
+                data = f.read()
+            with Image.open(BytesIO(data)) as image:
+                process_image(media, image)
+        media.status = 'ready'
+    except Exception:
+        logger.exception('Не удалось обработать медиафайл #%s', media_id)
+        media.status = 'failed'
+
+    media.save(update_fields=['file', 'thumbnail', 'mime_type', 'size', 'width', 'height', 'variants', 'status'])
+    return media.status
@@ -0,0 +1,121 @@
+"""
+Отдача медиафайлов: HTTP Range, ETag и долгое кэширование.
+
+Имена в хранилище blobs/ и уменьшенные варианты не меняют содержимого,
+поэтому отдаются с ``Cache-Control: immutable``. Передача файла либо
+перекладывается на веб-сервер (X-Accel-Redirect / X-Sendfile), либо идёт
+через FileResponse, который под gunicorn использует os.sendfile.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.utils.http import parse_etags
+
+from .storage import BLOB_PREFIX, TMP_DIR
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_PREFIXES = (f'{BLOB_PREFIX}/', 'variants/')
+# Недописанные файлы хранилища blobs/ ещё не названы по содержимому
+BLOB_TMP_PREFIX = f'{BLOB_PREFIX}/{TMP_DIR}/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class RangeFile:
+    """Файл, ограниченный диапазоном [start, start + length)."""
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self._file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # gunicorn отправляет через sendfile не больше Content-Length байт
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def is_blob(name):
+    return name.startswith(f'{BLOB_PREFIX}/') and not name.startswith(BLOB_TMP_PREFIX)
+
+
+def is_immutable(name):
+    return name.startswith(IMMUTABLE_PREFIXES) and not name.startswith(BLOB_TMP_PREFIX)
+
+
+def get_etag(name, stat):
+    """
+    Строгий ETag для blobs/ — хеш содержимого из имени. Для остальных
+    файлов — слабый ETag по времени изменения и размеру, без чтения файла:
+    одинаковые mtime и размер не гарантируют одинакового содержимого.
+    """
+    if is_blob(name):
+        return f'"{os.path.splitext(os.path.basename(name))[0]}"'
+    return f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(etag, header):
+    """Слабое сравнение для If-None-Match: W/ не учитывается."""
+    opaque = etag.removeprefix('W/')
+    return any(tag.removeprefix('W/') == opaque for tag in parse_etags(header))
+
+
+def get_content_type(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding:
+        return 'application/octet-stream'
+    return content_type or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """
+    Разбирает одиночный диапазон Range. Возвращает (start, end) включительно,
+    None — если заголовок нужно проигнорировать, или ValueError, если
+    диапазон невыполним.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Несколько диапазонов не поддерживаются: отдаём файл целиком
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError('Пустой диапазон')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Диапазон за пределами файла')
+    return start, min(end, size - 1)
+
+
+def is_latin1(value):
+    """Значение заголовка HTTP должно кодироваться в latin-1."""
+    try:
+        value.encode('latin-1')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def get_sendfile_backend():
+    return getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+
+
+def get_accel_redirect_prefix():
+    return getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
@@ -0,0 +1,134 @@
+"""
+Вступление в сообщества и выход из них.
+
+Строка UserCommunity и счётчик Community.members_count меняются в одной
+транзакции; счётчик — выражением F(), поэтому параллельные вступления не
+теряются. Массовые операции для администраторов пишут участников одним
+bulk_create (или одним DELETE) и корректируют счётчик одним UPDATE.
+Накопившееся расхождение исправляет ``manage.py repair_members_count``.
+
+Первые участники для страницы сообщества (top_members) кэшируются и
+сбрасываются после коммита любого изменения состава.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from . import model_cache
+from .counters import adjust_counter
+from .models import Community, User, UserCommunity
+
+BULK_RETRIES = 3
+# Порядок списка участников; покрыт индексом usercommunity_role_idx
+MEMBERS_ORDERING = ('role_priority', 'joined_at', 'id')
+TOP_MEMBERS_KEY_PREFIX = 'community_top_members:'
+
+
+def get_top_members_size():
+    return getattr(settings, 'COMMUNITY_TOP_MEMBERS_SIZE', 10)
+
+
+def get_top_members_timeout():
+    return getattr(settings, 'COMMUNITY_TOP_MEMBERS_TIMEOUT', 300)
+
+
+def top_members(community):
+    """Первые участники сообщества: администраторы, модераторы, затем старожилы."""
+    key = f'{TOP_MEMBERS_KEY_PREFIX}{community.pk}'
+    members = cache.get(key)
+    if members is None:
+        members = list(
+            UserCommunity.objects.filter(community=community)
+            .select_related('user')
+            .only('role', 'role_priority', 'joined_at', 'community_id',
+                  'user__id', 'user__first_name', 'user__last_name', 'user__avatar')
+            .order_by(*MEMBERS_ORDERING)[:get_top_members_size()]
+        )
+        cache.set(key, members, get_top_members_timeout())
+    return members
+
+
+def invalidate_top_members(community_id):
+    # После коммита, чтобы параллельный запрос не закэшировал старый состав
+    transaction.on_commit(lambda: cache.delete(f'{TOP_MEMBERS_KEY_PREFIX}{community_id}'))
+
+
+def adjust_members_count(community_id, delta):
+    model_cache.invalidate(Community, community_id)
+    return adjust_counter(Community, community_id, 'members_count', delta)
+
+
+def _current_count(community_id):
+    return Community.objects.filter(pk=community_id).values_list('members_count', flat=True).first()
+
+
+def join(user, community, role='member'):
+    """Добавляет пользователя в сообщество. Возвращает (вступил ли, число участников)."""
+    with transaction.atomic():
+        _, created = UserCommunity.objects.get_or_create(
+            user=user,
+            community=community,
+            defaults={'role': role, 'created_by': user}
+        )
+        if created:
+            invalidate_top_members(community.pk)
+            return True, adjust_members_count(community.pk, 1)
+    return False, _current_count(community.pk)
+
+
+def leave(user, community):
+    """Удаляет пользователя из сообщества. Возвращает (вышел ли, число участников)."""
+    with transaction.atomic():
+        deleted, _ = UserCommunity.objects.filter(user=user, community=community).delete()
+        if deleted:
+            invalidate_top_members(community.pk)
+            return True, adjust_members_count(community.pk, -deleted)
+    return False, _current_count(community.pk)
+
+
+def can_manage_members(user, community):
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or community.owner_id == user.pk:
+        return True
+    return UserCommunity.objects.filter(user=user, community=community, role='admin').exists()
+
+
+def add_members(community, user_ids, role='member', created_by=None):
+    """Добавляет пользователей, которых ещё нет в сообществе. Возвращает число добавленных."""
+    user_ids = set(User.objects.filter(pk__in=user_ids, is_active=True).values_list('pk', flat=True))
+
+    for attempt in range(BULK_RETRIES):
+        try:
+            with transaction.atomic():
+                existing = set(
+                    UserCommunity.objects.filter(community=community, user_id__in=user_ids)
+                    .values_list('user_id', flat=True)
+                )
+                new_members = [
+                    UserCommunity(user_id=user_id, community=community, role=role, created_by=created_by)
+                    for user_id in sorted(user_ids - existing)
+                ]
+                UserCommunity.objects.bulk_create(new_members, batch_size=1000)
+                if new_members:
+                    invalidate_top_members(community.pk)
+                    adjust_members_count(community.pk, len(new_members))
+                return len(new_members)
+        except IntegrityError:
+            # Кто-то из списка вступил параллельно — пересчитываем, кого добавлять
+            if attempt == BULK_RETRIES - 1:
+                raise
+
+
+def remove_members(community, user_ids):
+    """Удаляет пользователей из сообщества (кроме владельца). Возвращает число удалённых."""
+    with transaction.atomic():
+        deleted, _ = (
+            UserCommunity.objects.filter(community=community, user_id__in=user_ids)
+            .exclude(user_id=community.owner_id)
+            .delete()
+        )
+        if deleted:
+            invalidate_top_members(community.pk)
+            adjust_members_count(community.pk, -deleted)
+    return deleted
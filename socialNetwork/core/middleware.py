@@ -0,0 +1,61 @@
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import history, presence, routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class PresenceMiddleware:
+    """Отмечает активность авторизованного пользователя на каждом запросе."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            presence.touch(user.pk)
+        return response
+
+
+class HistoryFlushMiddleware:
+    """Записывает накопленную за запрос историю изменений после ответа view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if history.buffering_enabled():
+            history.flush()
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Закрепляет чтение за основной БД для изменяющих запросов и на
+    DB_REPLICA_STICKY_SECONDS секунд после записи (см. core/routers.py).
+    """
+
+    def __init__(self, get_response):
+        if not routers.get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unsafe = request.method not in SAFE_METHODS
+        token = routers.start_request(unsafe or routers.PIN_COOKIE_NAME in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish_request(token)
+        if unsafe or wrote:
+            response.set_cookie(
+                routers.PIN_COOKIE_NAME,
+                '1',
+                max_age=routers.get_sticky_seconds(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:34
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_media_processing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='file',
+            field=models.FileField(storage=core.storage.select_media_storage, upload_to='uploads/%Y/%m/%d/', verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.select_media_storage, upload_to='thumbnails/%Y/%m/%d/', verbose_name='Миниатюра'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['file'], name='media_file_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['thumbnail'], name='media_thumbnail_idx'),
+        ),
+    ]
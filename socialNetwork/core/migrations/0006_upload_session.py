@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:35
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_media_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('image', 'Изображение'), ('video', 'Видео'), ('audio', 'Аудио'), ('document', 'Документ')], default='document', max_length=10, verbose_name='Тип')),
+                ('original_name', models.CharField(max_length=255, verbose_name='Оригинальное имя')),
+                ('total_size', models.BigIntegerField(verbose_name='Размер (байты)')),
+                ('received_size', models.BigIntegerField(default=0, verbose_name='Получено (байты)')),
+                ('status', models.CharField(choices=[('active', 'Загружается'), ('completed', 'Завершена'), ('aborted', 'Прервана')], default='active', max_length=10, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('media', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_session', to='core.media', verbose_name='Медиафайл')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Сессия загрузки',
+                'verbose_name_plural': 'Сессии загрузки',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['owner', 'status'], name='upload_owner_status_idx')],
+            },
+        ),
+    ]
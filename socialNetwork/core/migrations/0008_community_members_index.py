@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_like_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='community',
+            index=models.Index(fields=['-members_count'], name='community_members_idx'),
+        ),
+    ]
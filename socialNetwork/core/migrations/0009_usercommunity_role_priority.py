@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_community_members_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercommunity',
+            name='role_priority',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(role='admin', then=models.Value(0)), models.When(role='moderator', then=models.Value(1)), models.When(role='member', then=models.Value(2)), default=models.Value(2)), output_field=models.PositiveSmallIntegerField(), verbose_name='Приоритет роли'),
+        ),
+        migrations.AddIndex(
+            model_name='usercommunity',
+            index=models.Index(fields=['community', 'role_priority', 'joined_at', 'id'], name='usercommunity_role_idx'),
+        ),
+    ]
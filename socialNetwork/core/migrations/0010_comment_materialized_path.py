@@ -0,0 +1,67 @@
+# Generated by Django 5.1.4 on 2026-10-19 17:48
+
+from django.db import migrations, models
+
+SEGMENT_WIDTH = 8
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = ALPHABET[remainder] + digits
+    return digits.rjust(SEGMENT_WIDTH, '0')
+
+
+def fill_comment_paths(apps, schema_editor):
+    Comment = apps.get_model('core', 'Comment')
+    parents = dict(Comment.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path_of(pk):
+        # Итеративно, чтобы длинные цепочки ответов не упирались в рекурсию
+        chain = []
+        while pk is not None and pk not in paths:
+            chain.append(pk)
+            pk = parents.get(pk)
+        prefix = paths[pk] if pk is not None else ''
+        for node in reversed(chain):
+            prefix += encode_segment(node)
+            paths[node] = prefix
+        return paths[chain[0]] if chain else prefix
+
+    batch = []
+    for pk in parents:
+        path = path_of(pk)
+        batch.append(Comment(pk=pk, path=path, depth=len(path) // SEGMENT_WIDTH - 1))
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ['path', 'depth'])
+            batch = []
+    if batch:
+        Comment.objects.bulk_update(batch, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_usercommunity_role_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(fill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,131 @@
+# Триграммные индексы для поиска в админке (см. core/search.py)
+
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger('core.search')
+
+# Копия core.search на момент миграции: миграция не должна зависеть от
+# будущих изменений кода. {таблица: поля с индексом}
+SEARCH_INDEXES = {
+    'core_user': ('email', 'first_name', 'last_name', 'username', 'phone'),
+    'core_community': ('name', 'description'),
+    'core_post': ('content',),
+    'core_comment': ('content',),
+    'core_message': ('content',),
+}
+
+
+def trigram_index(table, column):
+    return f'{table}_{column}_trgm'
+
+
+def sqlite_fts_sql(table, columns):
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{column_list}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values}); END',
+    ]
+
+
+def sqlite_trigram_supported(connection):
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(value, tokenize='trigram')")
+            cursor.execute('DROP TABLE temp.trigram_probe')
+    except DatabaseError:
+        return False
+    return True
+
+
+def create_sqlite_fts(connection):
+    if not sqlite_trigram_supported(connection):
+        logger.warning('SQLite без токенизатора trigram, таблицы FTS для поиска не созданы')
+        return
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for statement in sqlite_fts_sql(table, columns):
+                cursor.execute(statement)
+            fts = f'{table}_fts'
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def drop_sqlite_fts(connection):
+    with connection.cursor() as cursor:
+        for table in SEARCH_INDEXES:
+            fts = f'{table}_fts'
+            for suffix in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def create_trigram_indexes(connection):
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # Нет прав на расширение: поиск работает, но без индексов
+        logger.warning('Не удалось подключить pg_trgm, триграммные индексы не созданы')
+        return
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                name = trigram_index(table, column)
+                # Невалидный индекс после прерванной постройки строится заново
+                cursor.execute(
+                    'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid',
+                    [name],
+                )
+                if cursor.fetchone():
+                    cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                    f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+
+
+def drop_trigram_indexes(connection):
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {trigram_index(table, column)}')
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        create_trigram_indexes(connection)
+    elif connection.vendor == 'sqlite':
+        create_sqlite_fts(connection)
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        drop_trigram_indexes(connection)
+    elif connection.vendor == 'sqlite':
+        drop_sqlite_fts(connection)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнить в транзакции
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_comment_materialized_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:15
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.utils.text import Truncator
+
+# untracked_fields моделей на момент миграции (см. core/models.py)
+UNTRACKED_FIELDS = {
+    'historicaluser': {'is_online', 'last_seen', 'last_login'},
+    'historicalcommunity': {'members_count'},
+    'historicalpost': {'views_count', 'likes_count'},
+}
+BATCH_SIZE = 1000
+
+
+# Копия core.history.diff_records на момент миграции: миграция не должна
+# зависеть от будущих изменений кода
+def _delta_value(field, record):
+    if getattr(record, field.attname) is None:
+        return None
+    max_chars = getattr(settings, 'HISTORY_DELTA_MAX_CHARS', 200)
+    return Truncator(field.value_to_string(record)).chars(max_chars)
+
+
+def diff_records(fields, previous, record):
+    return {
+        field.name: [_delta_value(field, previous), _delta_value(field, record)]
+        for field in fields
+        if getattr(previous, field.attname) != getattr(record, field.attname)
+    }
+
+
+def fill_history_deltas(apps, schema_editor):
+    # Один проход по истории каждой модели в порядке (объект, запись):
+    # соседние строки — последовательные версии одного объекта. Каждая
+    # порция фиксируется отдельно, чтобы не держать блокировки всей таблицы
+    for model_name, untracked in UNTRACKED_FIELDS.items():
+        HistoricalModel = apps.get_model('core', model_name)
+        fields = [
+            field for field in HistoricalModel._meta.concrete_fields
+            if not field.name.startswith('history_') and field.name not in untracked
+        ]
+        previous, batch = None, []
+        records = HistoricalModel.objects.order_by('id', 'history_id').defer('history_delta')
+        for record in records.iterator(chunk_size=BATCH_SIZE):
+            same_object = previous is not None and previous.id == record.id
+            record.history_delta = diff_records(fields, previous, record) if same_object else {}
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                with transaction.atomic():
+                    HistoricalModel.objects.bulk_update(batch, ['history_delta'])
+                batch = []
+            previous = record
+        if batch:
+            with transaction.atomic():
+                HistoricalModel.objects.bulk_update(batch, ['history_delta'])
+
+
+class Migration(migrations.Migration):
+    # Заполнение history_delta фиксируется порциями, а не одной транзакцией
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalcommunity',
+            name='history_delta',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Изменения'),
+        ),
+        migrations.AddField(
+            model_name='historicalpost',
+            name='history_delta',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Изменения'),
+        ),
+        migrations.AddField(
+            model_name='historicaluser',
+            name='history_delta',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalcommunity',
+            index=models.Index(fields=['id', 'history_id'], name='hist_community_obj_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalpost',
+            index=models.Index(fields=['id', 'history_id'], name='hist_post_obj_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicaluser',
+            index=models.Index(fields=['id', 'history_id'], name='hist_user_obj_idx'),
+        ),
+        migrations.RunPython(fill_history_deltas, migrations.RunPython.noop),
+    ]
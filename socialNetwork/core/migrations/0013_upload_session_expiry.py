@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:26
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_history_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='expires_at',
+            field=models.DateTimeField(default=core.models.upload_session_expiry, verbose_name='Истекает'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['status', 'expires_at'], name='upload_status_expires_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:28
+
+from django.db import migrations, models
+
+
+def requeue_stuck_media(apps, schema_editor):
+    # До этой миграции файлы, взятые упавшим воркером, оставались в
+    # «processing» навсегда и без claimed_at; возвращаем их в очередь
+    Media = apps.get_model('core', 'Media')
+    Media.objects.filter(status='processing').update(status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_upload_session_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Взят в обработку'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(condition=models.Q(('status', 'processing')), fields=['claimed_at'], name='media_processing_idx'),
+        ),
+        migrations.RunPython(requeue_stuck_media, migrations.RunPython.noop),
+    ]
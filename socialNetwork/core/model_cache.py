@@ -0,0 +1,148 @@
+"""
+Кэш объектов моделей по первичному ключу (cache-aside).
+
+Функция загрузки, обёрнутая в @cached_lookup(Model), сначала ищет объект
+в кэше и только при промахе обращается к БД; результат кладётся в кэш на
+MODEL_CACHE_TIMEOUT секунд. Ключ объекта включает версию пространства
+имён модели: invalidate_namespace(Model) увеличивает её, и все объекты
+модели разом перестают находиться (например, после QuerySet.update() по
+многим строкам). Отдельный объект сбрасывается invalidate(Model, pk) —
+это делают обработчики post_save/post_delete в core/signals.py, после
+коммита транзакции.
+
+Кэшируется сам объект без связанных: связанные объекты загружайте своими
+cached_lookup, иначе изменение автора не сбросит закэшированный пост.
+Попадания, промахи и время чтения учитываются в core.cache под именем
+``model:<app_label.model>``.
+
+Сброс из отдельного процесса (команды, воркеры медиа) доходит до
+веб-воркеров только через общий кэш (CACHE_BACKEND file или redis); такие
+процессы вызывают warn_if_not_shared().
+"""
+import functools
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.shortcuts import get_object_or_404
+
+from .cache import MISSING, is_shared, record
+from .models import Chat, Community, Post, User
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'model:'
+NAMESPACE_KEY_PREFIX = 'model_namespace:'
+
+
+def get_timeout():
+    return getattr(settings, 'MODEL_CACHE_TIMEOUT', 300)
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _namespace_version(model):
+    key = f'{NAMESPACE_KEY_PREFIX}{_label(model)}'
+    version = cache.get(key)
+    if version is None:
+        # Версия, вытесненная из кэша, не должна совпасть с прежней
+        version = time.time_ns()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def object_key(model, pk, version=None):
+    if version is None:
+        version = _namespace_version(model)
+    return f'{KEY_PREFIX}{_label(model)}:{version}:{pk}'
+
+
+def invalidate(model, pk):
+    transaction.on_commit(lambda: cache.delete(object_key(model, pk)))
+
+
+def invalidate_many(model, pks):
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: cache.delete_many([object_key(model, pk) for pk in pks]))
+
+
+def invalidate_namespace(model):
+    key = f'{NAMESPACE_KEY_PREFIX}{_label(model)}'
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def warn_if_not_shared(source):
+    """Предупреждает, что сбросы этого процесса не видны веб-воркерам."""
+    if is_shared():
+        return True
+    logger.warning(
+        '%s: кэш не общий для процессов (CACHE_BACKEND=locmem), веб-воркеры '
+        'будут отдавать прежние объекты до %s с (MODEL_CACHE_TIMEOUT)',
+        source, get_timeout(),
+    )
+    return False
+
+
+def _primary(model):
+    # С реплики после сброса могла бы вернуться и закэшироваться старая версия
+    return model._default_manager.using(DEFAULT_DB_ALIAS)
+
+
+def cached_lookup(model):
+    """
+    Декоратор функции loader(pk), возвращающей объект model. Исключения
+    (DoesNotExist, Http404) не кэшируются и пробрасываются дальше.
+    """
+    stats_name = f'{KEY_PREFIX}{_label(model)}'
+
+    def decorator(loader):
+        @functools.wraps(loader)
+        def wrapper(pk):
+            started = time.perf_counter()
+            key = object_key(model, pk)
+            obj = cache.get(key, MISSING)
+            if obj is not MISSING:
+                record(stats_name, hits=1, seconds=time.perf_counter() - started)
+                return obj
+            obj = loader(pk)
+            cache.set(key, obj, get_timeout())
+            record(stats_name, misses=1, seconds=time.perf_counter() - started)
+            return obj
+
+        return wrapper
+
+    return decorator
+
+
+@cached_lookup(Post)
+def get_post(pk):
+    return get_object_or_404(_primary(Post), pk=pk)
+
+
+@cached_lookup(User)
+def get_user(pk):
+    return get_object_or_404(_primary(User), pk=pk)
+
+
+@cached_lookup(Community)
+def get_community(pk):
+    return get_object_or_404(_primary(Community), pk=pk)
+
+
+@cached_lookup(Chat)
+def get_chat(pk):
+    return get_object_or_404(_primary(Chat), pk=pk)
+
@@ -1,6 +1,15 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from simple_history.models import HistoricalRecords
+
+from . import presence
+from .history import BufferedHistoricalRecords
+from .storage import select_media_storage
 
 
 class City(models.Model):
@@ -73,7 +82,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     created_by = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True, related_name='users_created', verbose_name='Создал')
     updated_by = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True, related_name='users_updated', verbose_name='Обновил')
 
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords(untracked_fields=['is_online', 'last_seen', 'last_login'])
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
@@ -83,6 +92,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ['-created_at']
+        indexes = [
+            # cleanup_inactive_users
+            models.Index(fields=['last_seen'], condition=Q(is_active=True, is_staff=False), name='user_inactive_last_seen_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
@@ -90,6 +103,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
 
+    @property
+    def is_online_now(self):
+        return presence.is_online(self.pk)
+
 
 class Community(models.Model):
     TYPE_CHOICES = [
@@ -110,12 +127,16 @@ class Community(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='communities_created', verbose_name='Создал')
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='communities_updated', verbose_name='Обновил')
 
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords(untracked_fields=['members_count'])
 
     class Meta:
         verbose_name = 'Сообщество'
         verbose_name_plural = 'Сообщества'
         ordering = ['-created_at']
+        indexes = [
+            # Рейтинги популярных и рекомендуемых сообществ
+            models.Index(fields=['-members_count'], name='community_members_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -126,18 +147,25 @@ class Post(models.Model):
     community = models.ForeignKey(Community, on_delete=models.CASCADE, blank=True, null=True, related_name='posts', verbose_name='Сообщество')
     content = models.TextField(verbose_name='Содержание')
     views_count = models.PositiveIntegerField(default=0, verbose_name='Количество просмотров')
+    likes_count = models.PositiveIntegerField(default=0, verbose_name='Количество лайков')
     is_published = models.BooleanField(default=True, verbose_name='Опубликовано')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='posts_created', verbose_name='Создал')
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='posts_updated', verbose_name='Обновил')
 
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords(untracked_fields=['views_count', 'likes_count'])
 
     class Meta:
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
         ordering = ['-created_at']
+        indexes = [
+            # Лента, профиль пользователя и страница сообщества
+            models.Index(fields=['-created_at'], condition=Q(is_published=True), name='post_published_created_idx'),
+            models.Index(fields=['author', '-created_at'], condition=Q(is_published=True), name='post_author_created_idx'),
+            models.Index(fields=['community', '-created_at'], condition=Q(is_published=True), name='post_community_created_idx'),
+        ]
 
     def __str__(self):
         return f"Пост от {self.author.get_full_name()} ({self.created_at.strftime('%d.%m.%Y')})"
@@ -148,6 +176,10 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments', verbose_name='Автор')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='replies', verbose_name='Родительский комментарий')
     content = models.TextField(verbose_name='Содержание')
+    likes_count = models.PositiveIntegerField(default=0, verbose_name='Количество лайков')
+    # Материализованный путь: id предков и самого комментария (core/comments.py)
+    path = models.CharField(max_length=255, blank=True, default='', editable=False, verbose_name='Путь в ветке')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='comments_created', verbose_name='Создал')
@@ -157,9 +189,24 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', 'parent', '-created_at'], name='comment_post_parent_idx'),
+            # Ветка комментариев читается одним проходом по диапазону путей
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
 
     def __str__(self):
-        return f"Комментарий от {self.author.get_full_name()} к посту #{self.post.id}"
+        return f"Комментарий от {self.author.get_full_name()} к посту #{self.post_id}"
+
+    def save(self, *args, **kwargs):
+        from .comments import assign_path
+
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
+        # Путь содержит собственный id, поэтому дописывается после INSERT
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            assign_path(self)
 
 
 class Chat(models.Model):
@@ -206,6 +253,9 @@ class Message(models.Model):
         verbose_name = 'Сообщение'
         verbose_name_plural = 'Сообщения'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['chat', 'created_at'], name='message_chat_created_idx'),
+        ]
 
     def __str__(self):
         return f"Сообщение от {self.sender.get_full_name()} в {self.chat}"
@@ -219,13 +269,26 @@ class Media(models.Model):
         ('document', 'Документ'),
     ]
 
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает обработки'),
+        ('processing', 'Обрабатывается'),
+        ('ready', 'Готов'),
+        ('failed', 'Ошибка обработки'),
+    ]
+
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='media_files', verbose_name='Владелец')
     type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='image', verbose_name='Тип')
-    file = models.FileField(upload_to='uploads/%Y/%m/%d/', verbose_name='Файл')
-    thumbnail = models.ImageField(upload_to='thumbnails/%Y/%m/%d/', blank=True, null=True, verbose_name='Миниатюра')
+    file = models.FileField(upload_to='uploads/%Y/%m/%d/', storage=select_media_storage, verbose_name='Файл')
+    thumbnail = models.ImageField(upload_to='thumbnails/%Y/%m/%d/', storage=select_media_storage, blank=True, null=True, verbose_name='Миниатюра')
     mime_type = models.CharField(max_length=100, blank=True, null=True, verbose_name='MIME тип')
     size = models.BigIntegerField(blank=True, null=True, verbose_name='Размер (байты)')
     original_name = models.CharField(max_length=255, blank=True, null=True, verbose_name='Оригинальное имя')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус обработки')
+    width = models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')
+    height = models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')
+    variants = models.JSONField(default=dict, blank=True, verbose_name='Уменьшенные варианты')
+    claimed_at = models.DateTimeField(blank=True, null=True, verbose_name='Взят в обработку')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, blank=True, null=True, related_name='media_files', verbose_name='Публикация')
     message = models.ForeignKey(Message, on_delete=models.CASCADE, blank=True, null=True, related_name='media_files', verbose_name='Сообщение')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
@@ -235,10 +298,67 @@ class Media(models.Model):
         verbose_name = 'Медиафайл'
         verbose_name_plural = 'Медиафайлы'
         ordering = ['-created_at']
+        indexes = [
+            # Очередь run_media_workers
+            models.Index(fields=['created_at'], condition=Q(status='pending'), name='media_pending_idx'),
+            # Файлы, зависшие в обработке после падения воркера
+            models.Index(fields=['claimed_at'], condition=Q(status='processing'), name='media_processing_idx'),
+            # Подсчет ссылок на файлы в хранилище blobs/
+            models.Index(fields=['file'], name='media_file_idx'),
+            models.Index(fields=['thumbnail'], name='media_thumbnail_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_type_display()} - {self.original_name or self.file.name}"
 
+    def variant_url(self, width, fmt='webp'):
+        """URL наименьшего варианта не уже width; оригинал, если такого нет."""
+        for variant_width in sorted(int(w) for w in self.variants):
+            if variant_width >= width and fmt in self.variants[str(variant_width)]:
+                return self.file.storage.url(self.variants[str(variant_width)][fmt])
+        return self.file.url
+
+    @property
+    def display_url(self):
+        return self.variant_url(settings.MEDIA_DISPLAY_WIDTH)
+
+
+def upload_session_expiry():
+    """Срок жизни сессии загрузки; продлевается каждой принятой частью."""
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+class UploadSession(models.Model):
+    STATUS_CHOICES = [
+        ('active', 'Загружается'),
+        ('completed', 'Завершена'),
+        ('aborted', 'Прервана'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions', verbose_name='Владелец')
+    type = models.CharField(max_length=10, choices=Media.TYPE_CHOICES, default='document', verbose_name='Тип')
+    original_name = models.CharField(max_length=255, verbose_name='Оригинальное имя')
+    total_size = models.BigIntegerField(verbose_name='Размер (байты)')
+    received_size = models.BigIntegerField(default=0, verbose_name='Получено (байты)')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active', verbose_name='Статус')
+    media = models.OneToOneField(Media, on_delete=models.SET_NULL, blank=True, null=True, related_name='upload_session', verbose_name='Медиафайл')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    expires_at = models.DateTimeField(default=upload_session_expiry, verbose_name='Истекает')
+
+    class Meta:
+        verbose_name = 'Сессия загрузки'
+        verbose_name_plural = 'Сессии загрузки'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', 'status'], name='upload_owner_status_idx'),
+            models.Index(fields=['status', 'expires_at'], name='upload_status_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.original_name} ({self.received_size}/{self.total_size})"
+
 
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes', verbose_name='Пользователь')
@@ -253,10 +373,10 @@ class Like(models.Model):
         unique_together = [['user', 'post'], ['user', 'comment']]
 
     def __str__(self):
-        if self.post:
-            return f"{self.user.get_full_name()} лайкнул пост #{self.post.id}"
-        elif self.comment:
-            return f"{self.user.get_full_name()} лайкнул комментарий #{self.comment.id}"
+        if self.post_id:
+            return f"{self.user.get_full_name()} лайкнул пост #{self.post_id}"
+        elif self.comment_id:
+            return f"{self.user.get_full_name()} лайкнул комментарий #{self.comment_id}"
         return f"Лайк от {self.user.get_full_name()}"
 
 
@@ -279,6 +399,10 @@ class Friendship(models.Model):
         verbose_name_plural = 'Дружба'
         ordering = ['-created_at']
         unique_together = ['user', 'friend']
+        indexes = [
+            models.Index(fields=['user', 'status'], name='friendship_user_status_idx'),
+            models.Index(fields=['friend', 'status'], name='friendship_friend_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} и {self.friend.get_full_name()} ({self.get_status_display()})"
@@ -290,10 +414,22 @@ class UserCommunity(models.Model):
         ('moderator', 'Модератор'),
         ('admin', 'Администратор'),
     ]
+    # Порядок ролей в списке участников
+    ROLE_PRIORITIES = {'admin': 0, 'moderator': 1, 'member': 2}
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='community_memberships', verbose_name='Пользователь')
     community = models.ForeignKey(Community, on_delete=models.CASCADE, related_name='members', verbose_name='Сообщество')
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='member', verbose_name='Роль')
+    # Вычисляется СУБД из role, поэтому верно и для bulk_create/update()
+    role_priority = models.GeneratedField(
+        expression=models.Case(
+            *[models.When(role=role, then=models.Value(priority)) for role, priority in ROLE_PRIORITIES.items()],
+            default=models.Value(ROLE_PRIORITIES['member']),
+        ),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+        verbose_name='Приоритет роли',
+    )
     joined_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата вступления')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='user_communities_created', verbose_name='Создал')
 
@@ -302,6 +438,11 @@ class UserCommunity(models.Model):
         verbose_name_plural = 'Участия в сообществах'
         ordering = ['-joined_at']
         unique_together = ['user', 'community']
+        indexes = [
+            models.Index(fields=['community', '-joined_at'], name='usercommunity_joined_idx'),
+            # Список участников: сначала администраторы и модераторы, затем по дате вступления
+            models.Index(fields=['community', 'role_priority', 'joined_at', 'id'], name='usercommunity_role_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} в {self.community.name} ({self.get_role_display()})"
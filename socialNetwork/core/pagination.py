@@ -0,0 +1,132 @@
+"""
+Курсорная (keyset) пагинация по составному ключу.
+
+Вместо OFFSET страница начинается строго после последней строки
+предыдущей: (a, b, c) > (a0, b0, c0). Сравнение записывается как
+сравнение кортежей (row values, есть в PostgreSQL и SQLite), поэтому при
+индексе, покрывающем порядок сортировки, каждая страница — один
+диапазонный проход по индексу, и тысячная страница стоит столько же,
+сколько первая.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import BooleanField, Expression, F, Value
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowGreaterThan(Expression):
+    """(field1, field2, ...) > (value1, value2, ...)"""
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, fields, values):
+        super().__init__()
+        self.fields = list(fields)
+        self.values = list(values)
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None, summarize=False, for_save=False):
+        clone = self.copy()
+        clone.lhs = [F(field).resolve_expression(query, allow_joins, reuse, summarize) for field in self.fields]
+        clone.rhs = [
+            # У GeneratedField тип значения задаёт output_field
+            Value(value, output_field=getattr(column.output_field, 'output_field', column.output_field))
+            for column, value in zip(clone.lhs, self.values)
+        ]
+        return clone
+
+    def get_source_expressions(self):
+        return [*getattr(self, 'lhs', []), *getattr(self, 'rhs', [])]
+
+    def set_source_expressions(self, expressions):
+        self.lhs, self.rhs = expressions[:len(self.fields)], expressions[len(self.fields):]
+
+    def as_sql(self, compiler, connection):
+        parts, params = {'lhs': [], 'rhs': []}, []
+        for side in ('lhs', 'rhs'):
+            for expression in getattr(self, side):
+                sql, expression_params = compiler.compile(expression)
+                parts[side].append(sql)
+                params.extend(expression_params)
+        return f"({', '.join(parts['lhs'])}) > ({', '.join(parts['rhs'])})", params
+
+
+class KeysetPagination:
+    """
+    ordering — поля сортировки по возрастанию; последнее должно быть
+    уникальным (обычно 'id').
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    ordering = ('id',)
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field)
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise NotFound('Неверный курсор')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound('Неверный курсор')
+        return [self._decode_value(value) for value in values]
+
+    @staticmethod
+    def _decode_value(value):
+        if isinstance(value, str):
+            try:
+                parsed = parse_datetime(value)
+            except ValueError:
+                parsed = None
+            if parsed is not None:
+                return parsed
+        return value
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(RowGreaterThan(self.ordering, self.decode_cursor(cursor)))
+
+        page_size = self.get_page_size(request)
+        # Лишняя строка показывает, есть ли следующая страница
+        page = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
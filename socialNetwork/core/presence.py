@@ -0,0 +1,126 @@
+"""
+Учёт присутствия пользователей.
+
+Отметки активности («heartbeat») хранятся в кэше с TTL, поэтому статус
+«в сети» читается без обращения к таблице пользователей. Поле
+``User.last_seen`` обновляется периодически одним UPDATE на все накопленные
+отметки; QuerySet.update() не вызывает post_save, поэтому записи в
+HistoricalUser не создаются. Запись выполняет запрос, в котором истёк
+PRESENCE_FLUSH_INTERVAL, а при штатной остановке процесса — обработчик
+atexit (core/apps.py), поэтому отметки последней минуты не теряются.
+
+Кэш должен быть общим для процессов (CACHE_BACKEND file или redis, см.
+core/checks.py): в locmem статус зависит от воркера, обработавшего запрос.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from . import routers
+
+CACHE_KEY_PREFIX = 'presence:'
+
+_lock = threading.Lock()
+# Отметки, ещё не записанные в БД: {user_id: datetime}
+_pending = {}
+# Когда процесс последний раз писал отметку в кэш: {user_id: monotonic}
+_last_heartbeat = {}
+_last_flush = time.monotonic()
+
+
+def get_ttl():
+    return getattr(settings, 'PRESENCE_TTL', 300)
+
+
+def get_flush_interval():
+    return getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 60)
+
+
+def get_heartbeat_interval():
+    return getattr(settings, 'PRESENCE_HEARTBEAT_INTERVAL', 30)
+
+
+def _cache_key(user_id):
+    return f'{CACHE_KEY_PREFIX}{user_id}'
+
+
+def touch(user_id):
+    """Отмечает активность пользователя. Вызывается из PresenceMiddleware."""
+    now = time.monotonic()
+    with _lock:
+        last = _last_heartbeat.get(user_id)
+        if last is not None and now - last < get_heartbeat_interval():
+            return
+        _last_heartbeat[user_id] = now
+        _pending[user_id] = timezone.now()
+
+    cache.set(_cache_key(user_id), True, get_ttl())
+    maybe_flush()
+
+
+def forget(user_id):
+    """Сбрасывает статус «в сети», например при выходе из системы."""
+    with _lock:
+        _last_heartbeat.pop(user_id, None)
+    cache.delete(_cache_key(user_id))
+
+
+def is_online(user_id):
+    return bool(cache.get(_cache_key(user_id)))
+
+
+def online_user_ids(user_ids):
+    """Возвращает множество id пользователей, которые сейчас в сети."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    keys = {_cache_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(keys.keys())
+    return {keys[key] for key, value in found.items() if value}
+
+
+def maybe_flush():
+    global _last_flush
+    with _lock:
+        if time.monotonic() - _last_flush < get_flush_interval():
+            return
+        _last_flush = time.monotonic()
+    flush()
+
+
+def flush():
+    """Записывает накопленные отметки в User.last_seen одним UPDATE."""
+    from . import model_cache
+    from .models import User
+
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+        expired = time.monotonic() - get_heartbeat_interval()
+        for user_id in [uid for uid, last in _last_heartbeat.items() if last < expired]:
+            del _last_heartbeat[user_id]
+
+    if not pending:
+        return 0
+
+    # Отметки всех запросов процесса: текущий запрос за основной БД не закрепляем
+    with routers.unpinned():
+        updated = User.objects.filter(pk__in=pending.keys()).update(
+            last_seen=Case(
+                *[When(pk=user_id, then=Value(seen)) for user_id, seen in pending.items()],
+                output_field=DateTimeField(),
+            ),
+            is_online=True,
+        )
+        model_cache.invalidate_many(User, pending.keys())
+
+        # Поле is_online в БД используется только фильтрами и админкой,
+        # поэтому гасим его для тех, кто давно не присылал отметок.
+        stale_before = timezone.now() - timedelta(seconds=get_ttl())
+        User.objects.filter(is_online=True, last_seen__lt=stale_before).update(is_online=False)
+    return updated
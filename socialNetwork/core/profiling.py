@@ -0,0 +1,171 @@
+"""
+Профилирование запросов: SQL, время рендеринга шаблонов и поиск N+1.
+
+Профилирование включается для отдельного запроса заголовком ``X-Profile``
+(только для сотрудников) или случайной выборкой с долей
+``PROFILING_SAMPLE_RATE``. Отчёты хранятся в кольцевом буфере процесса и
+доступны сотрудникам по адресу ``/debug/profiling/``. Если
+``PROFILING_ENABLED = False``, middleware отключается целиком.
+"""
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends import django as django_backend
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+THIS_FILE = os.path.abspath(__file__)
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+_local = threading.local()
+_ids = itertools.count(1)
+_reports = deque(maxlen=getattr(settings, 'PROFILING_BUFFER_SIZE', 100))
+_installed = False
+
+
+def get_reports():
+    return list(_reports)
+
+
+def get_report(report_id):
+    for report in _reports:
+        if report['id'] == report_id:
+            return report
+    return None
+
+
+def _query_origin():
+    """Ближайший к месту вызова кадр стека из файлов приложения core."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(CORE_DIR) and filename != THIS_FILE:
+            return f'{os.path.relpath(filename, CORE_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return None
+
+
+def _query_shape(sql):
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'db': self.alias,
+                'sql': sql,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+                'origin': _query_origin(),
+            })
+
+
+def _profiled_render(render):
+    def wrapper(self, context=None, request=None):
+        profile = getattr(_local, 'profile', None)
+        if profile is None:
+            return render(self, context, request)
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile['template_ms'] += (time.perf_counter() - start) * 1000
+    return wrapper
+
+
+def install():
+    """Оборачивает рендеринг шаблонов. Вызывается один раз при включённом профилировании."""
+    global _installed
+    if _installed:
+        return
+    django_backend.Template.render = _profiled_render(django_backend.Template.render)
+    _installed = True
+
+
+def find_n_plus_one(queries, threshold):
+    shapes = Counter(_query_shape(query['sql']) for query in queries)
+    result = []
+    for shape, count in shapes.most_common():
+        if count <= threshold:
+            break
+        origins = Counter(query['origin'] for query in queries if _query_shape(query['sql']) == shape)
+        result.append({
+            'sql': shape,
+            'count': count,
+            'origin': origins.most_common(1)[0][0],
+        })
+    return result
+
+
+def build_report(request, response, queries, total_ms, template_ms):
+    threshold = getattr(settings, 'PROFILING_N_PLUS_ONE_THRESHOLD', 5)
+    max_queries = getattr(settings, 'PROFILING_MAX_QUERIES', 200)
+    sql_ms = sum(query['duration_ms'] for query in queries)
+    return {
+        'id': next(_ids),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'total_ms': round(total_ms, 3),
+        'sql_ms': round(sql_ms, 3),
+        'template_ms': round(template_ms, 3),
+        'queries_count': len(queries),
+        'n_plus_one': find_n_plus_one(queries, threshold),
+        'queries': sorted(queries, key=lambda query: query['duration_ms'], reverse=True)[:max_queries],
+    }
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        install()
+
+    def should_profile(self, request):
+        if request.headers.get(self.header):
+            user = getattr(request, 'user', None)
+            return user is not None and user.is_staff
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        recorders = [QueryRecorder(alias) for alias in connections]
+        _local.profile = {'template_ms': 0.0}
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for recorder in recorders:
+                    stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            profile = _local.profile
+            _local.profile = None
+
+        queries = [query for recorder in recorders for query in recorder.queries]
+        report = build_report(request, response, queries, total_ms, profile['template_ms'])
+        _reports.append(report)
+        response['X-Profile-Id'] = str(report['id'])
+        return response
@@ -0,0 +1,161 @@
+"""
+Чтение с реплик базы данных.
+
+Если в DB_REPLICAS заданы реплики, PrimaryReplicaRouter отправляет
+запросы на чтение на случайную реплику, а запись — в основную БД
+(default). Чтение идёт в основную БД, если:
+
+* запрос изменяющий (POST, PUT, PATCH, DELETE) или в этом запросе уже
+  была запись;
+* у клиента есть cookie закрепления: её ставит ReplicaPinMiddleware на
+  DB_REPLICA_STICKY_SECONDS секунд после записи, чтобы пользователь сразу
+  видел свои изменения, даже если реплика ещё не догнала основную БД;
+* открыта транзакция в основной БД;
+* модель из PRIMARY_ONLY_APPS: сессия, не успевшая попасть на реплику,
+  разлогинила бы пользователя;
+* все реплики недоступны или отстают больше чем на DB_REPLICA_MAX_LAG
+  секунд. Отставание проверяется не чаще раза в
+  DB_REPLICA_LAG_CHECK_INTERVAL секунд на процесс.
+
+Служебные записи, не меняющие того, что пользователь должен сразу
+увидеть (пакетная запись last_seen в presence.flush, счётчик просмотров
+поста), выполняются внутри unpinned() и не закрепляют запрос.
+
+Реплики — только PostgreSQL: отставание измеряется по WAL. Подключение с
+TEST MIRROR (в тестах реплика — та же база) не отстаёт никогда, а реплика
+другой СУБД считается недоступной.
+
+DB_REPLICA_STICKY_SECONDS должно быть больше DB_REPLICA_MAX_LAG, иначе
+после закрепления можно попасть на реплику, ещё не получившую запись.
+Миграции применяются только к основной БД.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE_NAME = 'db_primary'
+PRIMARY_ONLY_APPS = {'sessions'}
+
+# Отставание реплики PostgreSQL в секундах; 0, если всё полученное уже
+# применено (иначе простой без записей выглядел бы как отставание)
+POSTGRES_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+# Состояние текущего HTTP-запроса: {'pinned': bool, 'wrote': bool}
+_request_state = ContextVar('db_request_state', default=None)
+
+_lag_lock = threading.Lock()
+# {alias: (time.monotonic() проверки, отставание в секундах или None)}
+_lag = {}
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'DB_REPLICA_STICKY_SECONDS', 10)
+
+
+def get_max_lag():
+    return getattr(settings, 'DB_REPLICA_MAX_LAG', 5)
+
+
+def get_lag_check_interval():
+    return getattr(settings, 'DB_REPLICA_LAG_CHECK_INTERVAL', 5)
+
+
+def start_request(pinned):
+    return _request_state.set({'pinned': pinned, 'wrote': False})
+
+
+def finish_request(token):
+    """Завершает запрос; возвращает True, если в нём была запись."""
+    state = _request_state.get()
+    _request_state.reset(token)
+    return bool(state and state['wrote'])
+
+
+@contextmanager
+def unpinned():
+    """Записи внутри блока не закрепляют текущий запрос за основной БД."""
+    token = _request_state.set(None)
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+
+
+def _measure_lag(alias):
+    connection = connections[alias]
+    if connection.settings_dict.get('TEST', {}).get('MIRROR'):
+        return 0.0
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_LAG_SQL)
+        row = cursor.fetchone()
+    # NULL — сервер не в режиме восстановления, то есть не отстаёт
+    return float(row[0]) if row and row[0] is not None else 0.0
+
+
+def replica_lag(alias):
+    """Отставание реплики в секундах или None, если она недоступна."""
+    now = time.monotonic()
+    with _lag_lock:
+        checked = _lag.get(alias)
+    if checked is not None and now - checked[0] < get_lag_check_interval():
+        return checked[1]
+
+    try:
+        lag = _measure_lag(alias)
+    except DatabaseError:
+        connections[alias].close()
+        lag = None
+    with _lag_lock:
+        _lag[alias] = (now, lag)
+    return lag
+
+
+def get_lag_stats():
+    with _lag_lock:
+        return {alias: lag for alias, (_, lag) in _lag.items()}
+
+
+def _use_primary():
+    state = _request_state.get()
+    if state is not None and state['pinned']:
+        return True
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS or _use_primary():
+            return DEFAULT_DB_ALIAS
+        replicas = [
+            alias for alias in get_replicas()
+            if (lag := replica_lag(alias)) is not None and lag <= get_max_lag()
+        ]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            # Дальше в этом запросе читаем то, что только что записали
+            state['pinned'] = state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
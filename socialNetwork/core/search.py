@@ -0,0 +1,199 @@
+"""
+Индексированный поиск подстроки для админки.
+
+Поиск по '%слово%' не использует обычные B-tree индексы, поэтому для
+текстовых полей из SEARCH_INDEXES создаются триграммные индексы:
+
+* PostgreSQL — GIN-индексы pg_trgm по UPPER(поле), то есть ровно по тому
+  выражению, в которое Django компилирует icontains; запрос не меняется,
+  меняется только план;
+* SQLite — внешние (external content) таблицы FTS5 с токенизатором trigram,
+  синхронизируемые триггерами. Поиск идёт через MATCH; слова короче трёх
+  символов trigram не находит, для них остаётся icontains. Токенизатор
+  trigram появился в SQLite 3.34: на более старых версиях таблицы не
+  создаются, и поиск идёт через icontains.
+
+Индексы PostgreSQL строятся CREATE INDEX CONCURRENTLY, без блокировки
+записи в таблицы, поэтому миграция 0011 неатомарная.
+
+matching_ids(model, fields, term, using) возвращает подзапрос с id подходящих строк
+одной модели; admin_mixins.IndexedSearchMixin объединяет такие подзапросы
+по всем моделям из search_fields.
+
+Таблицы FTS и триггеры создаёт миграция 0011, а ensure_sqlite_fts()
+после каждого migrate восстанавливает триггеры: SQLite пересоздаёт таблицу
+при изменении её схемы, и триггеры старой таблицы при этом удаляются.
+"""
+import logging
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# {таблица: поля с индексом}
+SEARCH_INDEXES = {
+    'core_user': ('email', 'first_name', 'last_name', 'username', 'phone'),
+    'core_community': ('name', 'description'),
+    'core_post': ('content',),
+    'core_comment': ('content',),
+    'core_message': ('content',),
+}
+TRIGRAM_MIN_LENGTH = 3
+
+
+def fts_table(table):
+    return f'{table}_fts'
+
+
+def trigram_index(table, column):
+    return f'{table}_{column}_trgm'
+
+
+def has_fts_table(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts_table(table)])
+        return cursor.fetchone() is not None
+
+
+def sqlite_trigram_supported(connection):
+    """Есть ли в SQLite модуль FTS5 с токенизатором trigram (SQLite 3.34+)."""
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(value, tokenize='trigram')")
+            cursor.execute('DROP TABLE temp.trigram_probe')
+    except DatabaseError:
+        return False
+    return True
+
+
+def _fts_query(columns, term):
+    # Фраза в кавычках: операторы FTS5 (AND, OR, *, -) в term не действуют
+    phrase = '"' + term.replace('"', '""') + '"'
+    return f'{{{" ".join(columns)}}} : {phrase}'
+
+
+def matching_ids(model, fields, term, using):
+    """
+    Подзапрос id строк model, где term встречается хотя бы в одном из fields
+    (без учёта регистра). Поля не из SEARCH_INDEXES ищутся через icontains.
+    """
+    table = model._meta.db_table
+    columns = SEARCH_INDEXES.get(table, ())
+    connection = connections[using]
+    fts_fields = []
+    if (
+        connection.vendor == 'sqlite' and columns and len(term) >= TRIGRAM_MIN_LENGTH
+        and has_fts_table(connection, table)
+    ):
+        fts_fields = [field for field in fields if model._meta.get_field(field).column in columns]
+
+    # В PostgreSQL icontains компилируется в UPPER(поле) LIKE ... и сам
+    # использует индекс pg_trgm
+    condition = Q()
+    for field in fields:
+        if field not in fts_fields:
+            condition |= Q(**{f'{field}__icontains': term})
+    if fts_fields:
+        fts = fts_table(table)
+        query = _fts_query([model._meta.get_field(field).column for field in fts_fields], term)
+        condition |= Q(pk__in=RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [query]))
+    return model._default_manager.using(using).filter(condition).values('pk')
+
+
+def _sqlite_fts_sql(table, columns):
+    fts = fts_table(table)
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{column_list}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values}); END',
+    ]
+
+
+def ensure_sqlite_fts(connection, only_existing=False):
+    """
+    Создаёт недостающие таблицы FTS5 и триггеры; перестраивает индекс, если
+    их не было. only_existing — только восстановить триггеры уже созданных
+    таблиц (после отката миграции 0011 таблиц нет, и создавать их не нужно).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    if not sqlite_trigram_supported(connection):
+        if not only_existing:
+            logger.warning('SQLite без токенизатора trigram, таблицы FTS для поиска не созданы')
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for table, columns in SEARCH_INDEXES.items():
+            fts = fts_table(table)
+            if table not in existing or (only_existing and fts not in existing):
+                continue
+            triggers = {f'{fts}_insert', f'{fts}_delete', f'{fts}_update'}
+            if fts in existing and triggers <= existing:
+                continue
+            for statement in _sqlite_fts_sql(table, columns):
+                cursor.execute(statement)
+            # Без триггеров индекс мог отстать от таблицы
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def drop_sqlite_fts(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for table in SEARCH_INDEXES:
+            fts = fts_table(table)
+            for suffix in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def create_trigram_indexes(connection):
+    """
+    Строит индексы без блокировки записи (CONCURRENTLY), поэтому вызывается
+    вне транзакции. Индекс, оставшийся невалидным после прерванной
+    постройки, удаляется и строится заново.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # Нет прав на расширение: поиск работает, но без индексов
+        logger.warning('Не удалось подключить pg_trgm, триграммные индексы не созданы')
+        return
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                name = trigram_index(table, column)
+                cursor.execute(
+                    'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid',
+                    [name],
+                )
+                if cursor.fetchone():
+                    cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                    f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+
+
+def drop_trigram_indexes(connection):
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {trigram_index(table, column)}')
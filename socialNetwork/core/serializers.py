@@ -1,9 +1,13 @@
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Post, Community, User, Comment
+from .models import Post, Community, User, Comment, Media, UploadSession
+from . import feed, presence
 
 
 class UserSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
+    is_online = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -15,19 +19,80 @@ class UserSerializer(serializers.ModelSerializer):
     def get_full_name(self, obj):
         return obj.get_full_name()
 
+    def get_is_online(self, obj):
+        return presence.is_online(obj.pk)
 
-class PostSerializer(serializers.ModelSerializer):
+
+class MediaSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Media
+        fields = ['id', 'type', 'url', 'preview_url', 'thumbnail', 'mime_type',
+                  'size', 'width', 'height', 'status', 'variants']
+        read_only_fields = fields
+
+    def get_url(self, obj):
+        return obj.file.url
+
+    def get_preview_url(self, obj):
+        return obj.display_url
+
+    def get_variants(self, obj):
+        storage = obj.file.storage
+        return {
+            width: {fmt: storage.url(name) for fmt, name in formats.items()}
+            for width, formats in obj.variants.items()
+        }
+
+
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """Загружает лайки текущего пользователя для всего списка одним запросом."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.load_viewer_state(items)
+        return super().to_representation(items)
+
+
+class LikedByViewerMixin:
+    """Поле is_liked; viewer_state_key — 'posts' или 'comments'."""
+    viewer_state_key = None
+    liked_ids = None
+
+    def load_viewer_state(self, objects):
+        request = self.context.get('request')
+        ids = [obj.pk for obj in objects]
+        if self.viewer_state_key == 'posts':
+            state = feed.viewer_state(getattr(request, 'user', None), post_ids=ids)
+        else:
+            state = feed.viewer_state(getattr(request, 'user', None), comment_ids=ids)
+        self.liked_ids = state[self.viewer_state_key]
+
+    def get_is_liked(self, obj):
+        if self.liked_ids is None:
+            self.load_viewer_state([obj])
+        return obj.pk in self.liked_ids
+
+
+class PostSerializer(LikedByViewerMixin, serializers.ModelSerializer):
     author_name = serializers.SerializerMethodField()
     community_name = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
+    is_liked = serializers.SerializerMethodField()
+    media = MediaSerializer(source='media_files', many=True, read_only=True)
+
+    viewer_state_key = 'posts'
 
     class Meta:
         model = Post
         fields = ['id', 'author', 'author_name', 'community', 'community_name',
                   'content', 'views_count', 'is_published', 'created_at',
-                  'updated_at', 'likes_count', 'comments_count']
-        read_only_fields = ['id', 'author', 'views_count', 'created_at', 'updated_at']
+                  'updated_at', 'likes_count', 'comments_count', 'is_liked', 'media']
+        read_only_fields = ['id', 'author', 'views_count', 'likes_count', 'created_at', 'updated_at']
+        list_serializer_class = ViewerStateListSerializer
 
     def get_author_name(self, obj):
         return obj.author.get_full_name()
@@ -35,10 +100,9 @@ class PostSerializer(serializers.ModelSerializer):
     def get_community_name(self, obj):
         return obj.community.name if obj.community else None
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
     def get_comments_count(self, obj):
+        if hasattr(obj, 'comments_total'):
+            return obj.comments_total
         return obj.comments.count()
 
     def validate_content(self, value):
@@ -115,16 +179,19 @@ class CommunitySerializer(serializers.ModelSerializer):
         return value
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(LikedByViewerMixin, serializers.ModelSerializer):
     author_name = serializers.SerializerMethodField()
     replies_count = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
+    is_liked = serializers.SerializerMethodField()
+
+    viewer_state_key = 'comments'
 
     class Meta:
         model = Comment
         fields = ['id', 'post', 'author', 'author_name', 'parent', 'content',
-                  'created_at', 'updated_at', 'replies_count', 'likes_count']
-        read_only_fields = ['id', 'author', 'created_at', 'updated_at']
+                  'created_at', 'updated_at', 'replies_count', 'likes_count', 'is_liked']
+        read_only_fields = ['id', 'author', 'likes_count', 'created_at', 'updated_at']
+        list_serializer_class = ViewerStateListSerializer
 
     def get_author_name(self, obj):
         return obj.author.get_full_name()
@@ -132,12 +199,36 @@ class CommentSerializer(serializers.ModelSerializer):
     def get_replies_count(self, obj):
         return obj.replies.count()
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
     def validate_content(self, value):
         if len(value.strip()) < 2:
             raise serializers.ValidationError(
                 "Комментарий должен быть не менее 2 символов"
             )
         return value
+
+
+class CommentThreadSerializer(CommentSerializer):
+    """Комментарий в ветке (core/comments.py) — без запроса числа ответов."""
+    has_more_replies = serializers.BooleanField(read_only=True)
+
+    class Meta(CommentSerializer.Meta):
+        fields = ['id', 'post', 'author', 'author_name', 'parent', 'content', 'depth',
+                  'created_at', 'updated_at', 'likes_count', 'is_liked', 'has_more_replies']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'type', 'original_name', 'total_size', 'received_size',
+                  'status', 'media', 'created_at', 'updated_at', 'expires_at']
+        read_only_fields = ['id', 'received_size', 'status', 'media', 'created_at', 'updated_at', 'expires_at']
+
+    def validate_total_size(self, value):
+        max_size = settings.UPLOAD_MAX_SIZE
+        if value <= 0:
+            raise serializers.ValidationError("Размер файла должен быть больше нуля")
+        if value > max_size:
+            raise serializers.ValidationError(
+                f"Размер файла не должен превышать {max_size // (1024 * 1024)} MB"
+            )
+        return value
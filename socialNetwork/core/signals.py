@@ -0,0 +1,80 @@
+"""Сброс кэшированных фрагментов и объектов, счётчики лайков и подключений, поисковые индексы."""
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import auth_backends, db_stats, feed, model_cache, search
+from .likes import adjust_likes_count
+from .memberships import invalidate_top_members
+from .models import Chat, Comment, Community, Like, Media, Post, User, UserCommunity
+
+
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Comment)
+def bump_post_counters(sender, instance, **kwargs):
+    if instance.post_id:
+        feed.bump_card_version(instance.post_id)
+
+
+# core/likes.py пишет в таблицу лайков напрямую и сам ведёт счётчики;
+# обработчики ниже учитывают лайки, созданные и удалённые через ORM
+
+@receiver(post_save, sender=Like)
+def count_created_like(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if instance.post_id:
+        adjust_likes_count(Post, instance.post_id, 1)
+    if instance.comment_id:
+        adjust_likes_count(Comment, instance.comment_id, 1)
+
+
+@receiver(post_delete, sender=Like)
+def count_deleted_like(sender, instance, origin=None, **kwargs):
+    # При удалении самого поста или комментария счётчик уже не нужен
+    if instance.post_id and not (isinstance(origin, Post) and origin.pk == instance.post_id):
+        adjust_likes_count(Post, instance.post_id, -1)
+    if instance.comment_id and not (isinstance(origin, Comment) and origin.pk == instance.comment_id):
+        adjust_likes_count(Comment, instance.comment_id, -1)
+
+
+@receiver([post_save, post_delete], sender=Media)
+def touch_media_post(sender, instance, **kwargs):
+    # Медиа обрабатываются в отдельном процессе, у которого свой локальный
+    # кэш, поэтому меняем updated_at поста в БД, а не версию в кэше
+    if instance.post_id:
+        Post.objects.filter(pk=instance.post_id).update(updated_at=timezone.now())
+        model_cache.invalidate(Post, instance.post_id)
+
+
+@receiver(post_save, sender=UserCommunity)
+def reset_top_members(sender, instance, **kwargs):
+    # Смена роли в админке; вступление и выход сбрасывают кэш в core/memberships.py
+    invalidate_top_members(instance.community_id)
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Community)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Chat)
+def reset_cached_object(sender, instance, **kwargs):
+    model_cache.invalidate(sender, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def reset_user_snapshot(sender, instance, **kwargs):
+    auth_backends.invalidate_snapshot(instance.pk)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    db_stats.record_connect(connection.alias)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    # SQLite пересоздаёт таблицу при изменении схемы, теряя её триггеры
+    if sender.name == 'core':
+        search.ensure_sqlite_fts(connections[using], only_existing=True)
@@ -0,0 +1,113 @@
+"""
+Контентно-адресуемое хранилище медиафайлов.
+
+Файл хешируется (SHA-256) во время записи на диск, без повторного чтения,
+и сохраняется один раз под именем ``blobs/ab/cd/<sha256><ext>``. Повторная
+загрузка того же содержимого не создаёт нового файла: строки Media просто
+ссылаются на существующий blob. Неиспользуемые blob'ы удаляет команда
+``manage.py gc_media_blobs``; она не трогает файлы, изменённые недавно,
+поэтому при повторном использовании blob'а его mtime обновляется — иначе
+старый blob без ссылок мог бы быть удалён до коммита новой строки Media.
+
+Из имени загруженного файла берётся только расширение из латинских букв и
+цифр длиной до MAX_EXTENSION_LENGTH символов, чтобы имя blob'а всегда
+помещалось в FileField (max_length=100).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db.models import Q
+
+BLOB_PREFIX = 'blobs'
+TMP_DIR = 'tmp'
+MAX_EXTENSION_LENGTH = 10
+EXTENSION_RE = re.compile(rf'\.[a-z0-9]{{1,{MAX_EXTENSION_LENGTH}}}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save()
+        return name
+
+    def blob_name(self, digest, ext):
+        ext = ext.lower()
+        if not EXTENSION_RE.fullmatch(ext):
+            ext = ''
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def _save(self, name, content):
+        tmp_dir = self.path(f'{BLOB_PREFIX}/{TMP_DIR}')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            name = self.blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            full_path = self.path(name)
+            try:
+                # Продлеваем защиту от gc_media_blobs до коммита строки Media
+                os.utime(full_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(tmp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+            else:
+                os.remove(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def select_media_storage():
+    """Хранилище для файловых полей Media (передаётся как storage=...)."""
+    if getattr(settings, 'MEDIA_CONTENT_ADDRESSED', False):
+        return content_addressed_storage
+    return default_storage
+
+
+def reference_count(name, exclude_pk=None):
+    """Сколько строк Media ссылается на файл name как на оригинал или миниатюру."""
+    from .models import Media
+
+    queryset = Media.objects.filter(Q(file=name) | Q(thumbnail=name))
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return queryset.count()
+
+
+def release(storage, name, exclude_pk=None):
+    """Удаляет файл, если на него больше не ссылается ни одна строка Media."""
+    if name and not reference_count(name, exclude_pk=exclude_pk):
+        storage.delete(name)
+
+
+def referenced_names():
+    """Все имена файлов, на которые ссылаются строки Media, включая варианты."""
+    from .models import Media
+
+    names = set()
+    rows = Media.objects.values_list('file', 'thumbnail', 'variants').iterator(chunk_size=2000)
+    for file_name, thumbnail_name, variants in rows:
+        names.add(file_name)
+        if thumbnail_name:
+            names.add(thumbnail_name)
+        for formats in (variants or {}).values():
+            names.update(formats.values())
+    return names
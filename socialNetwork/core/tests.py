@@ -0,0 +1,609 @@
+import os
+import tempfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+import simple_history
+
+from . import auth_backends, checks, history, history_maintenance, media_processing, model_cache, presence, routers, search
+from .models import City, Comment, Friendship, Like, Media, Message, Post, UploadSession, User, UserCommunity
+
+
+def tearDownModule():
+    # Отметки присутствия из тестовых запросов иначе записал бы обработчик
+    # atexit — уже в основную БД после удаления тестовой
+    presence.flush()
+
+
+class LikeConcurrencyTests(TransactionTestCase):
+    """Счётчик likes_count совпадает с таблицей лайков при параллельных PUT и DELETE."""
+    users_count = 8
+    rounds = 6
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f'user{index}@example.com', password='x')
+            for index in range(self.users_count)
+        ]
+        self.post = Post.objects.create(author=self.users[0], content='Горячий пост')
+        self.comment = Comment.objects.create(post=self.post, author=self.users[0], content='Комментарий')
+
+    def _hammer(self, url):
+        def run(operation):
+            user, method = operation
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        # Каждый пользователь дважды подряд ставит и снимает лайк, как при двойном клике
+        operations = [
+            (user, method)
+            for _ in range(self.rounds)
+            for user in self.users
+            for method in ('put', 'put', 'delete', 'put')
+        ]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(run, operations))
+        self.assertTrue(set(statuses) <= {200, 201}, statuses)
+
+    def test_post_likes_count_matches_rows(self):
+        self._hammer(f'/api/posts/{self.post.pk}/like/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, Like.objects.filter(post=self.post).count())
+        self.assertLessEqual(self.post.likes_count, self.users_count)
+
+    def test_comment_likes_count_matches_rows(self):
+        self._hammer(f'/api/comments/{self.comment.pk}/like/')
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.likes_count, Like.objects.filter(comment=self.comment).count())
+        self.assertLessEqual(self.comment.likes_count, self.users_count)
+
+
+class CommentApiPermissionTests(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@example.com', password='x')
+        post = Post.objects.create(author=self.author, content='Пост')
+        self.comment = Comment.objects.create(post=post, author=self.author, content='Комментарий')
+        self.url = f'/api/comments/{self.comment.pk}/'
+
+    def test_comments_are_read_only(self):
+        client = APIClient()
+        self.assertEqual(client.get(self.url).status_code, 200)
+        self.assertEqual(client.post('/api/comments/', {'content': 'x'}).status_code, 405)
+        client.force_authenticate(User.objects.create_user(email='other@example.com', password='x'))
+        self.assertEqual(client.patch(self.url, {'content': 'x'}).status_code, 405)
+        self.assertEqual(client.delete(self.url).status_code, 405)
+        self.assertTrue(Comment.objects.filter(pk=self.comment.pk, content='Комментарий').exists())
+
+    def test_like_requires_authentication(self):
+        response = APIClient().put(f'{self.url}like/')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(Like.objects.exists())
+
+
+class IndexUsageMixin:
+    """
+    Горячий запрос использует свой индекс (миграция 0003). В PostgreSQL
+    последовательное сканирование отключается: на пустых тестовых таблицах
+    планировщик иначе всегда выбирает его. queryset — проверяемый запрос
+    (ленивый, выполняется только EXPLAIN), ordered_by_index — порядок
+    строк даёт сам индекс, без отдельной сортировки.
+    """
+    index_name = None
+    ordered_by_index = True
+    queryset = None
+
+    def explain(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return self.queryset.all().explain()
+
+    def test_uses_index(self):
+        self.assertIn(self.index_name, self.explain())
+
+    @skipUnless(connection.vendor == 'postgresql', 'План с узлами Sort есть только в PostgreSQL')
+    def test_postgres_plan_has_no_sort(self):
+        if not self.ordered_by_index:
+            self.skipTest('Порядок строк задаётся не индексом')
+        self.assertNotIn('Sort', self.explain())
+
+
+class PublishedFeedIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'post_published_created_idx'
+    queryset = Post.objects.filter(is_published=True).order_by('-created_at')[:20]
+
+
+class AuthorPostsIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'post_author_created_idx'
+    queryset = Post.objects.filter(is_published=True, author_id=1).order_by('-created_at')[:20]
+
+
+class CommunityPostsIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'post_community_created_idx'
+    queryset = Post.objects.filter(is_published=True, community_id=1).order_by('-created_at')[:20]
+
+
+class ChatMessagesIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'message_chat_created_idx'
+    queryset = Message.objects.filter(chat_id=1).order_by('created_at')[:50]
+
+
+class FriendshipsByUserIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'friendship_user_status_idx'
+    ordered_by_index = False
+    queryset = Friendship.objects.filter(user_id=1, status='accepted')
+
+
+class FriendshipsByFriendIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'friendship_friend_status_idx'
+    ordered_by_index = False
+    queryset = Friendship.objects.filter(friend_id=1, status='pending')
+
+
+class CommunityMembersIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'usercommunity_joined_idx'
+    queryset = UserCommunity.objects.filter(community_id=1).order_by('-joined_at')[:20]
+
+
+class TopLevelCommentsIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'comment_post_parent_idx'
+    queryset = Comment.objects.filter(post_id=1, parent__isnull=True).order_by('-created_at')[:20]
+
+
+class InactiveUsersIndexTests(IndexUsageMixin, TestCase):
+    index_name = 'user_inactive_last_seen_idx'
+    ordered_by_index = False
+    # Запрос cleanup_inactive_users
+    queryset = User.objects.filter(
+        is_active=True, is_staff=False, last_seen__lt=timezone.now() - timedelta(days=365)
+    )
+
+
+REPLICA = 'replica_1'
+
+# Реплика — зеркало тестовой БД (TEST MIRROR, как в settings.py при
+# DB_REPLICAS). Подключение регистрируется при импорте: тестовый раннер
+# настраивает зеркала и проверяет databases до setUpClass
+if REPLICA not in connections:
+    connections.settings[REPLICA] = connections.configure_settings({
+        **settings.DATABASES,
+        REPLICA: {**settings.DATABASES[DEFAULT_DB_ALIAS], 'TEST': {'MIRROR': DEFAULT_DB_ALIAS}},
+    })[REPLICA]
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    PrimaryReplicaRouter и ReplicaPinMiddleware на двух подключениях SQLite:
+    по перехваченным запросам видно, на какое подключение ушло чтение.
+    """
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        cls._replica_settings = override_settings(
+            DATABASES={**settings.DATABASES, REPLICA: connections[REPLICA].settings_dict},
+            DATABASE_ROUTERS=['core.routers.PrimaryReplicaRouter'],
+        )
+        cls._replica_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._replica_settings.disable()
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@example.com', password='x')
+        self.post = Post.objects.create(author=self.user, content='Пост')
+
+    def _request(self, client, method, url):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(client, method)(url)
+        return response, primary, replica
+
+    @staticmethod
+    def _reads(queries, table):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and f'"{table}"' in query['sql']]
+
+    def test_safe_read_goes_to_replica(self):
+        response, primary, replica = self._request(APIClient(), 'get', f'/api/posts/{self.post.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self._reads(replica, 'core_post'))
+        self.assertFalse(self._reads(primary, 'core_post'))
+        self.assertNotIn(routers.PIN_COOKIE_NAME, response.cookies)
+
+    def test_unsafe_method_reads_primary(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response, primary, replica = self._request(client, 'put', f'/api/posts/{self.post.pk}/like/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self._reads(primary, 'core_post'))
+        self.assertFalse(self._reads(replica, 'core_post'))
+        self.assertIn(routers.PIN_COOKIE_NAME, response.cookies)
+
+    def test_pin_cookie_reads_primary(self):
+        client = APIClient()
+        client.cookies[routers.PIN_COOKIE_NAME] = '1'
+        response, primary, replica = self._request(client, 'get', f'/api/posts/{self.post.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self._reads(primary, 'core_post'))
+        self.assertFalse(replica.captured_queries)
+
+    def test_write_pins_rest_of_request(self):
+        router = routers.PrimaryReplicaRouter()
+        token = routers.start_request(False)
+        try:
+            self.assertEqual(router.db_for_read(Post), REPLICA)
+            self.assertEqual(router.db_for_write(Post), DEFAULT_DB_ALIAS)
+            self.assertEqual(router.db_for_read(Post), DEFAULT_DB_ALIAS)
+        finally:
+            self.assertTrue(routers.finish_request(token))
+
+    def test_post_view_counter_does_not_pin_request(self):
+        # Страница поста увеличивает счётчик просмотров до чтения комментариев
+        Comment.objects.create(post=self.post, author=self.user, content='Комментарий')
+        response, primary, replica = self._request(APIClient(), 'get', f'/posts/{self.post.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('"views_count"' in query['sql'] for query in primary))
+        self.assertTrue(self._reads(replica, 'core_comment'))
+        self.assertFalse(self._reads(primary, 'core_comment'))
+        self.assertNotIn(routers.PIN_COOKIE_NAME, response.cookies)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 1)
+
+    def test_replica_of_other_vendor_is_unavailable(self):
+        replica = connections[REPLICA]
+        test_settings = replica.settings_dict['TEST']
+        replica.settings_dict['TEST'] = {**test_settings, 'MIRROR': None}
+        try:
+            self.assertIsNone(routers._measure_lag(REPLICA))
+        finally:
+            replica.settings_dict['TEST'] = test_settings
+
+    @override_settings(PRESENCE_HEARTBEAT_INTERVAL=0, PRESENCE_FLUSH_INTERVAL=0)
+    def test_presence_flush_does_not_pin_request(self):
+        client = APIClient()
+        client.force_login(self.user)
+        response, primary, _ = self._request(client, 'get', '/api/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(query['sql'].startswith('UPDATE "core_user"') for query in primary))
+        self.assertNotIn(routers.PIN_COOKIE_NAME, response.cookies)
+        presence.forget(self.user.pk)
+
+
+class ServeMediaHeaderTests(TestCase):
+    """Заголовки передачи файла веб-серверу для имён не из ASCII."""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root.name))
+        self.name = 'avatars/фото 1.jpg'
+        os.makedirs(os.path.join(self.media_root.name, 'avatars'))
+        with open(os.path.join(self.media_root.name, self.name), 'wb') as f:
+            f.write(b'jpeg')
+        self.url = '/media/avatars/%D1%84%D0%BE%D1%82%D0%BE%201.jpg'
+
+    def _write(self, name, content=b'jpeg'):
+        os.makedirs(os.path.dirname(os.path.join(self.media_root.name, name)), exist_ok=True)
+        with open(os.path.join(self.media_root.name, name), 'wb') as f:
+            f.write(content)
+
+    def test_weak_etag_from_mtime_and_size(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        stat = os.stat(os.path.join(self.media_root.name, self.name))
+        self.assertEqual(response['ETag'], f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # Слабый ETag не подходит для If-Range: файл отдаётся целиком
+        ranged = self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(ranged.status_code, 200)
+
+    def test_blob_has_strong_etag_from_content_hash(self):
+        digest = 'ab' * 32
+        self._write(f'blobs/ab/ab/{digest}.jpg')
+        response = self.client.get(f'/media/blobs/ab/ab/{digest}.jpg')
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('immutable', response['Cache-Control'])
+        ranged = self.client.get(
+            f'/media/blobs/ab/ab/{digest}.jpg', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=response['ETag']
+        )
+        self.assertEqual(ranged.status_code, 206)
+
+    def test_blob_tmp_files_are_not_immutable(self):
+        self._write('blobs/tmp/upload123')
+        response = self.client.get('/media/blobs/tmp/upload123')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='nginx')
+    def test_accel_redirect_is_percent_encoded(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media' + self.url[len('/media'):])
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='apache')
+    def test_sendfile_falls_back_for_non_latin1_path(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Таблицы FTS5 есть только в SQLite')
+class SqliteSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='searcher@example.com', password='x')
+        self.post = Post.objects.create(author=self.user, content='Триграммный поиск')
+
+    def _search(self, term):
+        return list(Post.objects.filter(pk__in=search.matching_ids(Post, ['content'], term, 'default')))
+
+    def test_matches_through_fts_table(self):
+        self.assertTrue(search.sqlite_trigram_supported(connection))
+        self.assertEqual(self._search('ммный'), [self.post])
+
+    def test_falls_back_without_fts_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {search.fts_table("core_post")} RENAME TO core_post_fts_saved')
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self._search('ммный'), [self.post])
+            self.assertFalse([query for query in queries if 'MATCH' in query['sql']])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE core_post_fts_saved RENAME TO {search.fts_table("core_post")}')
+
+
+class HistoryUpstreamVersionTests(SimpleTestCase):
+    def test_create_historical_record_copy_matches_installed_version(self):
+        # BufferedHistoricalRecords копирует код библиотеки: при обновлении
+        # django-simple-history копию нужно сверить и поднять UPSTREAM_VERSION
+        self.assertEqual(simple_history.__version__, history.UPSTREAM_VERSION)
+
+
+@override_settings(HISTORY_BUFFERED=True, HISTORY_BUFFER_SIZE=500)
+class BufferedHistoryTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(email='buffered@example.com', password='x')
+            self.post = Post.objects.create(author=self.user, content='Первая версия')
+        history.flush()
+
+    def test_records_are_written_by_one_bulk_create_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(3):
+                self.post.content = f'Версия {number}'
+                self.post.save()
+            self.assertEqual(self.post.history.count(), 1)
+        table = Post.history.model._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(history.flush(), 3)
+        inserts = [query['sql'] for query in queries if query['sql'].startswith(f'INSERT INTO "{table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.post.history.count(), 4)
+        self.assertEqual(self.post.history.latest('history_id').history_delta['content'], ['Версия 1', 'Версия 2'])
+
+    def test_rollback_discards_records(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.post.content = 'Откаченная версия'
+                    self.post.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(history.flush(), 0)
+        self.assertEqual(self.post.history.count(), 1)
+
+    def test_untracked_fields_save_creates_no_record(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.views_count = 5
+            self.post.save(update_fields=['views_count'])
+        self.assertEqual(history.flush(), 0)
+        self.assertEqual(self.post.history.count(), 1)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['core.auth_backends.CachedModelBackend'],
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class CachedUserSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='snapshot@example.com', password='old-password')
+
+    def test_password_change_invalidates_snapshot(self):
+        self.client.force_login(self.user, backend='core.auth_backends.CachedModelBackend')
+        self.assertEqual(self.client.get('/friends/').status_code, 200)
+        old_hash = auth_backends.load_user(self.user.pk).password
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-password')
+            self.user.save()
+
+        self.assertNotEqual(auth_backends.load_user(self.user.pk).password, old_hash)
+        # Хэш сессии больше не совпадает: сессия до смены пароля недействительна
+        self.assertEqual(self.client.get('/friends/').status_code, 302)
+
+
+class MediaProcessingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root.name))
+        self.user = User.objects.create_user(email='uploader@example.com', password='x')
+
+    def _process(self, image, name):
+        buffer = BytesIO()
+        image.save(buffer, 'PNG')
+        media = Media.objects.create(owner=self.user, original_name=name, file=ContentFile(buffer.getvalue(), name=name))
+        self.assertEqual(media_processing.process_media(media.pk), 'ready')
+        media.refresh_from_db()
+        with media.file.open('rb') as f, Image.open(f) as processed:
+            return processed.convert('RGBA')
+
+    def test_palette_image_keeps_colors(self):
+        image = Image.new('RGB', (8, 8), (255, 0, 0)).convert('P', palette=Image.Palette.ADAPTIVE)
+        self.assertEqual(self._process(image, 'red.png').getpixel((0, 0)), (255, 0, 0, 255))
+
+    def test_palette_image_with_transparency_keeps_colors(self):
+        image = Image.new('P', (8, 8), 1)
+        image.putpalette([0, 0, 255, 255, 0, 0])
+        image.info['transparency'] = 0
+        image.paste(0, (0, 0, 4, 4))
+        processed = self._process(image, 'transparent.png')
+        self.assertEqual(processed.getpixel((0, 0)), (0, 0, 255, 0))
+        self.assertEqual(processed.getpixel((7, 7)), (255, 0, 0, 255))
+
+
+class HistoryMaintenanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='historian@example.com', password='x')
+        self.post = Post.objects.create(author=self.user, content='Первая версия')
+        self.post.content = 'Вторая версия'
+        self.post.save()
+        # Сохранение без изменений отслеживаемых полей: избыточная запись
+        self.post.save()
+        self.post.views_count = 10
+        self.post.save()
+        self.records = list(self.post.history.order_by('history_date', 'history_id'))
+
+    def _age(self, records, days):
+        # Порядок записей сохраняется: каждая следующая на час новее
+        for hours, record in enumerate(records):
+            Post.history.model.objects.filter(history_id=record.history_id).update(
+                history_date=timezone.now() - timedelta(days=days) + timedelta(hours=hours)
+            )
+
+    def test_expired_records_keep_latest_record_of_object(self):
+        single = Post.objects.create(author=self.user, content='Одна версия')
+        self._age(self.records, 400)
+        self._age(single.history.all(), 400)
+        expired = history_maintenance.expired_records(Post, 365)
+        latest = self.post.history.order_by('-history_date', '-history_id').first()
+        self.assertEqual(
+            set(expired.values_list('history_id', flat=True)),
+            {record.history_id for record in self.records} - {latest.history_id},
+        )
+        self.assertFalse(expired.filter(id=single.pk).exists())
+
+    def test_expired_records_ignore_recent_records(self):
+        self.assertFalse(history_maintenance.expired_records(Post, 365).exists())
+
+    def test_redundant_records_differ_only_in_untracked_fields(self):
+        self.assertEqual([record.history_type for record in self.records], ['+', '~', '~', '~'])
+        self.assertEqual(
+            history_maintenance.redundant_record_ids(Post),
+            [self.records[2].history_id, self.records[3].history_id],
+        )
+
+    def test_compact_deletes_redundant_records(self):
+        self.assertEqual(history_maintenance.compact(Post, chunk_size=1), 2)
+        self.assertEqual(
+            list(self.post.history.order_by('history_id').values_list('content', flat=True)),
+            ['Первая версия', 'Вторая версия'],
+        )
+        self.assertEqual(history_maintenance.redundant_record_ids(Post), [])
+
+    def test_compact_recomputes_delta_of_following_record(self):
+        self.post.content = 'Третья версия'
+        self.post.save()
+        history_maintenance.compact(Post)
+        kept, follower = self.post.history.order_by('history_id')[1:]
+        fields = history.delta_fields(Post.history.model)
+        self.assertEqual(follower.history_delta, history.diff_records(fields, kept, follower))
+        self.assertEqual(follower.history_delta['content'], ['Вторая версия', 'Третья версия'])
+
+
+class HistoryAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='x', first_name='Админ', last_name='Сайта')
+        self.client.force_login(self.admin)
+        self.user = User.objects.create_user(email='mover@example.com', password='x', first_name='Иван', last_name='Петров')
+
+    def test_delta_values_are_displayed(self):
+        city = City.objects.create(name='Казань')
+        self.user.city = city
+        self.user.gender = 'F'
+        self.user.save()
+        response = self.client.get(reverse('admin:core_user_history', args=[self.user.pk]))
+        self.assertContains(response, 'Казань, Россия')
+        self.assertContains(response, 'Женский')
+
+    def test_unknown_delta_fields_are_skipped(self):
+        self.user.history.update(history_delta={'removed_field': ['a', 'b'], 'phone': [None, '123']})
+        response = self.client.get(reverse('admin:core_user_history', args=[self.user.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '123')
+
+
+class SharedCacheWarningTests(SimpleTestCase):
+    def test_warns_with_process_local_cache(self):
+        with self.assertLogs('core.model_cache', 'WARNING'):
+            self.assertFalse(model_cache.warn_if_not_shared('test'))
+
+    def test_file_cache_is_shared(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'core.cache.CountingFileBasedCache', 'LOCATION': location},
+        }):
+            with self.assertNoLogs('core.model_cache', 'WARNING'):
+                self.assertTrue(model_cache.warn_if_not_shared('test'))
+            self.assertEqual(checks.check_presence_cache(None), [])
+
+    def test_presence_requires_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_presence_cache(None)], ['core.E001'])
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=self.media_root.name,
+            UPLOAD_SESSIONS_DIR=os.path.join(self.media_root.name, 'upload_sessions'),
+        ))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(email='uploader@example.com', password='x'))
+
+    def _start(self):
+        return self.client.post(
+            '/api/uploads/', {'type': 'document', 'original_name': 'notes.txt', 'total_size': 4}, format='json'
+        )
+
+    def test_active_session_limit(self):
+        for _ in range(settings.UPLOAD_MAX_ACTIVE_SESSIONS):
+            self.assertEqual(self._start().status_code, 201)
+        self.assertEqual(self._start().status_code, 429)
+        self.assertEqual(UploadSession.objects.count(), settings.UPLOAD_MAX_ACTIVE_SESSIONS)
+
+    def test_repeated_finalize_returns_same_media(self):
+        url = f'/api/uploads/{self._start().json()["id"]}/'
+        response = self.client.put(
+            f'{url}chunk/', b'data', content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-3/4'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        first = self.client.post(f'{url}finalize/')
+        self.assertEqual(first.status_code, 201)
+        second = self.client.post(f'{url}finalize/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(Media.objects.count(), 1)
@@ -0,0 +1,184 @@
+"""
+Возобновляемая загрузка больших файлов частями (API /api/uploads/).
+
+Клиент создаёт сессию загрузки, затем отправляет диапазоны байтов
+запросами PUT с заголовком Content-Range и финализирует загрузку. Каждая
+часть читается из тела запроса потоком и дописывается во временный файл,
+не накапливаясь в памяти. После обрыва соединения клиент узнаёт
+``received_size`` и продолжает с этого места.
+
+Запись части идёт под исключительной блокировкой временного файла
+(fcntl.flock): received_size перечитывается из БД уже после захвата
+блокировки и обновляется до её снятия, поэтому два параллельных запроса
+с одним диапазоном не пишут в файл одновременно — второй получает 409.
+
+Сессия, в которую UPLOAD_SESSION_TTL секунд не приходило частей,
+считается брошенной: expire_sessions() прерывает её и удаляет временный
+файл. Брошенные сессии пользователя прерываются при создании новой, а
+остальные — командой ``manage.py cleanup_upload_sessions``.
+"""
+import fcntl
+import hashlib
+import os
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import UploadSession, upload_session_expiry
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_upload_dir():
+    return getattr(settings, 'UPLOAD_SESSIONS_DIR', settings.BASE_DIR / 'upload_sessions')
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024)
+
+
+def temp_path(session):
+    return os.path.join(get_upload_dir(), f'{session.pk}.part')
+
+
+def parse_content_range(header, total_size):
+    """Разбирает 'bytes start-end/total' и возвращает (start, end) включительно."""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Заголовок Content-Range должен иметь вид "bytes start-end/total"')
+    start, end, total = (int(value) for value in match.groups())
+    if total != total_size or start > end or end >= total_size:
+        raise UploadError('Диапазон выходит за пределы файла', status_code=416)
+    if end - start + 1 > get_max_chunk_size():
+        raise UploadError('Слишком большая часть файла', status_code=413)
+    return start, end
+
+
+@contextmanager
+def _locked(path, mode):
+    """Открывает файл с исключительной блокировкой; занятый файл — UploadError 409."""
+    with open(path, mode) as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Часть файла уже загружается другим запросом', status_code=409)
+        yield f
+
+
+def append_chunk(session, stream, start, end, expected_sha256=None):
+    """
+    Дописывает часть [start, end] из stream во временный файл сессии и
+    возвращает новый received_size. При несовпадении контрольной суммы
+    файл обрезается обратно до start.
+    """
+    if stream is None:
+        raise UploadError('Тело запроса пустое')
+
+    path = temp_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    length = end - start + 1
+    digest = hashlib.sha256()
+
+    with _locked(path, 'ab') as f:
+        # Пока файл заблокирован, received_size меняет только этот запрос
+        received_size = (
+            UploadSession.objects.filter(pk=session.pk, status='active')
+            .values_list('received_size', flat=True).first()
+        )
+        if received_size is None:
+            raise UploadError('Загрузка уже завершена', status_code=409)
+        session.received_size = received_size
+        if start != received_size:
+            raise UploadError(f'Ожидалась часть с позиции {received_size}', status_code=409)
+
+        # После сбоя во временном файле могли остаться лишние байты
+        f.truncate(start)
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            f.write(data)
+            remaining -= len(data)
+        f.flush()
+
+        if remaining:
+            f.truncate(start)
+            raise UploadError('Тело запроса короче указанного диапазона')
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            f.truncate(start)
+            raise UploadError('Контрольная сумма части не совпадает')
+
+        session.received_size = end + 1
+        UploadSession.objects.filter(pk=session.pk, status='active').update(
+            received_size=session.received_size,
+            updated_at=timezone.now(),
+            expires_at=upload_session_expiry(),
+        )
+
+    return session.received_size
+
+
+def open_completed_file(session):
+    return File(open(temp_path(session), 'rb'), name=session.original_name)
+
+
+def _remove(path):
+    try:
+        # Дожидаемся записи, которая уже идёт в этот файл
+        with open(path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard(session):
+    _remove(temp_path(session))
+
+
+def expire_sessions(owner=None):
+    """Прерывает просроченные активные сессии и удаляет их файлы; возвращает их число."""
+    now = timezone.now()
+    expired = UploadSession.objects.filter(status='active', expires_at__lt=now)
+    if owner is not None:
+        expired = expired.filter(owner=owner)
+    ids = list(expired.values_list('pk', flat=True))
+    if not ids:
+        return 0
+    UploadSession.objects.filter(pk__in=ids, status='active').update(status='aborted', updated_at=now)
+    for pk in ids:
+        _remove(os.path.join(get_upload_dir(), f'{pk}.part'))
+    return len(ids)
+
+
+def remove_orphan_files(min_age):
+    """
+    Удаляет временные файлы без активной сессии, не менявшиеся min_age
+    секунд (остатки после сбоев). Возвращает (число файлов, байт).
+    """
+    upload_dir = get_upload_dir()
+    if not os.path.isdir(upload_dir):
+        return 0, 0
+    active = {str(pk) for pk in UploadSession.objects.filter(status='active').values_list('pk', flat=True)}
+    cutoff = timezone.now().timestamp() - min_age
+    removed = freed = 0
+    for entry in os.scandir(upload_dir):
+        stem, ext = os.path.splitext(entry.name)
+        if ext != '.part' or stem in active or entry.stat().st_mtime > cutoff:
+            continue
+        freed += entry.stat().st_size
+        _remove(entry.path)
+        removed += 1
+    return removed, freed
@@ -41,4 +41,7 @@ urlpatterns = [
     path('communities/<int:community_id>/', views.community_detail, name='community_detail'),
     path('communities/<int:community_id>/join/', views.join_community, name='join_community'),
     path('communities/<int:community_id>/leave/', views.leave_community, name='leave_community'),
+
+    # Debug
+    path('debug/profiling/', views.profiling_reports, name='profiling_reports'),
 ]
@@ -1,13 +1,27 @@
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
 from django.db.models import Q
 from django.core.paginator import Paginator
-from .models import Post, User, Community, Friendship, Like, Comment, Chat, ChatParticipant, Message, Media, UserCommunity
+from .models import Post, User, Community, Friendship, Comment, Chat, ChatParticipant, Message, UserCommunity
 from .forms import PostForm, UserRegistrationForm, UserLoginForm
+from . import attachments, db_stats, feed, likes, media_serving, memberships, model_cache, presence, profiling, routers
+from .cache import get_stats as get_cache_stats
+from .comments import load_thread
+from .counters import adjust_counter
 
 
 def index(request):
@@ -15,35 +29,30 @@ def index(request):
         if request.method == 'POST' and 'quick_post' in request.POST:
             content = request.POST.get('content', '').strip()
             if content:
-                post = Post.objects.create(
-                    author=request.user,
-                    content=content,
-                    is_published=True,
-                    created_by=request.user
-                )
                 images = request.FILES.getlist('images')
-                for image in images:
-                    Media.objects.create(
-                        owner=request.user,
-                        type='image',
-                        file=image,
-                        original_name=image.name,
-                        size=image.size,
-                        post=post,
+                with attachments.stored_uploads(request.user, images) as stored, transaction.atomic():
+                    post = Post.objects.create(
+                        author=request.user,
+                        content=content,
+                        is_published=True,
                         created_by=request.user
                     )
+                    stored.attach(post=post)
                 messages.success(request, 'Пост опубликован!')
                 return redirect('core:index')
 
-    posts_list = Post.objects.filter(is_published=True).select_related('author').prefetch_related('media_files', 'likes', 'comments').order_by('-created_at')
+    # Лайки и комментарии считаются только при промахе кэша карточки
+    posts_list = Post.objects.filter(is_published=True).select_related('author').prefetch_related('media_files').order_by('-created_at')
 
     # Пагинация
     paginator = Paginator(posts_list, 10)  # 10 постов на страницу
     page_number = request.GET.get('page')
     latest_posts = paginator.get_page(page_number)
+    feed.prepare_post_cards(latest_posts, request.user)
 
     context = {
         'latest_posts': latest_posts,
+        'card_cache_timeout': feed.get_fragment_timeout(),
     }
     return render(request, 'core/index.html', context)
 
@@ -57,13 +66,29 @@ def post_list(request):
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    post.views_count += 1
-    post.save()
-    comments = post.comments.filter(parent__isnull=True).select_related('author').prefetch_related('replies__author')
+    post = model_cache.get_post(post_id)
+    post.author = model_cache.get_user(post.author_id)
+    if post.community_id:
+        post.community = model_cache.get_community(post.community_id)
+
+    root = None
+    thread_id = request.GET.get('thread')
+    if thread_id:
+        if not thread_id.isdigit():
+            raise Http404
+        root = get_object_or_404(Comment, pk=thread_id, post=post)
+    after = request.GET.get('after')
+
+    # Подгрузка комментариев не считается новым просмотром
+    if root is None and not after:
+        # Без save(): иначе каждый просмотр сбрасывал бы пост из кэша.
+        # Просмотр не закрепляет читателя за основной БД
+        with routers.unpinned():
+            post.views_count = adjust_counter(Post, post.pk, 'views_count', 1)
+
     context = {
         'post': post,
-        'comments': comments,
+        'thread': load_thread(post, root=root, after=after),
     }
     return render(request, 'core/post_detail.html', context)
 
@@ -82,8 +107,11 @@ def get_user_friends(user):
 
 
 def user_profile(request, user_id):
-    profile_user = get_object_or_404(User, pk=user_id)
-    user_posts = Post.objects.filter(author=profile_user, is_published=True).select_related('author').prefetch_related('media_files', 'likes', 'comments').order_by('-created_at')
+    profile_user = model_cache.get_user(user_id)
+    user_posts = feed.with_counts(
+        Post.objects.filter(author=profile_user, is_published=True).select_related('author').prefetch_related('media_files').order_by('-created_at')
+    )
+    liked_post_ids = feed.liked_post_ids(request.user, [post.id for post in user_posts])
 
     friends = get_user_friends(profile_user)
     friends_count = friends.count()
@@ -111,6 +139,7 @@ def user_profile(request, user_id):
     context = {
         'profile_user': profile_user,
         'user_posts': user_posts,
+        'liked_post_ids': liked_post_ids,
         'friends': friends[:6],
         'friends_count': friends_count,
         'communities_count': communities_count,
@@ -122,9 +151,9 @@ def user_profile(request, user_id):
 
 @login_required
 def edit_profile(request):
+    # request.user содержит только часть полей (core/auth_backends.py)
+    user = User.objects.get(pk=request.user.pk)
     if request.method == 'POST':
-        user = request.user
-
         # Обновление аватара
         if 'avatar' in request.FILES:
             user.avatar = request.FILES['avatar']
@@ -149,7 +178,7 @@ def edit_profile(request):
         messages.success(request, 'Профиль успешно обновлен!')
         return redirect('core:user_profile', user_id=user.id)
 
-    return render(request, 'core/edit_profile.html')
+    return render(request, 'core/edit_profile.html', {'user': user})
 
 
 def community_list(request):
@@ -161,8 +190,11 @@ def community_list(request):
 
 
 def community_detail(request, community_id):
-    community = get_object_or_404(Community, pk=community_id)
-    community_posts = Post.objects.filter(community=community, is_published=True).select_related('author').prefetch_related('media_files', 'likes', 'comments').order_by('-created_at')
+    community = model_cache.get_community(community_id)
+    community_posts = feed.with_counts(
+        Post.objects.filter(community=community, is_published=True).select_related('author').prefetch_related('media_files').order_by('-created_at')
+    )
+    liked_post_ids = feed.liked_post_ids(request.user, [post.id for post in community_posts])
 
     is_member = False
     user_role = None
@@ -172,11 +204,12 @@ def community_detail(request, community_id):
             is_member = True
             user_role = membership.role
 
-    members = UserCommunity.objects.filter(community=community).select_related('user')[:10]
+    members = memberships.top_members(community)
 
     context = {
         'community': community,
         'community_posts': community_posts,
+        'liked_post_ids': liked_post_ids,
         'is_member': is_member,
         'user_role': user_role,
         'members': members,
@@ -192,15 +225,9 @@ def join_community(request, community_id):
         messages.error(request, 'Это закрытое сообщество')
         return redirect('core:community_detail', community_id=community_id)
 
-    membership, created = UserCommunity.objects.get_or_create(
-        user=request.user,
-        community=community,
-        defaults={'created_by': request.user}
-    )
+    created, _ = memberships.join(request.user, community)
 
     if created:
-        community.members_count += 1
-        community.save(update_fields=['members_count'])
         messages.success(request, f'Вы вступили в сообщество "{community.name}"')
     else:
         messages.info(request, 'Вы уже состоите в этом сообществе')
@@ -216,11 +243,8 @@ def leave_community(request, community_id):
         messages.error(request, 'Владелец не может покинуть сообщество')
         return redirect('core:community_detail', community_id=community_id)
 
-    membership = UserCommunity.objects.filter(user=request.user, community=community).first()
-    if membership:
-        membership.delete()
-        community.members_count = max(0, community.members_count - 1)
-        community.save(update_fields=['members_count'])
+    left, _ = memberships.leave(request.user, community)
+    if left:
         messages.success(request, f'Вы покинули сообщество "{community.name}"')
     else:
         messages.info(request, 'Вы не состоите в этом сообществе')
@@ -236,22 +260,13 @@ def post_create(request):
     if request.method == 'POST':
         form = PostForm(request.POST, request.FILES)
         if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-            post.created_by = request.user
-            post.save()
-
             images = request.FILES.getlist('images')
-            for image in images:
-                Media.objects.create(
-                    owner=request.user,
-                    type='image',
-                    file=image,
-                    original_name=image.name,
-                    size=image.size,
-                    post=post,
-                    created_by=request.user
-                )
+            with attachments.stored_uploads(request.user, images) as stored, transaction.atomic():
+                post = form.save(commit=False)
+                post.author = request.user
+                post.created_by = request.user
+                post.save()
+                stored.attach(post=post)
 
             messages.success(request, 'Публикация успешно создана!')
             return redirect('core:post_detail', post_id=post.id)
@@ -275,21 +290,12 @@ def post_edit(request, post_id):
     if request.method == 'POST':
         form = PostForm(request.POST, request.FILES, instance=post)
         if form.is_valid():
-            post = form.save(commit=False)
-            post.updated_by = request.user
-            post.save()
-
             images = request.FILES.getlist('images')
-            for image in images:
-                Media.objects.create(
-                    owner=request.user,
-                    type='image',
-                    file=image,
-                    original_name=image.name,
-                    size=image.size,
-                    post=post,
-                    created_by=request.user
-                )
+            with attachments.stored_uploads(request.user, images) as stored, transaction.atomic():
+                post = form.save(commit=False)
+                post.updated_by = request.user
+                post.save()
+                stored.attach(post=post)
 
             messages.success(request, 'Публикация успешно обновлена!')
             return redirect('core:post_detail', post_id=post.id)
@@ -367,6 +373,8 @@ def user_login(request):
 
 
 def user_logout(request):
+    if request.user.is_authenticated:
+        presence.forget(request.user.pk)
     logout(request)
     messages.info(request, 'Вы вышли из системы.')
     return redirect('core:index')
@@ -396,6 +404,8 @@ def friends_list(request):
             Q(email__icontains=search_query)
         ).exclude(id=request.user.id)[:20]
 
+    online_ids = presence.online_user_ids(friend_ids)
+
     context = {
         'tab': tab,
         'friends': friends,
@@ -407,6 +417,7 @@ def friends_list(request):
         'search_results': search_results,
         'friend_ids': friend_ids,
         'pending_sent_ids': pending_sent_ids,
+        'online_ids': online_ids,
     }
     return render(request, 'core/friends_list.html', context)
 
@@ -475,17 +486,10 @@ def remove_friend(request, user_id):
 @login_required
 def toggle_like(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    like = Like.objects.filter(user=request.user, post=post).first()
-
-    if like:
-        like.delete()
-        liked = False
-    else:
-        Like.objects.create(user=request.user, post=post)
-        liked = True
+    liked, count = likes.toggle(request.user, post)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return JsonResponse({'liked': liked, 'count': post.likes.count()})
+        return JsonResponse({'liked': liked, 'count': count})
 
     return redirect('core:index')
 
@@ -527,7 +531,7 @@ def chats_list(request):
 
 @login_required
 def chat_detail(request, chat_id):
-    chat = get_object_or_404(Chat, pk=chat_id)
+    chat = model_cache.get_chat(chat_id)
     if not ChatParticipant.objects.filter(chat=chat, user=request.user).exists():
         messages.error(request, 'У вас нет доступа к этому чату')
         return redirect('core:chats_list')
@@ -537,32 +541,25 @@ def chat_detail(request, chat_id):
         images = request.FILES.getlist('images')
 
         if content or images:
-            message = Message.objects.create(
-                chat=chat,
-                sender=request.user,
-                content=content,
-                created_by=request.user
-            )
-
-            for image in images:
-                Media.objects.create(
-                    owner=request.user,
-                    type='image',
-                    file=image,
-                    original_name=image.name,
-                    size=image.size,
-                    message=message,
+            with attachments.stored_uploads(request.user, images) as stored, transaction.atomic():
+                message = Message.objects.create(
+                    chat=chat,
+                    sender=request.user,
+                    content=content,
                     created_by=request.user
                 )
-
-            chat.save()
+                stored.attach(message=message)
+                chat.save(update_fields=['updated_at'])
             return redirect('core:chat_detail', chat_id=chat_id)
 
     messages_list = chat.messages.select_related('sender').prefetch_related('media_files').order_by('created_at')
+    participants = list(chat.participants.select_related('user'))
 
     context = {
         'chat': chat,
         'messages': messages_list,
+        'participants': participants,
+        'online_ids': presence.online_user_ids(p.user_id for p in participants),
     }
     return render(request, 'core/chat_detail.html', context)
 
@@ -624,3 +621,86 @@ def create_group_chat(request):
         'friends': friends,
     }
     return render(request, 'core/create_group_chat.html', context)
+
+
+@staff_member_required
+def profiling_reports(request):
+    report_id = request.GET.get('id')
+    if report_id:
+        report = profiling.get_report(int(report_id)) if report_id.isdigit() else None
+        if report is None:
+            return JsonResponse({'error': 'Отчет не найден'}, status=404)
+        return JsonResponse(report)
+
+    reports = [
+        {key: value for key, value in report.items() if key != 'queries'}
+        for report in reversed(profiling.get_reports())
+    ]
+    return JsonResponse({
+        'reports': reports,
+        'cache': get_cache_stats(),
+        'database': db_stats.get_stats(),
+    })
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    etag = media_serving.get_etag(path, stat)
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': (
+            media_serving.IMMUTABLE_CACHE_CONTROL if media_serving.is_immutable(path)
+            else 'public, max-age=3600'
+        ),
+    }
+    if not media_serving.is_blob(path):
+        # mtime blob-файла меняется при повторной загрузке того же содержимого
+        headers['Last-Modified'] = http_date(stat.st_mtime)
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or media_serving.etag_matches(etag, if_none_match)):
+        return HttpResponse(status=304, headers=headers)
+
+    content_type = media_serving.get_content_type(path)
+    backend = media_serving.get_sendfile_backend()
+    if backend == 'nginx':
+        # Range и отдачу выполняет nginx (internal location)
+        headers['X-Accel-Redirect'] = quote(media_serving.get_accel_redirect_prefix() + path)
+        return HttpResponse(content_type=content_type, headers=headers)
+    if backend == 'apache' and media_serving.is_latin1(full_path):
+        # mod_xsendfile принимает путь как есть; остальные файлы отдаёт FileResponse
+        headers['X-Sendfile'] = full_path
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # If-Range сравнивается строго: слабый ETag не подходит (RFC 9110)
+    if range_header and (not if_range or (not etag.startswith('W/') and if_range.strip() == etag)):
+        try:
+            byte_range = media_serving.parse_range(range_header, stat.st_size)
+        except ValueError:
+            headers['Content-Range'] = f'bytes */{stat.st_size}'
+            return HttpResponse(status=416, headers=headers)
+
+    f = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type, headers=headers)
+        response['Content-Length'] = stat.st_size
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(media_serving.RangeFile(f, start, length), status=206, content_type=content_type, headers=headers)
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return response
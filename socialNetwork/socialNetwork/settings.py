@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,13 +54,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.PresenceMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'core.middleware.HistoryFlushMiddleware',
 ]
 
 ROOT_URLCONF = 'socialNetwork.urls'
@@ -89,16 +94,56 @@ WSGI_APPLICATION = 'socialNetwork.wsgi.application'
 # Конфигурация базы данных
 DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.sqlite3')
 
+# Профиль SQLite для нескольких воркеров (SQLITE_TUNED=True): журнал WAL —
+# читатели не ждут писателя; synchronous=NORMAL — fsync только при
+# контрольной точке WAL; mmap и кэш страниц; транзакции сразу берут
+# блокировку на запись (BEGIN IMMEDIATE), поэтому конкурирующий писатель
+# ждёт до SQLITE_TIMEOUT секунд, а не получает "database is locked" при
+# повышении блокировки посреди транзакции.
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', 'False') == 'True'
+SQLITE_TUNED_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 ** 2))};"
+        f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))};"
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': int(os.getenv('SQLITE_TIMEOUT', 20)),
+}
+
 if DB_ENGINE == 'django.db.backends.sqlite3':
     # SQLite для локальной разработки
     DATABASES = {
         'default': {
             'ENGINE': DB_ENGINE,
             'NAME': BASE_DIR / os.getenv('DB_NAME', 'db.sqlite3'),
+            'OPTIONS': dict(SQLITE_TUNED_OPTIONS) if SQLITE_TUNED else {},
+            # Тестовая БД в файле: в общей БД в памяти параллельные потоки
+            # получают «database table is locked», не дожидаясь блокировки
+            'TEST': {'NAME': BASE_DIR / os.getenv('DB_TEST_NAME', 'test_db.sqlite3')},
         }
     }
 else:
-    # PostgreSQL для Docker или продакшена
+    # PostgreSQL для Docker или продакшена.
+    # По умолчанию подключение живёт DB_CONN_MAX_AGE секунд и проверяется
+    # перед повторным использованием. При DB_POOL=True каждый воркер держит
+    # пул подключений psycopg 3 (постоянные подключения с пулом несовместимы,
+    # поэтому CONN_MAX_AGE = 0): DB_POOL_TIMEOUT — сколько секунд ждать
+    # свободного подключения, DB_POOL_MAX_IDLE — через сколько секунд
+    # простоя закрывать подключения сверх минимума.
+    DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+    DB_OPTIONS = {
+        'client_encoding': 'UTF8',
+    }
+    if DB_POOL:
+        DB_OPTIONS['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+        }
     DATABASES = {
         'default': {
             'ENGINE': DB_ENGINE,
@@ -107,12 +152,45 @@ else:
             'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
             'HOST': os.getenv('DB_HOST', 'localhost'),
             'PORT': os.getenv('DB_PORT', '5432'),
-            'OPTIONS': {
-                'client_encoding': 'UTF8',
-            },
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': DB_OPTIONS,
         }
     }
 
+# Реплики только для чтения (core/routers.py), только PostgreSQL.
+# DB_REPLICAS — адреса host или host:port через запятую (учётные данные —
+# DB_REPLICA_USER и DB_REPLICA_PASSWORD, по умолчанию как у основной БД).
+# Реплики получают имена replica_1, replica_2, ...
+DB_REPLICAS = [name.strip() for name in os.getenv('DB_REPLICAS', '').split(',') if name.strip()]
+if DB_REPLICAS and DB_ENGINE == 'django.db.backends.sqlite3':
+    # Файл SQLite не получает записей основной БД
+    raise ImproperlyConfigured('DB_REPLICAS поддерживаются только для PostgreSQL')
+for index, replica in enumerate(DB_REPLICAS, start=1):
+    replica_settings = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        # В тестах реплика — та же база, что и основная
+        'TEST': {'MIRROR': 'default'},
+    }
+    host, _, port = replica.partition(':')
+    replica_settings.update({
+        'HOST': host,
+        'PORT': port or replica_settings['PORT'],
+        'USER': os.getenv('DB_REPLICA_USER', replica_settings['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', replica_settings['PASSWORD']),
+    })
+    DATABASES[f'replica_{index}'] = replica_settings
+
+if DB_REPLICAS:
+    DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи читать из основной БД, допустимое отставание
+# реплики и как часто его проверять, секунды
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 10))
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -155,6 +233,34 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Отдача медиафайлов: None (Django/sendfile), 'nginx' (X-Accel-Redirect) или 'apache' (X-Sendfile)
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Хранение медиафайлов по хешу содержимого (core/storage.py)
+MEDIA_CONTENT_ADDRESSED = os.getenv('MEDIA_CONTENT_ADDRESSED', 'True') == 'True'
+
+# Загрузка больших файлов частями (core/uploads.py)
+UPLOAD_SESSIONS_DIR = BASE_DIR / 'upload_sessions'
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 2 * 1024 ** 3))
+UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_MAX_ACTIVE_SESSIONS = 3
+# Через сколько секунд без новых частей сессия прерывается (manage.py cleanup_upload_sessions)
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+# Количество потоков для параллельной записи вложений (core/attachments.py)
+ATTACHMENT_UPLOAD_WORKERS = 4
+
+# Обработка медиафайлов (manage.py run_media_workers)
+MEDIA_VARIANT_WIDTHS = (320, 640, 1280)
+MEDIA_THUMBNAIL_SIZE = (200, 200)
+# Ширина, под которую выбирается вариант изображения в ленте и чатах
+MEDIA_DISPLAY_WIDTH = 640
+# Через сколько секунд файл, взятый упавшим воркером, снова попадает в очередь,
+# и после скольких попыток обработка считается неудачной
+MEDIA_PROCESSING_TIMEOUT = int(os.getenv('MEDIA_PROCESSING_TIMEOUT', 15 * 60))
+MEDIA_PROCESSING_MAX_ATTEMPTS = 3
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -162,6 +268,116 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# Буферизованная запись истории изменений (core/history.py)
+HISTORY_BUFFERED = os.getenv('HISTORY_BUFFERED', 'False') == 'True'
+HISTORY_BUFFER_SIZE = int(os.getenv('HISTORY_BUFFER_SIZE', 500))
+# Длина значения в сохранённой разнице полей (history_delta)
+HISTORY_DELTA_MAX_CHARS = int(os.getenv('HISTORY_DELTA_MAX_CHARS', 200))
+
+# Срок хранения истории изменений в днях (manage.py prune_history)
+HISTORY_RETENTION_DAYS = {
+    'core.User': int(os.getenv('HISTORY_RETENTION_USER_DAYS', 730)),
+    'core.Community': int(os.getenv('HISTORY_RETENTION_COMMUNITY_DAYS', 730)),
+    'core.Post': int(os.getenv('HISTORY_RETENTION_POST_DAYS', 365)),
+}
+
+# Профилирование SQL и шаблонов (core/profiling.py)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_HEADER = 'X-Profile'
+PROFILING_BUFFER_SIZE = 100
+PROFILING_N_PLUS_ONE_THRESHOLD = 5
+
+# Присутствие пользователей (core/presence.py), значения в секундах
+PRESENCE_TTL = int(os.getenv('PRESENCE_TTL', 300))
+PRESENCE_HEARTBEAT_INTERVAL = int(os.getenv('PRESENCE_HEARTBEAT_INTERVAL', 30))
+PRESENCE_FLUSH_INTERVAL = int(os.getenv('PRESENCE_FLUSH_INTERVAL', 60))
+
+# Кэши. CACHE_BACKEND: locmem (по умолчанию), file или redis.
+# locmem работает в пределах одного процесса: при нескольких воркерах
+# gunicorn фрагменты, версии счётчиков и объекты моделей у каждого свои.
+# file и redis общие для всех процессов; redis подходит и для совместимых
+# серверов (Valkey, KeyDB) и требует пакет redis.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': 'core.cache.CountingLocMemCache',
+    'file': 'core.cache.CountingFileBasedCache',
+    'redis': 'core.cache.CountingRedisCache',
+}
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f'Неизвестный CACHE_BACKEND: {CACHE_BACKEND}')
+
+
+def cache_location(name):
+    if CACHE_BACKEND == 'file':
+        return str(Path(os.getenv('CACHE_DIR', BASE_DIR / 'cache')) / name)
+    if CACHE_BACKEND == 'redis':
+        return os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/0')
+    return name
+
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': cache_location('default'),
+        'STATS_NAME': 'default',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20000)),
+        } if CACHE_BACKEND != 'redis' else {},
+    },
+    # Фрагменты шаблонов; при переполнении вытесняются давно не читавшиеся
+    'fragments': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': cache_location('fragments'),
+        'STATS_NAME': 'fragments',
+        'KEY_PREFIX': 'fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 5000)),
+            'CULL_FREQUENCY': 4,
+        } if CACHE_BACKEND != 'redis' else {},
+    },
+}
+
+# Время жизни объектов моделей в кэше (core/model_cache.py), секунды
+MODEL_CACHE_TIMEOUT = int(os.getenv('MODEL_CACHE_TIMEOUT', 300))
+
+# Кэш общий для всех процессов. Только тогда пользователя запроса и сессии
+# можно читать из кэша: в locmem выход, смена пароля или снятие прав,
+# сделанные в одном воркере, не видны остальным до истечения записи.
+CACHE_SHARED = CACHE_BACKEND in ('file', 'redis')
+
+if CACHE_SHARED:
+    # Пользователь запроса берётся из кэша (core/auth_backends.py). ModelBackend
+    # оставлен для сессий, созданных до его появления: в сессии записан путь
+    # бэкенда, и без него такие пользователи оказались бы разлогинены.
+    AUTHENTICATION_BACKENDS = [
+        'core.auth_backends.CachedModelBackend',
+        'django.contrib.auth.backends.ModelBackend',
+    ]
+    # Сессии читаются из кэша, при промахе — из БД; запись идёт в оба
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# Начиная с этого числа строк админка показывает оценку размера таблицы
+# по статистике СУБД вместо точного COUNT(*) (core/admin_mixins.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100_000))
+
+# Максимум пользователей в одном запросе массового добавления/удаления участников
+COMMUNITY_BULK_MEMBERS_LIMIT = 1000
+
+# Участники на странице сообщества (кэшируются на указанное число секунд)
+COMMUNITY_TOP_MEMBERS_SIZE = 10
+COMMUNITY_TOP_MEMBERS_TIMEOUT = 300
+
+# Ветки комментариев (core/comments.py): комментариев на страницу и уровней вложенности
+COMMENTS_PAGE_SIZE = 100
+COMMENTS_DISPLAY_DEPTH = 5
+
+# Время жизни кэшированной карточки поста в ленте, секунды (core/feed.py)
+POST_CARD_CACHE_TIMEOUT = int(os.getenv('POST_CARD_CACHE_TIMEOUT', 600))
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,